@@ -0,0 +1,52 @@
+"""Org unit closure table
+
+Revision ID: 004_org_unit_closure
+Revises: 003_fix_catalogs_profile
+Create Date: 2025-03-01
+
+Índice de ancestrais da hierarquia organizacional:
+- org_unit_closure: uma linha por par (ancestral, descendente), depth 0 = a própria unidade
+- Backfill a partir de org_units.parent_id com CTE recursiva
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "004_org_unit_closure"
+down_revision: Union[str, None] = "003_fix_catalogs_profile"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "org_unit_closure",
+        sa.Column("ancestor_id", sa.UUID(), nullable=False),
+        sa.Column("descendant_id", sa.UUID(), nullable=False),
+        sa.Column("depth", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["ancestor_id"], ["org_units.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["descendant_id"], ["org_units.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("ancestor_id", "descendant_id"),
+    )
+    # PK cobre "descendentes de X"; este índice cobre "ancestrais de X"
+    op.create_index("ix_org_unit_closure_descendant", "org_unit_closure", ["descendant_id", "depth"])
+    
+    # Backfill das unidades existentes
+    op.execute("""
+        INSERT INTO org_unit_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE tree AS (
+            SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+            FROM org_units
+            UNION ALL
+            SELECT tree.ancestor_id, child.id, tree.depth + 1
+            FROM tree
+            JOIN org_units child ON child.parent_id = tree.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM tree
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_org_unit_closure_descendant", table_name="org_unit_closure")
+    op.drop_table("org_unit_closure")
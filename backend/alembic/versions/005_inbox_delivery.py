@@ -0,0 +1,106 @@
+"""Inbox delivery progress
+
+Revision ID: 005_inbox_delivery
+Revises: 004_org_unit_closure
+Create Date: 2025-03-08
+
+Fan-out do inbox em background:
+- inbox_messages, inbox_recipients e user_permissions nunca entraram nas
+  migrations (foram criadas fora do Alembic); são criadas aqui se não existirem
+- inbox_messages ganha delivery_status, recipient_count e delivered_count
+- Backfill das contagens das mensagens já distribuídas
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "005_inbox_delivery"
+down_revision: Union[str, None] = "004_org_unit_closure"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _delivery_columns() -> list[sa.Column]:
+    return [
+        sa.Column(
+            "delivery_status",
+            sa.Enum("PENDING", "SENDING", "SENT", "FAILED", name="inbox_delivery_status", create_constraint=False, native_enum=False),
+            nullable=False,
+            server_default="SENT",
+        ),
+        sa.Column("recipient_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("delivered_count", sa.Integer(), nullable=False, server_default="0"),
+    ]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table("user_permissions"):
+        op.create_table(
+            "user_permissions",
+            sa.Column("id", sa.UUID(), nullable=False, server_default=sa.text("gen_random_uuid()")),
+            sa.Column("user_id", sa.UUID(), nullable=False),
+            sa.Column("permission_code", sa.Text(), nullable=False),
+            sa.Column("granted_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+            sa.Column("granted_by_user_id", sa.UUID(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["granted_by_user_id"], ["users.id"], ondelete="SET NULL"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("user_id", "permission_code", name="uq_user_permission"),
+        )
+
+    if not inspector.has_table("inbox_messages"):
+        op.create_table(
+            "inbox_messages",
+            sa.Column("id", sa.UUID(), nullable=False, server_default=sa.text("gen_random_uuid()")),
+            sa.Column("title", sa.Text(), nullable=False),
+            sa.Column("message", sa.Text(), nullable=False),
+            sa.Column("type", sa.Enum("INFO", "WARNING", "SUCCESS", "URGENT", name="inbox_message_type", create_constraint=False, native_enum=False), nullable=False),
+            sa.Column("attachments", postgresql.JSONB(), nullable=True),
+            sa.Column("filters", postgresql.JSONB(), nullable=True),
+            sa.Column("created_by_user_id", sa.UUID(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+            sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+            *_delivery_columns(),
+            sa.ForeignKeyConstraint(["created_by_user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    else:
+        for column in _delivery_columns():
+            op.add_column("inbox_messages", column)
+
+    if not inspector.has_table("inbox_recipients"):
+        op.create_table(
+            "inbox_recipients",
+            sa.Column("id", sa.UUID(), nullable=False, server_default=sa.text("gen_random_uuid()")),
+            sa.Column("message_id", sa.UUID(), nullable=False),
+            sa.Column("user_id", sa.UUID(), nullable=False),
+            sa.Column("read", sa.Boolean(), nullable=False, server_default="false"),
+            sa.Column("read_at", sa.DateTime(timezone=True), nullable=True),
+            sa.ForeignKeyConstraint(["message_id"], ["inbox_messages.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("message_id", "user_id", name="uq_inbox_recipient"),
+        )
+        op.create_index("ix_inbox_recipient_user_read", "inbox_recipients", ["user_id", "read"])
+
+    # Mensagens antigas já foram distribuídas de forma síncrona
+    op.execute("""
+        UPDATE inbox_messages m
+        SET recipient_count = c.total, delivered_count = c.total
+        FROM (
+            SELECT message_id, count(*) AS total
+            FROM inbox_recipients
+            GROUP BY message_id
+        ) c
+        WHERE c.message_id = m.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column("inbox_messages", "delivered_count")
+    op.drop_column("inbox_messages", "recipient_count")
+    op.drop_column("inbox_messages", "delivery_status")
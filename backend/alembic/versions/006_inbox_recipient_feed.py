@@ -0,0 +1,50 @@
+"""Inbox recipient feed index
+
+Revision ID: 006_inbox_recipient_feed
+Revises: 005_inbox_delivery
+Create Date: 2025-03-15
+
+Paginação do inbox por cursor:
+- inbox_recipients ganha created_at e expires_at (cópia da mensagem)
+- ix_inbox_recipient_user_read vira ix_inbox_recipient_user_feed, na ordem
+  da listagem (user_id, read, created_at DESC, id DESC), cobrindo expires_at
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "006_inbox_recipient_feed"
+down_revision: Union[str, None] = "005_inbox_delivery"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("inbox_recipients", sa.Column("created_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("inbox_recipients", sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True))
+
+    op.execute("""
+        UPDATE inbox_recipients r
+        SET created_at = m.created_at, expires_at = m.expires_at
+        FROM inbox_messages m
+        WHERE m.id = r.message_id
+    """)
+
+    op.alter_column("inbox_recipients", "created_at", nullable=False, server_default=sa.text("now()"))
+    op.alter_column("inbox_recipients", "expires_at", nullable=False)
+
+    op.drop_index("ix_inbox_recipient_user_read", table_name="inbox_recipients")
+    op.create_index(
+        "ix_inbox_recipient_user_feed",
+        "inbox_recipients",
+        ["user_id", "read", sa.text("created_at DESC"), sa.text("id DESC")],
+        postgresql_include=["expires_at", "message_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inbox_recipient_user_feed", table_name="inbox_recipients")
+    op.create_index("ix_inbox_recipient_user_read", "inbox_recipients", ["user_id", "read"])
+    op.drop_column("inbox_recipients", "expires_at")
+    op.drop_column("inbox_recipients", "created_at")
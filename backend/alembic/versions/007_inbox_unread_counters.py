@@ -0,0 +1,41 @@
+"""Inbox unread counters
+
+Revision ID: 007_inbox_unread_counters
+Revises: 006_inbox_recipient_feed
+Create Date: 2025-03-22
+
+Contador de não lidas por usuário (badge do app):
+- inbox_unread_counters: uma linha por usuário com destinatários
+- Backfill a partir de inbox_recipients (não lidas, ainda não expurgadas)
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "007_inbox_unread_counters"
+down_revision: Union[str, None] = "006_inbox_recipient_feed"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "inbox_unread_counters",
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("unread_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("now()")),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+
+    op.execute("""
+        INSERT INTO inbox_unread_counters (user_id, unread_count)
+        SELECT user_id, count(*) FILTER (WHERE NOT read)
+        FROM inbox_recipients
+        GROUP BY user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("inbox_unread_counters")
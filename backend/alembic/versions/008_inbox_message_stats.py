@@ -0,0 +1,69 @@
+"""Inbox message stats
+
+Revision ID: 008_inbox_message_stats
+Revises: 007_inbox_unread_counters
+Create Date: 2025-03-29
+
+Estatísticas de avisos enviados sem varrer inbox_recipients:
+- inbox_message_stats: destinatários, leituras, primeira/última leitura
+- inbox_message_read_buckets: leituras por hora (curva de leitura)
+- ix_inbox_messages_sender_created para a listagem de enviados
+- Backfill a partir de inbox_recipients
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "008_inbox_message_stats"
+down_revision: Union[str, None] = "007_inbox_unread_counters"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "inbox_message_stats",
+        sa.Column("message_id", sa.UUID(), nullable=False),
+        sa.Column("recipient_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("read_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("first_read_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_read_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["message_id"], ["inbox_messages.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("message_id"),
+    )
+    op.create_table(
+        "inbox_message_read_buckets",
+        sa.Column("message_id", sa.UUID(), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("read_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.ForeignKeyConstraint(["message_id"], ["inbox_messages.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("message_id", "bucket_start"),
+    )
+    op.create_index(
+        "ix_inbox_messages_sender_created",
+        "inbox_messages",
+        ["created_by_user_id", sa.text("created_at DESC"), sa.text("id DESC")],
+    )
+
+    # Backfill
+    op.execute("""
+        INSERT INTO inbox_message_stats (message_id, recipient_count, read_count, first_read_at, last_read_at)
+        SELECT m.id, count(r.id), count(r.id) FILTER (WHERE r.read), min(r.read_at), max(r.read_at)
+        FROM inbox_messages m
+        LEFT JOIN inbox_recipients r ON r.message_id = m.id
+        GROUP BY m.id
+    """)
+    op.execute("""
+        INSERT INTO inbox_message_read_buckets (message_id, bucket_start, read_count)
+        SELECT message_id, date_trunc('hour', read_at), count(*)
+        FROM inbox_recipients
+        WHERE read AND read_at IS NOT NULL
+        GROUP BY message_id, date_trunc('hour', read_at)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inbox_messages_sender_created", table_name="inbox_messages")
+    op.drop_table("inbox_message_read_buckets")
+    op.drop_table("inbox_message_stats")
@@ -0,0 +1,25 @@
+"""Inbox expiry index
+
+Revision ID: 009_inbox_expiry_index
+Revises: 008_inbox_message_stats
+Create Date: 2025-04-05
+
+Expurgo em lotes: mensagens expiradas encontradas por índice; os
+destinatários delas saem pelo índice de uq_inbox_recipient (message_id, ...).
+"""
+
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "009_inbox_expiry_index"
+down_revision: Union[str, None] = "008_inbox_message_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_inbox_messages_expires_at", "inbox_messages", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inbox_messages_expires_at", table_name="inbox_messages")
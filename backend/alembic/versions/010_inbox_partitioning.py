@@ -0,0 +1,159 @@
+"""Inbox partitioning
+
+Revision ID: 010_inbox_partitioning
+Revises: 009_inbox_expiry_index
+Create Date: 2025-04-12
+
+inbox_messages e inbox_recipients particionadas por mês de criação:
+- PARTITION BY RANGE (created_at); a chave de partição entra na PK e em
+  uq_inbox_recipient, e a FK dos destinatários passa a ser (message_id, created_at)
+- Partições mensais do mês da mensagem mais antiga até 3 meses à frente
+  (depois mantidas por ensure_inbox_partitions)
+- Estatísticas perdem a FK para inbox_messages (limpas junto com as partições)
+- Tabelas recriadas com LIKE (preserva os tipos existentes) e dados copiados
+"""
+
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "010_inbox_partitioning"
+down_revision: Union[str, None] = "009_inbox_expiry_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+STATS_TABLES = ("inbox_message_stats", "inbox_message_read_buckets")
+
+
+def _create_indexes() -> None:
+    op.execute("""
+        CREATE INDEX ix_inbox_messages_sender_created
+        ON inbox_messages (created_by_user_id, created_at DESC, id DESC)
+    """)
+    op.execute("CREATE INDEX ix_inbox_messages_expires_at ON inbox_messages (expires_at)")
+    op.execute("""
+        CREATE INDEX ix_inbox_recipient_user_feed
+        ON inbox_recipients (user_id, read, created_at DESC, id DESC)
+        INCLUDE (expires_at, message_id)
+    """)
+
+
+def _drop_indexes() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_inbox_messages_sender_created")
+    op.execute("DROP INDEX IF EXISTS ix_inbox_messages_expires_at")
+    op.execute("DROP INDEX IF EXISTS ix_inbox_recipient_user_feed")
+
+
+def _detach(suffix: str) -> None:
+    """Renomeia as tabelas atuais e libera os nomes de constraints e índices."""
+    for table in STATS_TABLES:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_message_id_fkey")
+    _drop_indexes()
+    op.execute("ALTER TABLE inbox_recipients DROP CONSTRAINT IF EXISTS uq_inbox_recipient")
+    op.execute("ALTER TABLE inbox_recipients DROP CONSTRAINT IF EXISTS inbox_recipients_pkey")
+    op.execute("ALTER TABLE inbox_messages DROP CONSTRAINT IF EXISTS inbox_messages_pkey CASCADE")
+    op.execute(f"ALTER TABLE inbox_recipients RENAME TO inbox_recipients_{suffix}")
+    op.execute(f"ALTER TABLE inbox_messages RENAME TO inbox_messages_{suffix}")
+
+
+def upgrade() -> None:
+    op.execute("UPDATE inbox_messages SET created_at = now() WHERE created_at IS NULL")
+    _detach("old")
+
+    for table in ("inbox_messages", "inbox_recipients"):
+        op.execute(f"""
+            CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (created_at)
+        """)
+    op.execute("ALTER TABLE inbox_messages ALTER COLUMN created_at SET NOT NULL")
+
+    # Meses em UTC, mesmo nome/limites de ensure_inbox_partitions
+    op.execute("""
+        DO $$
+        DECLARE
+            month timestamp;
+            tbl text;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', coalesce(
+                        (SELECT min(created_at) FROM inbox_messages_old), now()
+                    ) AT TIME ZONE 'UTC'),
+                    date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+                    interval '1 month'
+                )
+            LOOP
+                FOREACH tbl IN ARRAY ARRAY['inbox_messages', 'inbox_recipients'] LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                        tbl || '_p' || to_char(month, 'YYYY_MM'),
+                        tbl,
+                        to_char(month, 'YYYY-MM-DD') || ' 00:00:00+00',
+                        to_char(month + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+                    );
+                END LOOP;
+            END LOOP;
+        END $$
+    """)
+
+    op.execute("INSERT INTO inbox_messages SELECT * FROM inbox_messages_old")
+    op.execute("INSERT INTO inbox_recipients SELECT * FROM inbox_recipients_old")
+
+    op.execute("ALTER TABLE inbox_messages ADD PRIMARY KEY (id, created_at)")
+    op.execute("""
+        ALTER TABLE inbox_messages ADD FOREIGN KEY (created_by_user_id)
+        REFERENCES users (id) ON DELETE CASCADE
+    """)
+    op.execute("ALTER TABLE inbox_recipients ADD PRIMARY KEY (id, created_at)")
+    op.execute("""
+        ALTER TABLE inbox_recipients
+        ADD CONSTRAINT uq_inbox_recipient UNIQUE (message_id, user_id, created_at)
+    """)
+    op.execute("""
+        ALTER TABLE inbox_recipients ADD FOREIGN KEY (message_id, created_at)
+        REFERENCES inbox_messages (id, created_at) ON DELETE CASCADE
+    """)
+    op.execute("""
+        ALTER TABLE inbox_recipients ADD FOREIGN KEY (user_id)
+        REFERENCES users (id) ON DELETE CASCADE
+    """)
+    _create_indexes()
+
+    op.execute("DROP TABLE inbox_recipients_old")
+    op.execute("DROP TABLE inbox_messages_old")
+
+
+def downgrade() -> None:
+    _detach("part")
+
+    for table in ("inbox_messages", "inbox_recipients"):
+        op.execute(f"CREATE TABLE {table} (LIKE {table}_part INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_part")
+
+    op.execute("ALTER TABLE inbox_messages ADD PRIMARY KEY (id)")
+    op.execute("""
+        ALTER TABLE inbox_messages ADD FOREIGN KEY (created_by_user_id)
+        REFERENCES users (id) ON DELETE CASCADE
+    """)
+    op.execute("ALTER TABLE inbox_recipients ADD PRIMARY KEY (id)")
+    op.execute("ALTER TABLE inbox_recipients ADD CONSTRAINT uq_inbox_recipient UNIQUE (message_id, user_id)")
+    op.execute("""
+        ALTER TABLE inbox_recipients ADD FOREIGN KEY (message_id)
+        REFERENCES inbox_messages (id) ON DELETE CASCADE
+    """)
+    op.execute("""
+        ALTER TABLE inbox_recipients ADD FOREIGN KEY (user_id)
+        REFERENCES users (id) ON DELETE CASCADE
+    """)
+    _create_indexes()
+
+    # Partições vão junto com a tabela pai
+    op.execute("DROP TABLE inbox_recipients_part")
+    op.execute("DROP TABLE inbox_messages_part")
+
+    for table in STATS_TABLES:
+        op.execute(f"DELETE FROM {table} s WHERE NOT EXISTS (SELECT 1 FROM inbox_messages m WHERE m.id = s.message_id)")
+        op.execute(f"""
+            ALTER TABLE {table} ADD CONSTRAINT {table}_message_id_fkey FOREIGN KEY (message_id)
+            REFERENCES inbox_messages (id) ON DELETE CASCADE
+        """)
@@ -0,0 +1,55 @@
+"""Inbox broadcasts
+
+Revision ID: 011_inbox_broadcasts
+Revises: 010_inbox_partitioning
+Create Date: 2025-04-19
+
+Enviar para todos sem fan-out (fan-out na leitura):
+- inbox_messages.is_broadcast + índice parcial dos broadcasts por data
+- inbox_recipients.dismissed_at (avisos dispensados pelo usuário)
+- ix_inbox_recipient_user_feed passa a incluir dismissed_at (index-only scan)
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "011_inbox_broadcasts"
+down_revision: Union[str, None] = "010_inbox_partitioning"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _recreate_feed_index(include: list[str]) -> None:
+    op.drop_index("ix_inbox_recipient_user_feed", table_name="inbox_recipients")
+    op.create_index(
+        "ix_inbox_recipient_user_feed",
+        "inbox_recipients",
+        ["user_id", "read", sa.text("created_at DESC"), sa.text("id DESC")],
+        postgresql_include=include,
+    )
+
+
+def upgrade() -> None:
+    op.add_column(
+        "inbox_messages",
+        sa.Column("is_broadcast", sa.Boolean(), nullable=False, server_default="false"),
+    )
+    op.create_index(
+        "ix_inbox_messages_broadcast",
+        "inbox_messages",
+        [sa.text("created_at DESC")],
+        postgresql_where=sa.text("is_broadcast"),
+    )
+    op.add_column(
+        "inbox_recipients",
+        sa.Column("dismissed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    _recreate_feed_index(["expires_at", "message_id", "dismissed_at"])
+
+
+def downgrade() -> None:
+    _recreate_feed_index(["expires_at", "message_id"])
+    op.drop_column("inbox_recipients", "dismissed_at")
+    op.drop_index("ix_inbox_messages_broadcast", table_name="inbox_messages")
+    op.drop_column("inbox_messages", "is_broadcast")
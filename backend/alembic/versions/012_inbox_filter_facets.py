@@ -0,0 +1,52 @@
+"""Inbox filter facets
+
+Revision ID: 012_inbox_filter_facets
+Revises: 011_inbox_broadcasts
+Create Date: 2025-04-26
+
+Opções de filtro do envio com contagem, sem DISTINCT em user_profiles:
+- inbox_filter_facets: (campo, valor) -> usuários ativos
+- Backfill a partir de user_profiles
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "012_inbox_filter_facets"
+down_revision: Union[str, None] = "011_inbox_broadcasts"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+FACET_COLUMNS = {
+    "vocational_reality": "vocational_reality_item_id",
+    "life_state": "life_state_item_id",
+    "marital_status": "marital_status_item_id",
+    "state": "state",
+    "city": "city",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "inbox_filter_facets",
+        sa.Column("field", sa.String(32), nullable=False),
+        sa.Column("value", sa.Text(), nullable=False),
+        sa.Column("user_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("field", "value"),
+    )
+
+    for field, column in FACET_COLUMNS.items():
+        op.execute(f"""
+            INSERT INTO inbox_filter_facets (field, value, user_count)
+            SELECT '{field}', p.{column}::text, count(*)
+            FROM user_profiles p
+            JOIN users u ON u.id = p.user_id AND u.is_active
+            WHERE p.{column} IS NOT NULL
+            GROUP BY p.{column}
+        """)
+
+
+def downgrade() -> None:
+    op.drop_table("inbox_filter_facets")
@@ -0,0 +1,39 @@
+"""Inbox read bitmaps
+
+Revision ID: 013_inbox_read_bitmaps
+Revises: 012_inbox_filter_facets
+Create Date: 2025-05-03
+
+Leituras de broadcasts em bitmap, sem linha por leitor em inbox_recipients:
+- users.inbox_seq: posição densa (identity) do usuário nos bitmaps
+- inbox_read_bitmaps: (message_id, chunk) -> 8192 bits de leitura
+- Linhas de estado já gravadas (lidas antes desta versão) continuam valendo
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "013_inbox_read_bitmaps"
+down_revision: Union[str, None] = "012_inbox_filter_facets"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Identity preenche os usuários existentes
+    op.execute("ALTER TABLE users ADD COLUMN inbox_seq integer GENERATED BY DEFAULT AS IDENTITY")
+    op.create_unique_constraint("users_inbox_seq_key", "users", ["inbox_seq"])
+    op.create_table(
+        "inbox_read_bitmaps",
+        sa.Column("message_id", sa.UUID(), nullable=False),
+        sa.Column("chunk", sa.Integer(), nullable=False),
+        sa.Column("bits", sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint("message_id", "chunk"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("inbox_read_bitmaps")
+    op.drop_constraint("users_inbox_seq_key", "users", type_="unique")
+    op.drop_column("users", "inbox_seq")
@@ -0,0 +1,35 @@
+"""Inbox scheduled delivery
+
+Revision ID: 014_inbox_scheduled_delivery
+Revises: 013_inbox_read_bitmaps
+Create Date: 2025-05-10
+
+Envio agendado e fan-out com limite de vazão:
+- inbox_messages.delivery_rate: destinatários por segundo (NULL = sem limite)
+- ix_inbox_messages_pending: mensagens PENDING por created_at (horário do
+  envio), varridas pelo despachante
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "014_inbox_scheduled_delivery"
+down_revision: Union[str, None] = "013_inbox_read_bitmaps"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("inbox_messages", sa.Column("delivery_rate", sa.Integer(), nullable=True))
+    op.create_index(
+        "ix_inbox_messages_pending",
+        "inbox_messages",
+        ["created_at"],
+        postgresql_where=sa.text("delivery_status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inbox_messages_pending", table_name="inbox_messages")
+    op.drop_column("inbox_messages", "delivery_rate")
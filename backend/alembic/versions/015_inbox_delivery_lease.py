@@ -0,0 +1,39 @@
+"""Inbox delivery lease
+
+Revision ID: 015_inbox_delivery_lease
+Revises: 014_inbox_scheduled_delivery
+Create Date: 2025-05-17
+
+Fan-out interrompido sem shutdown limpo (crash, OOM, SIGKILL) ficava em
+SENDING para sempre:
+- inbox_messages.delivery_heartbeat_at: renovado a cada faixa do fan-out
+- ix_inbox_messages_sending: mensagens SENDING por heartbeat, varridas pelo
+  despachante para retomar as de lease vencido
+"""
+
+from typing import Sequence, Union
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "015_inbox_delivery_lease"
+down_revision: Union[str, None] = "014_inbox_scheduled_delivery"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "inbox_messages",
+        sa.Column("delivery_heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(
+        "ix_inbox_messages_sending",
+        "inbox_messages",
+        ["delivery_heartbeat_at"],
+        postgresql_where=sa.text("delivery_status = 'SENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inbox_messages_sending", table_name="inbox_messages")
+    op.drop_column("inbox_messages", "delivery_heartbeat_at")
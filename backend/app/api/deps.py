@@ -1,28 +1,25 @@
-from typing import Annotated, Generator
+from typing import Annotated
 
 from fastapi import Depends, Header, HTTPException, Request, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth.firebase import FirebaseAuth, TokenPayload
+from app.auth.firebase import FirebaseAuth, FirebaseKeyManager, TokenPayload
 from app.db.models import User, UserIdentity
-from app.db.session import SessionLocal
+from app.db.session import get_db
+from app.services.segment_index import segment_index
 from app.settings import settings
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
+DBSession = Annotated[AsyncSession, Depends(get_db)]
 
-DBSession = Annotated[Session, Depends(get_db)]
 
+firebase_key_manager = FirebaseKeyManager(cache_path=settings.firebase_certs_cache_path or None)
 
 firebase_auth = FirebaseAuth(
     project_id=settings.firebase_project_id,
     dev_mode=(settings.auth_mode == "DEV"),
+    key_manager=firebase_key_manager,
 )
 
 
@@ -46,40 +43,42 @@ async def get_current_user(
     token = authorization[7:]
 
     try:
-        payload = firebase_auth.verify_token(token)
+        payload = await firebase_auth.verify_token(token)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "unauthorized", "message": str(e)},
         )
 
-    user = provision_user(db, payload, request)
+    user = await provision_user(db, payload, request)
     return user
 
 
-def provision_user(db: Session, payload: TokenPayload, request: Request) -> User:
+async def provision_user(db: AsyncSession, payload: TokenPayload, request: Request) -> User:
     from app.audit.service import create_audit_log
 
-    identity = (
-        db.query(UserIdentity)
-        .filter(
-            UserIdentity.provider == "firebase",
-            UserIdentity.provider_uid == payload.uid,
+    existing = (
+        await db.execute(
+            select(User)
+            .join(UserIdentity, UserIdentity.user_id == User.id)
+            .where(
+                UserIdentity.provider == "firebase",
+                UserIdentity.provider_uid == payload.uid,
+            )
         )
-        .first()
-    )
+    ).scalar_one_or_none()
 
-    if identity:
-        if identity.user and not identity.user.is_active:
+    if existing:
+        if not existing.is_active:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail={"error": "forbidden", "message": "User account is deactivated"},
             )
-        return identity.user  # type: ignore[return-value]
+        return existing
 
     user = User(is_active=True)
     db.add(user)
-    db.flush()
+    await db.flush()
 
     identity = UserIdentity(
         user_id=user.id,
@@ -100,8 +99,9 @@ def provision_user(db: Session, payload: TokenPayload, request: Request) -> User
         metadata={"provider": "firebase", "email": payload.email},
     )
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    segment_index.add_user(user.id)
 
     return user
 
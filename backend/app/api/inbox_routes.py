@@ -4,22 +4,36 @@ Inbox Routes
 Rotas para o sistema de avisos/inbox.
 """
 
+import hashlib
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
 from app.db.models import User
-from app.api.routes.auth import get_current_user
-from app.services.inbox_service import InboxService, PERMISSION_SEND_INBOX
+from app.api.routes.auth import get_current_principal, get_current_user
+from app.api.routes.organization import etag_matches
+from app.services.inbox_service import (
+    InboxService,
+    PERMISSION_SEND_INBOX,
+    get_filter_options_snapshot,
+    read_receipts,
+    start_inbox_delivery,
+)
+from app.services.principal import Principal
 from app.schemas.inbox import (
     InboxSendRequest,
     InboxPreviewRequest,
+    InboxMarkReadRequest,
     InboxListResponse,
+    InboxUnreadCountResponse,
     InboxMessageResponse,
+    InboxMessageBodyResponse,
     InboxPreviewResponse,
     InboxSendResponse,
+    InboxDeliveryStatusResponse,
+    InboxMessageStatsResponse,
     InboxFiltersOptionsResponse,
     UserPermissionsResponse,
 )
@@ -30,50 +44,111 @@ router = APIRouter(prefix="/inbox", tags=["inbox"])
 # === ROTAS DO USUÁRIO ===
 
 @router.get("", response_model=InboxListResponse)
-def get_inbox(
+async def get_inbox(
     include_read: bool = True,
-    limit: int = 50,
-    offset: int = 0,
-    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = Query(None, description="next_cursor da página anterior"),
+    offset: int = Query(0, ge=0, deprecated=True, description="Use cursor; aceito por uma versão"),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Lista mensagens do inbox do usuário."""
+    """
+    Lista mensagens do inbox do usuário (paginação por cursor).
+    Só cabeçalhos e prévia; o conteúdo sai em /inbox/messages/{message_id}.
+    """
     service = InboxService(db)
-    messages, total, unread_count = service.get_user_inbox(
-        user_id=current_user.id,
-        include_read=include_read,
-        limit=limit,
-        offset=offset,
-    )
+    try:
+        messages, total, unread_count, next_cursor = await service.get_user_inbox(
+            user_id=current_user.id,
+            include_read=include_read,
+            limit=limit,
+            cursor=cursor,
+            offset=offset,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
     
     return InboxListResponse(
         messages=[InboxMessageResponse(**m) for m in messages],
         total=total,
         unread_count=unread_count,
+        next_cursor=next_cursor,
     )
 
 
 @router.get("/unread")
-def get_unread_messages(
+async def get_unread_messages(
     limit: int = 10,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Lista apenas mensagens não lidas."""
     service = InboxService(db)
-    messages = service.get_unread_messages(current_user.id, limit=limit)
+    messages = await service.get_unread_messages(current_user.id, limit=limit)
     return messages
 
 
+@router.get("/unread-count", response_model=InboxUnreadCountResponse)
+async def get_unread_count(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Quantidade de não lidas (contador mantido, sem varrer mensagens)."""
+    service = InboxService(db)
+    return InboxUnreadCountResponse(unread_count=await service.get_unread_count(current_user.id))
+
+
+@router.get("/messages/{message_id}", response_model=InboxMessageBodyResponse)
+async def get_message_body(
+    message_id: UUID,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Conteúdo completo e anexos de um aviso do inbox.
+    
+    O conteúdo não muda depois do envio: o cliente pode guardá-lo sem
+    revalidar (immutable); If-None-Match com o ETag responde 304. Aviso
+    personalizado muda com o perfil e é sempre revalidado.
+    """
+    service = InboxService(db)
+    message = await service.get_message_body(current_user.id, message_id)
+    
+    if message is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Mensagem não encontrada",
+        )
+    
+    personalized = message.pop("personalized")
+    body = InboxMessageBodyResponse(**message).model_dump_json().encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    # private: a resposta depende de quem está autenticado
+    cache_control = "private, no-cache" if personalized else "private, max-age=31536000, immutable"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.patch("/{recipient_id}/read")
-def mark_as_read(
+async def mark_as_read(
     recipient_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Marca uma mensagem como lida."""
+    # Com o buffer ativo a gravação é agrupada; não há como saber se já estava lida
+    if read_receipts.is_running and read_receipts.add(current_user.id, recipient_id):
+        return {"success": True, "queued": True}
+    
     service = InboxService(db)
-    success = service.mark_as_read(current_user.id, recipient_id)
+    success = await service.mark_as_read(current_user.id, recipient_id)
     
     if not success:
         raise HTTPException(
@@ -84,26 +159,53 @@ def mark_as_read(
     return {"success": True}
 
 
+@router.post("/read")
+async def mark_many_as_read(
+    request: InboxMarkReadRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Marca vários avisos como lidos de uma vez."""
+    service = InboxService(db)
+    count = await service.mark_many_as_read(current_user.id, request.recipient_ids)
+    return {"success": True, "count": count}
+
+
 @router.patch("/read-all")
-def mark_all_as_read(
-    db: Session = Depends(get_db),
+async def mark_all_as_read(
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Marca todas as mensagens como lidas."""
     service = InboxService(db)
-    count = service.mark_all_as_read(current_user.id)
+    count = await service.mark_all_as_read(current_user.id)
     return {"success": True, "count": count}
 
 
+@router.delete("/{recipient_id}")
+async def dismiss_message(
+    recipient_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Dispensa um aviso (some do inbox do usuário)."""
+    service = InboxService(db)
+    if not await service.dismiss(current_user.id, recipient_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Mensagem não encontrada",
+        )
+    return {"success": True}
+
+
 # === ROTAS DE ENVIO (REQUER PERMISSÃO) ===
 
-def require_send_permission(
-    db: Session = Depends(get_db),
+async def require_send_permission(
     current_user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_current_principal),
 ) -> User:
     """Dependency que verifica se usuário pode enviar avisos."""
-    service = InboxService(db)
-    if not service.user_has_permission(current_user.id, PERMISSION_SEND_INBOX):
+    if not principal.has_permission(PERMISSION_SEND_INBOX):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Você não tem permissão para enviar avisos",
@@ -112,25 +214,34 @@ def require_send_permission(
 
 
 @router.get("/send/filters", response_model=InboxFiltersOptionsResponse)
-def get_filter_options(
-    db: Session = Depends(get_db),
+async def get_filter_options(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(require_send_permission),
 ):
-    """Retorna opções disponíveis para filtros de segmentação."""
-    service = InboxService(db)
-    options = service.get_filter_options()
-    return InboxFiltersOptionsResponse(**options)
+    """
+    Retorna opções disponíveis para filtros de segmentação, com a quantidade
+    de usuários ativos em cada uma.
+    
+    Responde 304 quando o If-None-Match bate com o ETag das opções em cache.
+    """
+    etag, body = await get_filter_options_snapshot(db)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.post("/send/preview", response_model=InboxPreviewResponse)
-def preview_send(
+async def preview_send(
     request: InboxPreviewRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(require_send_permission),
 ):
     """Preview de quantos usuários receberão o aviso."""
     service = InboxService(db)
-    count = service.preview_send(request.send_to_all, request.filters)
+    count = await service.preview_send(request.send_to_all, request.filters)
     
     return InboxPreviewResponse(
         recipient_count=count,
@@ -139,12 +250,18 @@ def preview_send(
 
 
 @router.post("/send", response_model=InboxSendResponse)
-def send_message(
+async def send_message(
     request: InboxSendRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(require_send_permission),
 ):
-    """Envia um aviso para os destinatários."""
+    """
+    Envia um aviso para os destinatários.
+    Retorna logo após criar a mensagem; o progresso fica em /inbox/sent/{id}/status.
+    
+    send_at agenda o envio (cancelável em DELETE /inbox/sent/{id} até a
+    distribuição começar); delivery_rate limita destinatários por segundo.
+    """
     service = InboxService(db)
     
     # Validar que tem destinatários
@@ -159,45 +276,123 @@ def send_message(
     if request.attachments:
         attachments = [a.model_dump() for a in request.attachments]
     
-    message_id, recipient_count = service.send_message(
-        title=request.title,
-        message=request.message,
-        message_type=request.type,
-        created_by_user_id=current_user.id,
-        send_to_all=request.send_to_all,
-        filters=request.filters,
-        attachments=attachments,
-    )
+    try:
+        message_id, recipient_count, delivery_status = await service.send_message(
+            title=request.title,
+            message=request.message,
+            message_type=request.type,
+            created_by_user_id=current_user.id,
+            send_to_all=request.send_to_all,
+            filters=request.filters,
+            attachments=attachments,
+            send_at=request.send_at,
+            delivery_rate=request.delivery_rate,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+    # Broadcast (enviar para todos) não tem fan-out; agendado fica com o despachante
+    if not request.send_to_all:
+        start_inbox_delivery(message_id, request.send_to_all, request.filters, request.delivery_rate)
     
     return InboxSendResponse(
         message_id=message_id,
         recipient_count=recipient_count,
         success=True,
+        status=delivery_status.value,
     )
 
 
 @router.get("/sent")
-def get_sent_messages(
-    limit: int = 20,
-    db: Session = Depends(get_db),
+async def get_sent_messages(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor da página anterior"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_send_permission),
+):
+    """Lista mensagens enviadas pelo usuário, com estatísticas de leitura."""
+    service = InboxService(db)
+    try:
+        messages, next_cursor = await service.get_sent_messages(current_user.id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+    return {"messages": messages, "next_cursor": next_cursor}
+
+
+@router.delete("/sent/{message_id}")
+async def cancel_scheduled_message(
+    message_id: UUID,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(require_send_permission),
 ):
-    """Lista mensagens enviadas pelo usuário."""
+    """Cancela um aviso cuja distribuição ainda não começou (agendado)."""
     service = InboxService(db)
-    messages = service.get_sent_messages(current_user.id, limit=limit)
-    return {"messages": messages}
+    cancelled = await service.cancel_scheduled_message(message_id, current_user.id)
+    
+    if cancelled is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Mensagem não encontrada",
+        )
+    if not cancelled:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A distribuição deste aviso já começou",
+        )
+    return {"success": True}
+
+
+@router.get("/sent/{message_id}/stats", response_model=InboxMessageStatsResponse)
+async def get_message_stats(
+    message_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_send_permission),
+):
+    """Taxa de leitura e curva de leituras por hora de um aviso enviado."""
+    service = InboxService(db)
+    stats = await service.get_message_stats(message_id, current_user.id)
+    
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Mensagem não encontrada",
+        )
+    
+    return InboxMessageStatsResponse(**stats)
+
+
+@router.get("/sent/{message_id}/status", response_model=InboxDeliveryStatusResponse)
+async def get_delivery_status(
+    message_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_send_permission),
+):
+    """Progresso da distribuição de um aviso enviado."""
+    service = InboxService(db)
+    delivery = await service.get_delivery_status(message_id, current_user.id)
+    
+    if delivery is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Mensagem não encontrada",
+        )
+    
+    return InboxDeliveryStatusResponse(**delivery)
 
 
 # === ROTA DE PERMISSÕES ===
 
 @router.get("/permissions", response_model=UserPermissionsResponse)
-def get_my_permissions(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def get_my_permissions(
+    principal: Principal = Depends(get_current_principal),
 ):
     """Retorna permissões do usuário atual."""
-    service = InboxService(db)
-    permissions = service.get_user_permissions(current_user.id)
+    permissions = sorted(principal.permissions)
     
     return UserPermissionsResponse(
         permissions=permissions,
@@ -9,7 +9,8 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.db.session import get_db
 from app.db.models import (
@@ -30,6 +31,8 @@ from app.schemas.auth import (
 )
 
 from app.core.settings import settings
+from app.services.principal import Principal, load_principal
+from app.services.segment_index import segment_index
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -38,7 +41,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 # DEPENDENCIES
 # =============================================================================
 
-async def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> User:
     """
     Obtém usuário autenticado.
     
@@ -64,17 +67,17 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)) -> U
         email = parts[-1] if "@" in parts[-1] else f"{parts[1]}@dev.local"
         
         # Busca ou cria usuário
-        identity = db.execute(
-            select(UserIdentity).where(UserIdentity.email == email)
-        ).scalar_one_or_none()
+        user = (await db.execute(
+            select(User)
+            .join(UserIdentity, UserIdentity.user_id == User.id)
+            .where(UserIdentity.email == email)
+        )).scalar_one_or_none()
         
-        if identity:
-            user = identity.user
-        else:
+        if not user:
             # Cria usuário
             user = User()
             db.add(user)
-            db.flush()
+            await db.flush()
             
             identity = UserIdentity(
                 user_id=user.id,
@@ -88,8 +91,9 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)) -> U
             profile = UserProfile(user_id=user.id, status="INCOMPLETE")
             db.add(profile)
             
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
+            segment_index.add_user(user.id)
         
         return user
     
@@ -99,17 +103,29 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)) -> U
         raise HTTPException(status_code=501, detail={"error": "not_implemented", "message": "Firebase auth não implementado"})
 
 
+async def get_current_principal(
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> Principal:
+    """
+    Roles globais, memberships e permissões do usuário autenticado.
+    
+    Resolvido uma vez por requisição (FastAPI reaproveita a dependency).
+    """
+    return await load_principal(db, user.id)
+
+
 # =============================================================================
 # ROUTES
 # =============================================================================
 
 @router.post("/register", response_model=AuthResponse)
-async def register(data: RegisterRequest, db: Session = Depends(get_db)):
+async def register(data: RegisterRequest, db: AsyncSession = Depends(get_db)):
     """Registra novo usuário."""
     # Verifica se email já existe
-    existing = db.execute(
+    existing = (await db.execute(
         select(UserIdentity).where(UserIdentity.email == data.email)
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if existing:
         raise HTTPException(
@@ -120,7 +136,7 @@ async def register(data: RegisterRequest, db: Session = Depends(get_db)):
     # Cria usuário
     user = User()
     db.add(user)
-    db.flush()
+    await db.flush()
     
     # Cria identity
     identity = UserIdentity(
@@ -140,7 +156,8 @@ async def register(data: RegisterRequest, db: Session = Depends(get_db)):
     )
     db.add(profile)
     
-    db.commit()
+    await db.commit()
+    segment_index.add_user(user.id)
     
     # Em DEV, retorna token fake
     if settings.auth_mode == "DEV":
@@ -156,11 +173,13 @@ async def register(data: RegisterRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=AuthResponse)
-async def login(data: LoginRequest, db: Session = Depends(get_db)):
+async def login(data: LoginRequest, db: AsyncSession = Depends(get_db)):
     """Login do usuário."""
-    identity = db.execute(
-        select(UserIdentity).where(UserIdentity.email == data.email)
-    ).scalar_one_or_none()
+    identity = (await db.execute(
+        select(UserIdentity)
+        .where(UserIdentity.email == data.email)
+        .options(selectinload(UserIdentity.user))
+    )).scalar_one_or_none()
     
     if not identity:
         raise HTTPException(
@@ -186,9 +205,21 @@ async def login(data: LoginRequest, db: Session = Depends(get_db)):
 @router.get("/me", response_model=UserMeResponse)
 async def get_me(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Retorna dados do usuário autenticado."""
+    # Carrega relacionamentos usados na resposta (sem lazy load em AsyncSession)
+    user = (await db.execute(
+        select(User)
+        .where(User.id == user.id)
+        .options(
+            selectinload(User.identities),
+            selectinload(User.profile),
+            selectinload(User.memberships).selectinload(OrgMembership.org_unit),
+            selectinload(User.global_roles).selectinload(UserGlobalRole.global_role),
+        )
+    )).scalar_one()
+    
     # Identities
     identities = [
         IdentityOut(
@@ -208,22 +239,22 @@ async def get_me(
     email_verified = any(i.email_verified for i in user.identities)
     
     # Consents
-    latest_terms = db.execute(
+    latest_terms = (await db.execute(
         select(LegalDocument)
         .where(LegalDocument.type == "TERMS")
         .order_by(LegalDocument.published_at.desc())
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
-    latest_privacy = db.execute(
+    latest_privacy = (await db.execute(
         select(LegalDocument)
         .where(LegalDocument.type == "PRIVACY")
         .order_by(LegalDocument.published_at.desc())
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     user_consent_doc_ids = set()
-    consents = db.execute(
+    consents = (await db.execute(
         select(UserConsent).where(UserConsent.user_id == user.id)
-    ).scalars().all()
+    )).scalars().all()
     for c in consents:
         user_consent_doc_ids.add(c.document_id)
     
@@ -252,16 +283,20 @@ async def get_me(
     
     # Pending invites
     pending_invites = []
-    invites = db.execute(
+    invites = (await db.execute(
         select(OrgInvite)
         .where(
             OrgInvite.invited_user_id == user.id,
             OrgInvite.status == InviteStatus.PENDING,
         )
-    ).scalars().all()
+        .options(
+            selectinload(OrgInvite.org_unit),
+            selectinload(OrgInvite.invited_by_user).selectinload(User.profile),
+        )
+    )).scalars().all()
     
     for inv in invites:
-        invited_by = db.get(User, inv.invited_by_user_id)
+        invited_by = inv.invited_by_user
         invited_by_name = "Desconhecido"
         if invited_by and invited_by.profile:
             invited_by_name = invited_by.profile.full_name or "Usuário"
@@ -10,7 +10,7 @@ from datetime import datetime, timezone
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
 from app.db.models import (
@@ -18,13 +18,15 @@ from app.db.models import (
     OrgUnit, OrgUnitType, Visibility, OrgMembership, OrgRoleCode, MembershipStatus,
     LegalDocument,
 )
-from app.api.routes.auth import get_current_user
+from app.api.routes.auth import get_current_principal, get_current_user
+from app.services.organization import add_org_unit_closure, bump_org_tree_version
+from app.services.principal import Principal, invalidate_principal
 
 router = APIRouter(prefix="/dev", tags=["dev"])
 
 
 @router.post("/seed")
-async def seed_database(db: Session = Depends(get_db)):
+async def seed_database(db: AsyncSession = Depends(get_db)):
     """Popula banco com dados iniciais."""
     results = {
         "global_roles": 0,
@@ -40,7 +42,7 @@ async def seed_database(db: Session = Depends(get_db)):
         ("SECRETARY", "Secretário Geral"),
     ]
     for code, name in roles:
-        existing = db.execute(select(GlobalRole).where(GlobalRole.code == code)).scalar_one_or_none()
+        existing = (await db.execute(select(GlobalRole).where(GlobalRole.code == code))).scalar_one_or_none()
         if not existing:
             db.add(GlobalRole(code=code, name=name))
             results["global_roles"] += 1
@@ -51,14 +53,14 @@ async def seed_database(db: Session = Depends(get_db)):
         ("PRIVACY", "1.0", "Política de Privacidade do Lumen+\n\nSeus dados são..."),
     ]
     for doc_type, version, content in docs:
-        existing = db.execute(
+        existing = (await db.execute(
             select(LegalDocument).where(LegalDocument.type == doc_type, LegalDocument.version == version)
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
         if not existing:
             db.add(LegalDocument(type=doc_type, version=version, content=content))
             results["legal_docs"] += 1
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Seed concluído", "results": results}
 
@@ -67,18 +69,18 @@ async def seed_database(db: Session = Depends(get_db)):
 async def create_conselho_geral(
     name: str = "Conselho Geral Lumen Christi",
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
     """Cria o Conselho Geral (raiz da hierarquia). Requer role DEV."""
     # Verifica se é DEV
-    is_dev = any(ugr.global_role.code == "DEV" for ugr in user.global_roles)
-    if not is_dev:
+    if not principal.is_dev:
         raise HTTPException(status_code=403, detail={"error": "forbidden", "message": "Apenas DEV pode criar Conselho Geral"})
     
     # Verifica se já existe
-    existing = db.execute(
+    existing = (await db.execute(
         select(OrgUnit).where(OrgUnit.type == OrgUnitType.CONSELHO_GERAL)
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if existing:
         raise HTTPException(status_code=400, detail={"error": "already_exists", "message": "Conselho Geral já existe"})
@@ -93,7 +95,8 @@ async def create_conselho_geral(
         created_by_user_id=user.id,
     )
     db.add(conselho)
-    db.flush()
+    await db.flush()
+    await add_org_unit_closure(db, conselho.id, None)
     
     # Adiciona criador como coordenador
     membership = OrgMembership(
@@ -104,8 +107,10 @@ async def create_conselho_geral(
     )
     db.add(membership)
     
-    db.commit()
-    db.refresh(conselho)
+    await db.commit()
+    invalidate_principal(user.id)
+    bump_org_tree_version()
+    await db.refresh(conselho)
     
     return {
         "message": "Conselho Geral criado",
@@ -121,32 +126,31 @@ async def create_conselho_geral(
 async def assign_global_role(
     target_user_id: UUID,
     role_code: str,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
     """Atribui role global a um usuário. Requer role DEV."""
     # Verifica se é DEV
-    is_dev = any(ugr.global_role.code == "DEV" for ugr in user.global_roles)
-    if not is_dev:
+    if not principal.is_dev:
         raise HTTPException(status_code=403, detail={"error": "forbidden", "message": "Apenas DEV pode atribuir roles"})
     
     # Busca role
-    role = db.execute(select(GlobalRole).where(GlobalRole.code == role_code)).scalar_one_or_none()
+    role = (await db.execute(select(GlobalRole).where(GlobalRole.code == role_code))).scalar_one_or_none()
     if not role:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": f"Role {role_code} não encontrada"})
     
     # Busca usuário
-    target = db.get(User, target_user_id)
+    target = await db.get(User, target_user_id)
     if not target:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Usuário não encontrado"})
     
     # Verifica se já tem
-    existing = db.execute(
+    existing = (await db.execute(
         select(UserGlobalRole).where(
             UserGlobalRole.user_id == target_user_id,
             UserGlobalRole.global_role_id == role.id,
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if existing:
         return {"message": "Usuário já possui esta role"}
@@ -154,7 +158,8 @@ async def assign_global_role(
     # Atribui
     ugr = UserGlobalRole(user_id=target_user_id, global_role_id=role.id)
     db.add(ugr)
-    db.commit()
+    await db.commit()
+    invalidate_principal(target_user_id)
     
     return {"message": f"Role {role_code} atribuída ao usuário"}
 
@@ -162,24 +167,24 @@ async def assign_global_role(
 @router.post("/make-me-dev")
 async def make_me_dev(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Torna o usuário atual DEV (APENAS para primeiro setup)."""
     # Busca role DEV
-    role = db.execute(select(GlobalRole).where(GlobalRole.code == "DEV")).scalar_one_or_none()
+    role = (await db.execute(select(GlobalRole).where(GlobalRole.code == "DEV"))).scalar_one_or_none()
     if not role:
         # Cria se não existir
         role = GlobalRole(code="DEV", name="Desenvolvedor")
         db.add(role)
-        db.flush()
+        await db.flush()
     
     # Verifica se já tem
-    existing = db.execute(
+    existing = (await db.execute(
         select(UserGlobalRole).where(
             UserGlobalRole.user_id == user.id,
             UserGlobalRole.global_role_id == role.id,
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if existing:
         return {"message": "Você já é DEV"}
@@ -187,14 +192,15 @@ async def make_me_dev(
     # Atribui
     ugr = UserGlobalRole(user_id=user.id, global_role_id=role.id)
     db.add(ugr)
-    db.commit()
+    await db.commit()
+    invalidate_principal(user.id)
     
     return {"message": "Você agora é DEV!", "user_id": str(user.id)}
 
 
 @router.post("/grant-inbox-permission")
 async def grant_inbox_permission(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     """Dá permissão para enviar avisos ao usuário atual."""
@@ -202,12 +208,12 @@ async def grant_inbox_permission(
     from app.services.inbox_service import PERMISSION_SEND_INBOX
     
     # Verifica se já tem
-    existing = db.execute(
+    existing = (await db.execute(
         select(UserPermission).where(
             UserPermission.user_id == user.id,
             UserPermission.permission_code == PERMISSION_SEND_INBOX,
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if existing:
         return {"message": "Você já tem permissão para enviar avisos"}
@@ -218,7 +224,8 @@ async def grant_inbox_permission(
         permission_code=PERMISSION_SEND_INBOX,
     )
     db.add(permission)
-    db.commit()
+    await db.commit()
+    invalidate_principal(user.id)
     
     return {
         "message": "Permissão concedida! Agora você pode enviar avisos.",
@@ -229,24 +236,25 @@ async def grant_inbox_permission(
 
 @router.delete("/revoke-inbox-permission")
 async def revoke_inbox_permission(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     """Remove permissão de enviar avisos do usuário atual."""
     from app.db.models import UserPermission
     from app.services.inbox_service import PERMISSION_SEND_INBOX
     
-    existing = db.execute(
+    existing = (await db.execute(
         select(UserPermission).where(
             UserPermission.user_id == user.id,
             UserPermission.permission_code == PERMISSION_SEND_INBOX,
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if not existing:
         return {"message": "Você não tem essa permissão"}
     
-    db.delete(existing)
-    db.commit()
+    await db.delete(existing)
+    await db.commit()
+    invalidate_principal(user.id)
     
     return {"message": "Permissão removida"}
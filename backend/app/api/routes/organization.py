@@ -6,20 +6,20 @@ Unidades organizacionais, convites, membros.
 
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
 from app.db.models import User, OrgUnit, OrgUnitType, GroupType, Visibility, OrgRoleCode
 from app.api.routes.auth import get_current_user
 from app.schemas.organization import (
-    CreateOrgUnitRequest, OrgUnitOut, OrgUnitWithChildren, OrgTreeResponse,
+    CreateOrgUnitRequest, MoveOrgUnitRequest, OrgUnitOut, OrgTreeResponse, OrgChildrenPage,
     SendInviteRequest, InviteDetailOut, InviteResponse, PendingInvitesResponse,
     MemberOut, MembersListResponse,
 )
 from app.services.organization import (
-    OrgServiceError, create_org_unit, send_invite, respond_to_invite,
-    get_org_tree, get_org_unit_members, get_org_unit_pending_invites,
+    OrgServiceError, create_org_unit, move_org_unit, deactivate_org_unit, send_invite, respond_to_invite,
+    get_org_tree_snapshot, get_org_unit_children_page, get_org_unit_members, get_org_unit_pending_invites,
     is_coordinator_of,
 )
 
@@ -44,45 +44,58 @@ def handle_org_error(e: OrgServiceError):
     raise HTTPException(status_code=status, detail={"error": e.code, "message": e.message})
 
 
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Compara If-None-Match (lista separada por vírgula, aceita W/ e *) com o ETag."""
+    if not if_none_match:
+        return False
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
 # =============================================================================
 # ORG UNITS
 # =============================================================================
 
 @router.get("/tree", response_model=OrgTreeResponse)
 async def get_organization_tree(
+    request: Request,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Retorna árvore organizacional."""
-    root = get_org_tree(db, user.id)
+    """
+    Retorna árvore organizacional.
     
-    if not root:
-        return OrgTreeResponse(root=None)
+    Responde 304 quando o If-None-Match bate com o ETag da árvore em cache.
+    O 304 não monta nem serializa a árvore, mas ainda custa a leitura do
+    usuário na autenticação e, se o Principal não estiver em cache, a
+    consulta que o carrega.
+    """
+    etag, body = await get_org_tree_snapshot(db, user.id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
     
-    def build_tree(unit: OrgUnit, depth: int = 0) -> OrgUnitWithChildren:
-        children = []
-        if depth < 5:  # Limita profundidade
-            for child in unit.children:
-                if child.is_active:
-                    # TODO: Filtrar por visibilidade
-                    children.append(build_tree(child, depth + 1))
-        
-        return OrgUnitWithChildren(
-            id=unit.id,
-            type=unit.type.value,
-            group_type=unit.group_type.value if unit.group_type else None,
-            name=unit.name,
-            slug=unit.slug,
-            description=unit.description,
-            visibility=unit.visibility.value,
-            is_active=unit.is_active,
-            parent_id=unit.parent_id,
-            created_at=unit.created_at,
-            children=children,
-            member_count=len([m for m in unit.memberships if m.status.value == "ACTIVE"]),
-        )
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/units/{org_unit_id}/children", response_model=OrgChildrenPage)
+async def list_child_units(
+    org_unit_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Lista um nível de filhos da unidade (expansão sob demanda da árvore).
     
-    return OrgTreeResponse(root=build_tree(root))
+    Paginação por cursor: passe o next_cursor da página anterior.
+    """
+    try:
+        items, next_cursor = await get_org_unit_children_page(db, user.id, org_unit_id, limit, cursor)
+        return OrgChildrenPage(parent_id=org_unit_id, items=items, next_cursor=next_cursor)
+    except OrgServiceError as e:
+        handle_org_error(e)
 
 
 @router.post("/units/{parent_id}/children", response_model=OrgUnitOut)
@@ -90,11 +103,11 @@ async def create_child_unit(
     parent_id: UUID,
     data: CreateOrgUnitRequest,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Cria unidade filha."""
     # Determina tipo baseado no parent
-    parent = db.get(OrgUnit, parent_id)
+    parent = await db.get(OrgUnit, parent_id)
     if not parent:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Unidade pai não encontrada"})
     
@@ -117,7 +130,7 @@ async def create_child_unit(
         group_type = GroupType(data.group_type) if data.group_type else None
         visibility = Visibility(data.visibility) if data.visibility else Visibility.PUBLIC
         
-        unit = create_org_unit(
+        unit = await create_org_unit(
             db=db,
             user_id=user.id,
             parent_id=parent_id,
@@ -149,10 +162,10 @@ async def create_child_unit(
 async def get_org_unit(
     org_unit_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Retorna detalhes de uma unidade."""
-    unit = db.get(OrgUnit, org_unit_id)
+    unit = await db.get(OrgUnit, org_unit_id)
     if not unit:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Unidade não encontrada"})
     
@@ -170,6 +183,46 @@ async def get_org_unit(
     )
 
 
+@router.post("/units/{org_unit_id}/move", response_model=OrgUnitOut)
+async def move_unit(
+    org_unit_id: UUID,
+    data: MoveOrgUnitRequest,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Move a unidade (e toda a subárvore) para outro pai."""
+    try:
+        unit = await move_org_unit(db, org_unit_id, data.new_parent_id, user.id)
+        return OrgUnitOut(
+            id=unit.id,
+            type=unit.type.value,
+            group_type=unit.group_type.value if unit.group_type else None,
+            name=unit.name,
+            slug=unit.slug,
+            description=unit.description,
+            visibility=unit.visibility.value,
+            is_active=unit.is_active,
+            parent_id=unit.parent_id,
+            created_at=unit.created_at,
+        )
+    except OrgServiceError as e:
+        handle_org_error(e)
+
+
+@router.post("/units/{org_unit_id}/deactivate")
+async def deactivate_unit(
+    org_unit_id: UUID,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Desativa a unidade e toda a subárvore."""
+    try:
+        count = await deactivate_org_unit(db, org_unit_id, user.id)
+        return {"message": "Unidade desativada", "deactivated_count": count}
+    except OrgServiceError as e:
+        handle_org_error(e)
+
+
 # =============================================================================
 # MEMBERS
 # =============================================================================
@@ -178,15 +231,15 @@ async def get_org_unit(
 async def list_members(
     org_unit_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Lista membros de uma unidade."""
-    unit = db.get(OrgUnit, org_unit_id)
+    unit = await db.get(OrgUnit, org_unit_id)
     if not unit:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Unidade não encontrada"})
     
     try:
-        memberships = get_org_unit_members(db, org_unit_id, user.id)
+        memberships = await get_org_unit_members(db, org_unit_id, user.id)
         
         members = []
         for m in memberships:
@@ -222,13 +275,13 @@ async def send_member_invite(
     org_unit_id: UUID,
     data: SendInviteRequest,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Envia convite para participar da unidade."""
     try:
         role = OrgRoleCode(data.role) if data.role else OrgRoleCode.MEMBER
         
-        invite = send_invite(
+        invite = await send_invite(
             db=db,
             org_unit_id=org_unit_id,
             invited_user_id=data.user_id,
@@ -250,11 +303,11 @@ async def send_member_invite(
 async def list_pending_invites(
     org_unit_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Lista convites pendentes da unidade (só coordenador)."""
     try:
-        invites = get_org_unit_pending_invites(db, org_unit_id, user.id)
+        invites = await get_org_unit_pending_invites(db, org_unit_id, user.id)
         
         invite_list = []
         for inv in invites:
@@ -291,11 +344,11 @@ async def list_pending_invites(
 async def accept_invite(
     invite_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Aceita um convite."""
     try:
-        invite = respond_to_invite(db, invite_id, user.id, accept=True)
+        invite = await respond_to_invite(db, invite_id, user.id, accept=True)
         return InviteResponse(
             message="Convite aceito! Você agora é membro.",
             invite_id=invite.id,
@@ -309,11 +362,11 @@ async def accept_invite(
 async def reject_invite(
     invite_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Rejeita um convite."""
     try:
-        invite = respond_to_invite(db, invite_id, user.id, accept=False)
+        invite = await respond_to_invite(db, invite_id, user.id, accept=False)
         return InviteResponse(
             message="Convite recusado.",
             invite_id=invite.id,
@@ -330,12 +383,14 @@ async def reject_invite(
 @router.get("/my/invites", response_model=list[InviteDetailOut])
 async def get_my_pending_invites(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Lista convites pendentes do usuário logado."""
     from app.services.organization import get_user_pending_invites
     
-    invites = get_user_pending_invites(db, user.id)
+    invites = await get_user_pending_invites(db, user.id)
+    profile = await user.awaitable_attrs.profile
+    identities = await user.awaitable_attrs.identities
     
     result = []
     for inv in invites:
@@ -350,8 +405,8 @@ async def get_my_pending_invites(
             org_unit_name=inv.org_unit.name,
             org_unit_type=inv.org_unit.type.value,
             invited_user_id=inv.invited_user_id,
-            invited_user_name=user.profile.full_name if user.profile else "Você",
-            invited_user_email=user.identities[0].email if user.identities else None,
+            invited_user_name=profile.full_name if profile else "Você",
+            invited_user_email=identities[0].email if identities else None,
             invited_by_user_id=inv.invited_by_user_id,
             invited_by_name=invited_by_name,
             role=inv.role.value,
@@ -368,19 +423,21 @@ async def get_my_pending_invites(
 @router.get("/my/memberships")
 async def get_my_memberships(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Lista memberships ativos do usuário."""
     from app.db.models import OrgMembership, MembershipStatus
     from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
     
-    memberships = db.execute(
+    memberships = (await db.execute(
         select(OrgMembership)
         .where(
             OrgMembership.user_id == user.id,
             OrgMembership.status == MembershipStatus.ACTIVE,
         )
-    ).scalars().all()
+        .options(selectinload(OrgMembership.org_unit))
+    )).scalars().all()
     
     result = []
     for m in memberships:
@@ -405,7 +462,7 @@ async def search_users_to_invite(
     org_unit_id: UUID,
     q: str = "",
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Busca usuários para convidar (exclui membros e convites pendentes)."""
     from app.services.organization import search_users_for_invite
@@ -414,7 +471,7 @@ async def search_users_to_invite(
         return []
     
     try:
-        users = search_users_for_invite(db, org_unit_id, user.id, q)
+        users = await search_users_for_invite(db, org_unit_id, user.id, q)
         
         result = []
         for u in users:
@@ -436,7 +493,7 @@ async def update_member_role_endpoint(
     member_user_id: UUID,
     role: str,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Atualiza papel de um membro (COORDINATOR ou MEMBER)."""
     from app.services.organization import update_member_role
@@ -447,7 +504,7 @@ async def update_member_role_endpoint(
         raise HTTPException(status_code=400, detail={"error": "invalid_role", "message": "Papel inválido"})
     
     try:
-        membership = update_member_role(db, org_unit_id, member_user_id, user.id, new_role)
+        membership = await update_member_role(db, org_unit_id, member_user_id, user.id, new_role)
         return {
             "message": "Papel atualizado com sucesso",
             "user_id": str(member_user_id),
@@ -462,13 +519,13 @@ async def remove_member_endpoint(
     org_unit_id: UUID,
     member_user_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Remove um membro da unidade."""
     from app.services.organization import remove_member
     
     try:
-        remove_member(db, org_unit_id, member_user_id, user.id)
+        await remove_member(db, org_unit_id, member_user_id, user.id)
         return {"message": "Membro removido com sucesso"}
     except OrgServiceError as e:
         handle_org_error(e)
@@ -478,13 +535,13 @@ async def remove_member_endpoint(
 async def leave_unit(
     org_unit_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Sai de uma unidade (remove a si mesmo)."""
     from app.services.organization import remove_member
     
     try:
-        remove_member(db, org_unit_id, user.id, user.id)
+        await remove_member(db, org_unit_id, user.id, user.id)
         return {"message": "Você saiu da unidade"}
     except OrgServiceError as e:
         handle_org_error(e)
@@ -494,9 +551,9 @@ async def leave_unit(
 async def get_unit_permissions(
     org_unit_id: UUID,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Retorna permissões do usuário na unidade."""
     from app.services.organization import get_user_permissions
     
-    return get_user_permissions(db, user.id, org_unit_id)
+    return await get_user_permissions(db, user.id, org_unit_id)
@@ -10,7 +10,7 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
 from app.db.models import User, UserProfile, UserEmergencyContact, PhoneVerification, EmailVerification, OrgUnit
@@ -99,24 +99,25 @@ class EmergencyContactOut(BaseModel):
 @router.get("/profile", response_model=ProfileOut)
 async def get_profile(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Retorna perfil do usuário."""
-    profile = user.profile
+    profile = await user.awaitable_attrs.profile
     if not profile:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Perfil não encontrado"})
     
     # Nome do acompanhador
     accompanist_name = profile.vocational_accompanist_name
     if profile.vocational_accompanist_user_id:
-        accompanist = db.get(User, profile.vocational_accompanist_user_id)
-        if accompanist and accompanist.profile:
-            accompanist_name = accompanist.profile.full_name
+        accompanist = await db.get(User, profile.vocational_accompanist_user_id)
+        accompanist_profile = await accompanist.awaitable_attrs.profile if accompanist else None
+        if accompanist_profile:
+            accompanist_name = accompanist_profile.full_name
     
     # Nome do ministério de interesse
     ministry_name = None
     if profile.interested_ministry_id:
-        ministry = db.get(OrgUnit, profile.interested_ministry_id)
+        ministry = await db.get(OrgUnit, profile.interested_ministry_id)
         if ministry:
             ministry_name = ministry.name
     
@@ -147,13 +148,14 @@ async def get_profile(
 async def update_profile(
     data: ProfileUpdateRequest,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Atualiza perfil do usuário."""
-    profile = user.profile
+    profile = await user.awaitable_attrs.profile
     if not profile:
         profile = UserProfile(user_id=user.id)
         db.add(profile)
+        user.profile = profile
     
     # Validações condicionais
     if data.vocational_reality == "CONSAGRADO_FILHO_DA_LUZ" and not data.consecration_year:
@@ -204,8 +206,8 @@ async def update_profile(
         profile.status = "COMPLETE"
         profile.completed_at = datetime.now(timezone.utc)
     
-    db.commit()
-    db.refresh(profile)
+    await db.commit()
+    await db.refresh(profile)
     
     return await get_profile(user, db)
 
@@ -214,13 +216,14 @@ async def update_profile(
 async def upload_photo(
     file: UploadFile = File(...),
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Upload de foto do perfil."""
-    profile = user.profile
+    profile = await user.awaitable_attrs.profile
     if not profile:
         profile = UserProfile(user_id=user.id)
         db.add(profile)
+        user.profile = profile
     
     # TODO: Salvar no storage (S3, GCS, etc)
     # Por enquanto, salva como base64 ou retorna URL fake
@@ -236,7 +239,7 @@ async def upload_photo(
     photo_url = f"/storage/photos/{user.id}.jpg"
     profile.photo_url = photo_url
     
-    db.commit()
+    await db.commit()
     
     return {"photo_url": photo_url, "message": "Foto enviada com sucesso"}
 
@@ -245,10 +248,10 @@ async def upload_photo(
 async def add_emergency_contact(
     data: EmergencyContactRequest,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Adiciona contato de emergência."""
-    profile = user.profile
+    profile = await user.awaitable_attrs.profile
     if not profile:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Complete seu perfil primeiro"})
     
@@ -259,8 +262,8 @@ async def add_emergency_contact(
         contact_relationship=data.relationship,
     )
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await db.refresh(contact)
     
     return EmergencyContactOut(
         id=contact.id,
@@ -273,10 +276,10 @@ async def add_emergency_contact(
 @router.get("/profile/emergency-contacts", response_model=list[EmergencyContactOut])
 async def list_emergency_contacts(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Lista contatos de emergência."""
-    profile = user.profile
+    profile = await user.awaitable_attrs.profile
     if not profile:
         return []
     
@@ -287,7 +290,7 @@ async def list_emergency_contacts(
             phone_e164=c.contact_phone,
             relationship=c.contact_relationship,
         )
-        for c in profile.emergency_contacts
+        for c in await profile.awaitable_attrs.emergency_contacts
     ]
 
 
@@ -298,7 +301,7 @@ async def start_phone_verification(
     phone_e164: str,
     channel: str = "WHATSAPP",
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Inicia verificação de telefone."""
     # Gera código
@@ -314,8 +317,8 @@ async def start_phone_verification(
         expires_at=expires_at,
     )
     db.add(verification)
-    db.commit()
-    db.refresh(verification)
+    await db.commit()
+    await db.refresh(verification)
     
     # TODO: Enviar SMS/WhatsApp
     
@@ -336,10 +339,10 @@ async def confirm_phone_verification(
     verification_id: UUID,
     code: str,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Confirma verificação de telefone."""
-    verification = db.get(PhoneVerification, verification_id)
+    verification = await db.get(PhoneVerification, verification_id)
     
     if not verification or verification.user_id != user.id:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Verificação não encontrada"})
@@ -356,14 +359,14 @@ async def confirm_phone_verification(
     code_hash = hashlib.sha256(code.encode()).hexdigest()
     if code_hash != verification.code_hash:
         verification.attempts += 1
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=400, detail={"error": "invalid_code", "message": "Código inválido"})
     
     # Sucesso!
     verification.verified_at = datetime.now(timezone.utc)
     
     # Atualiza perfil
-    profile = user.profile
+    profile = await user.awaitable_attrs.profile
     if profile:
         profile.phone_verified = True
         profile.phone_e164 = verification.phone_e164
@@ -371,7 +374,7 @@ async def confirm_phone_verification(
             profile.status = "COMPLETE"
             profile.completed_at = datetime.now(timezone.utc)
     
-    db.commit()
+    await db.commit()
     
     return {"verified": True, "message": "Telefone verificado com sucesso!"}
 
@@ -1,13 +1,13 @@
 from typing import Any
 from uuid import UUID
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models import AuditLog
 
 
 def create_audit_log(
-    db: Session,
+    db: AsyncSession,
     action: str,
     actor_user_id: UUID | None = None,
     entity_type: str | None = None,
@@ -1,14 +1,205 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
 import time
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
+from typing import Any
 
 import httpx
-from cachetools import TTLCache
-from jose import jwt
-from jose.exceptions import JWTError
+import structlog
+from cachetools import LRUCache, TLRUCache
+from jose import jwk, jwt
+from jose.backends.base import Key
+from jose.exceptions import JWKError, JWTError
 
 FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
 
-_certs_cache: TTLCache[str, dict[str, str]] = TTLCache(maxsize=1, ttl=3600)
+# Usado quando o Google não envia Cache-Control: max-age
+DEFAULT_CERTS_MAX_AGE = 3600
+# Quanto antes da expiração a task de background renova as chaves
+CERTS_REFRESH_MARGIN = 300
+# Espera entre tentativas quando a renovação falha (background ou requisição)
+CERTS_RETRY_INTERVAL = 30
+
+# Tokens já verificados mantidos em memória (o app reenvia o mesmo por até 1h)
+VERIFIED_TOKEN_CACHE_SIZE = 10_000
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+logger = structlog.get_logger()
+
+
+def parse_max_age(cache_control: str | None) -> int | None:
+    """Extrai o max-age (segundos) de um header Cache-Control."""
+    if not cache_control:
+        return None
+    match = _MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else None
+
+
+class FirebaseKeyManager:
+    """
+    Mantém as chaves públicas do Firebase em memória.
+
+    - Renova em background antes de expirar, respeitando o max-age do Google
+    - Apenas um fetch em andamento por vez (requisições concorrentes aguardam o mesmo)
+    - Chaves vencidas são servidas na hora enquanto uma única tarefa renova;
+      depois de uma falha, nenhum fetch antes de retry_interval
+    - Persiste o último conjunto válido em disco para warm-start de workers novos
+    """
+
+    def __init__(
+        self,
+        certs_url: str = FIREBASE_CERTS_URL,
+        cache_path: str | None = None,
+        refresh_margin: int = CERTS_REFRESH_MARGIN,
+        timeout: float = 10.0,
+        retry_interval: float = CERTS_RETRY_INTERVAL,
+    ):
+        self.certs_url = certs_url
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+
+        self._keys: dict[str, str] = {}
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._stale_refresh: asyncio.Task[None] | None = None
+
+        self._load_from_disk()
+
+    @property
+    def is_fresh(self) -> bool:
+        return bool(self._keys) and time.time() < self._expires_at
+
+    async def get_keys(self) -> dict[str, str]:
+        """
+        Retorna as chaves atuais. Vencidas: o último conjunto válido sai na
+        hora e a renovação fica em background; só sem nenhum conjunto a
+        requisição espera o fetch.
+        """
+        if self.is_fresh:
+            return self._keys
+        if self._keys:
+            self._refresh_stale()
+            return self._keys
+        return await self.refresh()
+
+    def _refresh_stale(self) -> None:
+        """Dispara no máximo uma renovação em background, respeitando _retry_at."""
+        if time.time() < self._retry_at:
+            return
+        if self._stale_refresh is not None and not self._stale_refresh.done():
+            return
+        self._stale_refresh = asyncio.create_task(self._refresh_quietly())
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            await self.refresh()
+        except ValueError as e:
+            logger.warning("firebase_keys_refresh_failed", error=str(e))
+
+    async def refresh(self, ahead: bool = False) -> dict[str, str]:
+        """
+        Busca as chaves no Google (single-flight).
+
+        Quem chega enquanto outro fetch está em andamento aguarda o lock e
+        reaproveita o resultado. Com ahead=True renova se já passou do
+        horário de renovação antecipada, mesmo antes de expirar. Depois de
+        uma falha, quem não é a task de background falha direto até
+        _retry_at, sem novo fetch.
+        """
+        async with self._lock:
+            deadline = self._refresh_at if ahead else self._expires_at
+            if self._keys and time.time() < deadline:
+                return self._keys
+            if not ahead and time.time() < self._retry_at:
+                raise ValueError("Failed to fetch Firebase public keys: retrying later")
+
+            try:
+                response = await self._get_client().get(self.certs_url)
+                response.raise_for_status()
+                keys = response.json()
+            except Exception as e:
+                self._retry_at = time.time() + self.retry_interval
+                raise ValueError(f"Failed to fetch Firebase public keys: {e}")
+
+            max_age = parse_max_age(response.headers.get("Cache-Control")) or DEFAULT_CERTS_MAX_AGE
+            now = time.time()
+            self._keys = keys
+            self._expires_at = now + max_age
+            self._refresh_at = now + max(max_age - self.refresh_margin, max_age / 2)
+            self._retry_at = 0.0
+
+            await asyncio.to_thread(self._save_to_disk)
+            logger.info("firebase_keys_refreshed", kids=len(keys), max_age=max_age)
+            return keys
+
+    def start(self) -> None:
+        """Inicia a task de renovação em background (chamar no startup)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Cancela as tasks de background e fecha o client HTTP."""
+        for task in (self._task, self._stale_refresh):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._stale_refresh = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(self._refresh_at - time.time(), 0))
+            try:
+                await self.refresh(ahead=True)
+            except ValueError as e:
+                logger.warning("firebase_keys_refresh_failed", error=str(e))
+                await asyncio.sleep(self.retry_interval)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    def _load_from_disk(self) -> None:
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data: dict[str, Any] = json.load(f)
+            self._keys = dict(data["keys"])
+            self._expires_at = float(data["expires_at"])
+            self._refresh_at = float(data.get("refresh_at", self._expires_at))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("firebase_keys_cache_invalid", path=self.cache_path, error=str(e))
+
+    def _save_to_disk(self) -> None:
+        if not self.cache_path:
+            return
+        data = {"keys": self._keys, "expires_at": self._expires_at, "refresh_at": self._refresh_at}
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("firebase_keys_cache_write_failed", path=self.cache_path, error=str(e))
 
 
 @dataclass
@@ -19,16 +210,46 @@ class TokenPayload:
     provider: str
 
 
+@dataclass
+class VerificationCacheStats:
+    key_hits: int = 0
+    key_misses: int = 0
+    token_hits: int = 0
+    token_misses: int = 0
+
+
+def _token_expiry(_key: str, value: tuple[TokenPayload, float], _now: float) -> float:
+    return value[1]
+
+
 class FirebaseAuth:
-    def __init__(self, project_id: str, dev_mode: bool = False):
+    def __init__(
+        self,
+        project_id: str,
+        dev_mode: bool = False,
+        key_manager: FirebaseKeyManager | None = None,
+    ):
         self.project_id = project_id
         self.dev_mode = dev_mode
+        self.key_manager = key_manager or FirebaseKeyManager()
         self._issuer = f"https://securetoken.google.com/{project_id}"
 
-    def verify_token(self, token: str) -> TokenPayload:
+        # kid -> (PEM, chave RSA já parseada)
+        self._key_cache: LRUCache[str, tuple[str, Key]] = LRUCache(maxsize=16)
+        # sha256(token) -> (payload, exp); cada entrada sai do cache no exp do token
+        self._token_cache: TLRUCache[str, tuple[TokenPayload, float]] = TLRUCache(
+            maxsize=VERIFIED_TOKEN_CACHE_SIZE, ttu=_token_expiry, timer=time.time
+        )
+        self.cache_stats = VerificationCacheStats()
+
+    async def verify_token(self, token: str) -> TokenPayload:
         if self.dev_mode:
             return self._verify_dev_token(token)
-        return self._verify_production_token(token)
+        return await self._verify_production_token(token)
+
+    def get_cache_stats(self) -> dict[str, int]:
+        """Contadores de hit/miss dos caches de chave e de token."""
+        return asdict(self.cache_stats)
 
     def _verify_dev_token(self, token: str) -> TokenPayload:
         """
@@ -63,7 +284,14 @@ class FirebaseAuth:
                 provider="firebase",
             )
 
-    def _verify_production_token(self, token: str) -> TokenPayload:
+    async def _verify_production_token(self, token: str) -> TokenPayload:
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        cached = self._token_cache.get(token_hash)
+        if cached is not None:
+            self.cache_stats.token_hits += 1
+            return cached[0]
+        self.cache_stats.token_misses += 1
+
         try:
             unverified_header = jwt.get_unverified_header(token)
         except JWTError as e:
@@ -73,10 +301,11 @@ class FirebaseAuth:
         if not kid:
             raise ValueError("Token missing key ID")
 
-        public_keys = self._get_firebase_public_keys()
-        public_key = public_keys.get(kid)
-        if not public_key:
+        public_keys = await self.key_manager.get_keys()
+        certificate = public_keys.get(kid)
+        if not certificate:
             raise ValueError("Unknown key ID")
+        public_key = self._get_public_key(kid, certificate)
 
         try:
             payload = jwt.decode(
@@ -99,24 +328,26 @@ class FirebaseAuth:
         if not uid:
             raise ValueError("Token missing user ID")
 
-        return TokenPayload(
+        token_payload = TokenPayload(
             uid=uid,
             email=payload.get("email"),
             email_verified=payload.get("email_verified", False),
             provider="firebase",
         )
+        self._token_cache[token_hash] = (token_payload, float(payload["exp"]))
+        return token_payload
 
-    def _get_firebase_public_keys(self) -> dict[str, str]:
-        cache_key = "firebase_certs"
-
-        if cache_key in _certs_cache:
-            return _certs_cache[cache_key]
+    def _get_public_key(self, kid: str, certificate: str) -> Key:
+        """Parseia o certificado uma vez por kid (de novo só se o Google trocar o PEM)."""
+        cached = self._key_cache.get(kid)
+        if cached is not None and cached[0] == certificate:
+            self.cache_stats.key_hits += 1
+            return cached[1]
+        self.cache_stats.key_misses += 1
 
         try:
-            response = httpx.get(FIREBASE_CERTS_URL, timeout=10.0)
-            response.raise_for_status()
-            keys = response.json()
-            _certs_cache[cache_key] = keys
-            return keys
-        except Exception as e:
-            raise ValueError(f"Failed to fetch Firebase public keys: {e}")
+            key = jwk.construct(certificate, algorithm="RS256")
+        except JWKError as e:
+            raise ValueError(f"Invalid public key: {e}")
+        self._key_cache[kid] = (certificate, key)
+        return key
@@ -9,14 +9,15 @@ from typing import Any
 from uuid import UUID
 
 from sqlalchemy import (
-    Boolean, Date, DateTime, Enum, ForeignKey, Integer, 
-    LargeBinary, String, Text, UniqueConstraint, Index, func,
+    Boolean, Date, DateTime, Enum, ForeignKey, ForeignKeyConstraint, Identity, Integer, 
+    LargeBinary, String, Text, UniqueConstraint, Index, func, text,
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID as PGUUID
+from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
-class Base(DeclarativeBase):
+class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
@@ -66,6 +67,8 @@ class User(Base):
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, server_default="true")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Posição densa do usuário nos bitmaps de leitura (inbox_read_bitmaps)
+    inbox_seq: Mapped[int] = mapped_column(Integer, Identity(), unique=True)
     
     identities: Mapped[list["UserIdentity"]] = relationship("UserIdentity", back_populates="user", cascade="all, delete-orphan")
     profile: Mapped["UserProfile | None"] = relationship("UserProfile", back_populates="user", uselist=False, cascade="all, delete-orphan", foreign_keys="UserProfile.user_id")
@@ -251,6 +254,22 @@ class OrgUnit(Base):
     invites: Mapped[list["OrgInvite"]] = relationship("OrgInvite", back_populates="org_unit", cascade="all, delete-orphan")
 
 
+class OrgUnitClosure(Base):
+    """
+    Closure table da hierarquia: uma linha por par (ancestral, descendente),
+    incluindo a própria unidade com depth 0. Mantida pelo serviço de organização.
+    """
+    __tablename__ = "org_unit_closure"
+    
+    ancestor_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("org_units.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("org_units.id", ondelete="CASCADE"), primary_key=True)
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_org_unit_closure_descendant", "descendant_id", "depth"),
+    )
+
+
 class OrgMembership(Base):
     __tablename__ = "org_memberships"
     
@@ -368,6 +387,13 @@ class InboxMessageType(enum.Enum):
     URGENT = "urgent"
 
 
+class InboxDeliveryStatus(enum.Enum):
+    PENDING = "PENDING"
+    SENDING = "SENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+
 class InboxMessage(Base):
     """
     Mensagem/Aviso enviado para usuários.
@@ -382,7 +408,7 @@ class InboxMessage(Base):
         Enum(InboxMessageType, name="inbox_message_type", create_constraint=False), 
         nullable=False, 
         default=InboxMessageType.INFO,
-        server_default="info"
+        server_default="INFO"
     )
     
     # Anexos (URLs de imagens ou links)
@@ -393,9 +419,43 @@ class InboxMessage(Base):
     
     # Quem enviou
     created_by_user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Chave de partição: no Postgres a PK precisa incluí-la
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     
+    # Progresso da distribuição (fan-out em background)
+    delivery_status: Mapped[InboxDeliveryStatus] = mapped_column(
+        Enum(InboxDeliveryStatus, name="inbox_delivery_status", create_constraint=False, native_enum=False),
+        nullable=False,
+        default=InboxDeliveryStatus.PENDING,
+        server_default="SENT",
+    )
+    recipient_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    delivered_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    # Destinatários por segundo no fan-out (None = sem limite). Envio agendado:
+    # created_at = horário do envio, e o despachante distribui a partir dele
+    delivery_rate: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Lease do fan-out: renovado a cada faixa; SENDING com heartbeat vencido
+    # (processo morto) é retomado pelo despachante
+    delivery_heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    
+    # Enviar para todos: sem linhas em inbox_recipients; entra no inbox na leitura
+    # e cada usuário só ganha linha ao ler ou dispensar
+    is_broadcast: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
+    
+    __table_args__ = (
+        Index("ix_inbox_messages_sender_created", "created_by_user_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_inbox_messages_expires_at", "expires_at"),
+        Index("ix_inbox_messages_broadcast", text("created_at DESC"), postgresql_where=text("is_broadcast")),
+        Index("ix_inbox_messages_pending", "created_at", postgresql_where=text("delivery_status = 'PENDING'")),
+        Index(
+            "ix_inbox_messages_sending", "delivery_heartbeat_at",
+            postgresql_where=text("delivery_status = 'SENDING'"),
+        ),
+        # Partições mensais (ver ensure_inbox_partitions); expiração remove a partição inteira
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    
     # Relationships
     created_by: Mapped["User"] = relationship("User", foreign_keys=[created_by_user_id])
     recipients: Mapped[list["InboxRecipient"]] = relationship("InboxRecipient", back_populates="message", cascade="all, delete-orphan")
@@ -409,15 +469,32 @@ class InboxRecipient(Base):
     __tablename__ = "inbox_recipients"
     
     id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True, server_default=func.gen_random_uuid())
-    message_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("inbox_messages.id", ondelete="CASCADE"), nullable=False)
+    message_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
     user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     
     read: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="false")
     read_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    dismissed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    
+    # Cópia de inbox_messages (ordenação, expiração e chave de partição).
+    # Mesmo created_at da mensagem: as partições das duas tabelas coincidem.
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     
     __table_args__ = (
-        UniqueConstraint("message_id", "user_id", name="uq_inbox_recipient"),
-        Index("ix_inbox_recipient_user_read", "user_id", "read"),
+        ForeignKeyConstraint(
+            ["message_id", "created_at"],
+            ["inbox_messages.id", "inbox_messages.created_at"],
+            ondelete="CASCADE",
+        ),
+        UniqueConstraint("message_id", "user_id", "created_at", name="uq_inbox_recipient"),
+        # Mesma ordem da listagem do inbox: cada página é um range scan
+        Index(
+            "ix_inbox_recipient_user_feed",
+            "user_id", "read", text("created_at DESC"), text("id DESC"),
+            postgresql_include=["expires_at", "message_id", "dismissed_at"],
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
     
     # Relationships
@@ -425,6 +502,72 @@ class InboxRecipient(Base):
     user: Mapped["User"] = relationship("User")
 
 
+class InboxMessageStats(Base):
+    """
+    Contadores de entrega/leitura por mensagem (tela de avisos enviados).
+    Separado de inbox_messages para que cada leitura não reescreva a linha
+    com o corpo da mensagem. Sem FK: inbox_messages é particionada e a
+    limpeza acompanha a remoção das partições.
+    """
+    __tablename__ = "inbox_message_stats"
+    
+    message_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True)
+    recipient_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    read_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    first_read_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_read_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class InboxMessageReadBucket(Base):
+    """Leituras por hora de uma mensagem (curva de leitura)."""
+    __tablename__ = "inbox_message_read_buckets"
+    
+    message_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    read_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+
+class InboxReadBitmap(Base):
+    """
+    Leituras de um broadcast em bitmap: o bit inbox_seq % 8192 do chunk
+    inbox_seq // 8192 ligado indica que o usuário leu. Um chunk tem 1 KiB
+    (fica inline, sem TOAST) e só existe depois da primeira leitura nele.
+    """
+    __tablename__ = "inbox_read_bitmaps"
+    
+    message_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True)
+    chunk: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bits: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class InboxUnreadCounter(Base):
+    """
+    Não lidas por usuário (linhas de inbox_recipients com read = false e não
+    dispensadas; broadcasts pendentes somados na leitura), mantido na mesma
+    transação que altera os destinatários, inclusive no expurgo. Lido pelo
+    badge do app, que desconta as expiradas ainda não expurgadas.
+    """
+    __tablename__ = "inbox_unread_counters"
+    
+    user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    unread_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class InboxFilterFacet(Base):
+    """
+    Usuários ativos por valor de filtro de segmentação (opções de
+    /inbox/send/filters com contagem). Campos de catálogo guardam o id do
+    item; UF e cidade, o próprio texto. Ajustado junto com o perfil e
+    reconciliado periodicamente.
+    """
+    __tablename__ = "inbox_filter_facets"
+    
+    field: Mapped[str] = mapped_column(String(32), primary_key=True)
+    value: Mapped[str] = mapped_column(Text, primary_key=True)
+    user_count: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+
 # === PERMISSÕES ===
 
 class UserPermission(Base):
@@ -1,25 +1,32 @@
 """Database session management."""
 
-from collections.abc import Generator
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from app.settings import settings
 
-engine = create_engine(
-    settings.database_url,
-    pool_size=settings.database_pool_size,
-    max_overflow=settings.database_max_overflow,
-    pool_pre_ping=True,
-)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _engine_options() -> dict[str, Any]:
+    """Opções do pool (SQLite usa pool próprio e não aceita pool_size)."""
+    if settings.async_database_url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": settings.database_pool_size,
+        "max_overflow": settings.database_max_overflow,
+        "pool_pre_ping": True,
+    }
+
+
+engine = create_async_engine(settings.async_database_url, **_engine_options())
+
+# expire_on_commit=False: após o commit os atributos continuam carregados,
+# evitando lazy loads implícitos (que não são permitidos em AsyncSession).
+AsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 
-def get_db() -> Generator[Session, None, None]:
-    """Dependency para obter sessão do banco."""
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependency para obter sessão assíncrona do banco."""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
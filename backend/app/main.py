@@ -7,12 +7,13 @@ Backend refatorado com:
 - Perfil completo com foto, consagração, acompanhamento vocacional
 """
 
+import asyncio
 import uuid
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from typing import AsyncIterator
 
 import structlog
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
@@ -47,7 +48,65 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
         if settings.is_production:
             raise RuntimeError(f"Configuração inválida: {errors}")
     
+    # Chaves públicas do Firebase renovadas em background (fora do caminho da requisição)
+    key_manager = None
+    if settings.auth_mode == "PROD":
+        from app.api.deps import firebase_key_manager as key_manager
+        key_manager.start()
+    
+    # Partições mensais do inbox (a migração só cria os primeiros meses)
+    from app.services.inbox_service import ensure_partitions_on_startup
+    try:
+        created = await ensure_partitions_on_startup()
+        if created:
+            logger.info("inbox_partitions_created", months=created)
+    except Exception:
+        logger.exception("inbox_partitions_failed")
+    
+    # Expurgo de avisos expirados + reconciliação dos contadores de não lidas
+    inbox_maintenance = None
+    if settings.inbox_maintenance_interval_seconds > 0:
+        from app.services.inbox_service import inbox_maintenance_loop
+        inbox_maintenance = asyncio.create_task(
+            inbox_maintenance_loop(settings.inbox_maintenance_interval_seconds)
+        )
+    
+    # Envios agendados e fan-outs interrompidos (PENDING vencidos)
+    inbox_dispatch = None
+    if settings.inbox_dispatch_interval_seconds > 0:
+        from app.services.inbox_service import inbox_dispatch_loop
+        inbox_dispatch = asyncio.create_task(
+            inbox_dispatch_loop(settings.inbox_dispatch_interval_seconds)
+        )
+    
+    # Índice em memória dos segmentos (prévia de envio), reconstruído periodicamente
+    segment_index = None
+    if settings.inbox_segment_index_refresh_seconds > 0:
+        from app.services.segment_index import segment_index_loop
+        segment_index = asyncio.create_task(
+            segment_index_loop(settings.inbox_segment_index_refresh_seconds)
+        )
+    
+    # Leituras individuais agrupadas em UPDATEs periódicos (opcional)
+    read_receipts = None
+    if settings.inbox_read_receipt_flush_seconds > 0:
+        from app.services.inbox_service import read_receipts
+        read_receipts.start()
+    
     yield
+    
+    if read_receipts is not None:
+        await read_receipts.stop()
+    for task in (inbox_maintenance, inbox_dispatch, segment_index):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    # Fan-outs em andamento voltam a PENDING (os de processos mortos vencem o lease)
+    from app.services.inbox_service import stop_inbox_deliveries
+    await stop_inbox_deliveries()
+    if key_manager is not None:
+        await key_manager.stop()
     logger.info("application_shutdown")
 
 
@@ -95,11 +154,31 @@ async def global_exception_handler(request: Request, exc: Exception) -> JSONResp
 @app.get("/health")
 async def health():
     from datetime import datetime, timezone
-    return {
+    response = {
         "status": "healthy",
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "version": settings.app_version,
     }
+    return response
+
+
+# Telemetria interna (caches de auth, expurgo do inbox): só ADMIN/DEV
+from app.api.routes.auth import get_current_principal
+from app.services.principal import Principal
+
+
+@app.get("/health/details")
+async def health_details(principal: Principal = Depends(get_current_principal)):
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail={"error": "forbidden", "message": "Apenas ADMIN ou DEV"})
+    details = {}
+    if settings.auth_mode == "PROD":
+        from app.api.deps import firebase_auth
+        details["auth_cache"] = firebase_auth.get_cache_stats()
+    if settings.inbox_maintenance_interval_seconds > 0:
+        from app.services.inbox_service import get_purge_progress
+        details["inbox_purge"] = get_purge_progress()
+    return details
 
 
 # Rotas
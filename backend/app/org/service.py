@@ -1,9 +1,10 @@
 from typing import Any
 from uuid import UUID
 
+from sqlalchemy import distinct, select
 from sqlalchemy.orm import Session
 
-from app.db.models import MembershipStatus, OrgMembership, OrgUnit, OrgUnitType
+from app.db.models import MembershipStatus, OrgMembership, OrgUnit, OrgUnitClosure, OrgUnitType
 
 
 def get_org_tree(db: Session) -> dict[str, list[dict[str, Any]]]:
@@ -62,49 +63,30 @@ def expand_org_units_for_user(db: Session, user_id: UUID) -> set[UUID]:
 
     This implements the inheritance rule:
     - If user is member of a MINISTRY, they also inherit visibility to its parent SECTOR.
-    """
-    active_memberships = db.query(OrgMembership).filter(
-        OrgMembership.user_id == user_id,
-        OrgMembership.status == MembershipStatus.ACTIVE,
-    ).all()
-
-    direct_ids = {m.org_unit_id for m in active_memberships}
-
-    if not direct_ids:
-        return set()
-
-    org_units = db.query(OrgUnit).filter(OrgUnit.id.in_(direct_ids)).all()
-
-    expanded: set[UUID] = set(direct_ids)
 
-    for org_unit in org_units:
-        current = org_unit
-        while current.parent_id:
-            expanded.add(current.parent_id)
-            parent = db.query(OrgUnit).filter(OrgUnit.id == current.parent_id).first()
-            if not parent:
-                break
-            current = parent
-
-    return expanded
+    Single query over the org_unit_closure table.
+    """
+    rows = db.execute(
+        select(distinct(OrgUnitClosure.ancestor_id))
+        .join(OrgMembership, OrgMembership.org_unit_id == OrgUnitClosure.descendant_id)
+        .where(
+            OrgMembership.user_id == user_id,
+            OrgMembership.status == MembershipStatus.ACTIVE,
+        )
+    ).scalars().all()
+    return set(rows)
 
 
 def get_ancestors(db: Session, org_unit_id: UUID) -> list[UUID]:
     """
     Returns a list of ancestor IDs for a given org_unit, from immediate parent to root.
     """
-    ancestors: list[UUID] = []
-    org_unit = db.query(OrgUnit).filter(OrgUnit.id == org_unit_id).first()
-
-    if not org_unit:
-        return ancestors
-
-    current = org_unit
-    while current.parent_id:
-        ancestors.append(current.parent_id)
-        parent = db.query(OrgUnit).filter(OrgUnit.id == current.parent_id).first()
-        if not parent:
-            break
-        current = parent
-
-    return ancestors
+    rows = db.execute(
+        select(OrgUnitClosure.ancestor_id)
+        .where(
+            OrgUnitClosure.descendant_id == org_unit_id,
+            OrgUnitClosure.depth > 0,
+        )
+        .order_by(OrgUnitClosure.depth)
+    ).scalars().all()
+    return list(rows)
@@ -29,6 +29,8 @@ class InboxFilters(BaseModel):
     marital_status_codes: list[str] | None = Field(None, description="Códigos de estado civil")
     states: list[str] | None = Field(None, description="UFs (ex: CE, SP)")
     cities: list[str] | None = Field(None, description="Cidades")
+    org_unit_ids: list[UUID] | None = Field(None, description="Unidades organizacionais (membros ativos)")
+    include_descendants: bool = Field(False, description="Inclui membros das subunidades de org_unit_ids")
 
 
 class InboxAttachment(BaseModel):
@@ -50,6 +52,15 @@ class InboxSendRequest(BaseModel):
     
     # Anexos
     attachments: list[InboxAttachment] | None = Field(None, description="Anexos (imagens ou links)")
+    
+    # Agendamento e vazão do fan-out
+    send_at: datetime | None = Field(None, description="Horário do envio (vazio = agora)")
+    delivery_rate: int | None = Field(None, ge=1, le=100_000, description="Destinatários por segundo na distribuição")
+
+
+class InboxMarkReadRequest(BaseModel):
+    """Request para marcar vários avisos como lidos."""
+    recipient_ids: list[UUID] = Field(..., min_length=1, max_length=500)
 
 
 class InboxPreviewRequest(BaseModel):
@@ -61,16 +72,16 @@ class InboxPreviewRequest(BaseModel):
 # === RESPONSE SCHEMAS ===
 
 class InboxMessageResponse(BaseModel):
-    """Resposta com dados de uma mensagem do inbox."""
+    """Item da lista do inbox (cabeçalho; o corpo sai em /inbox/messages/{message_id})."""
     id: UUID
+    message_id: UUID
     title: str
-    message: str
+    preview: str = Field(..., description="Início do conteúdo do aviso")
     type: str
     read: bool
     read_at: datetime | None
     created_at: datetime
     expires_at: datetime
-    attachments: list[dict[str, Any]] | None = None
     
     # Dados do remetente (opcional)
     sender_name: str | None = None
@@ -79,11 +90,24 @@ class InboxMessageResponse(BaseModel):
         from_attributes = True
 
 
+class InboxMessageBodyResponse(BaseModel):
+    """Conteúdo completo de um aviso (imutável)."""
+    id: UUID
+    message: str
+    attachments: list[dict[str, Any]] | None = None
+
+
 class InboxListResponse(BaseModel):
     """Lista de mensagens do inbox."""
     messages: list[InboxMessageResponse]
     total: int
     unread_count: int
+    next_cursor: str | None = None
+
+
+class InboxUnreadCountResponse(BaseModel):
+    """Badge de não lidas."""
+    unread_count: int
 
 
 class InboxPreviewResponse(BaseModel):
@@ -93,10 +117,36 @@ class InboxPreviewResponse(BaseModel):
 
 
 class InboxSendResponse(BaseModel):
-    """Resposta após enviar um aviso."""
+    """Resposta após enviar um aviso (a distribuição segue em background)."""
     message_id: UUID
     recipient_count: int
     success: bool
+    status: str = "PENDING"
+
+
+class InboxDeliveryStatusResponse(BaseModel):
+    """Progresso da distribuição de um aviso."""
+    message_id: UUID
+    status: str = Field(..., description="PENDING, SENDING, SENT ou FAILED")
+    recipient_count: int
+    delivered_count: int
+
+
+class InboxReadBucket(BaseModel):
+    """Leituras numa hora."""
+    bucket_start: datetime
+    read_count: int
+
+
+class InboxMessageStatsResponse(BaseModel):
+    """Estatísticas de leitura de um aviso enviado."""
+    message_id: UUID
+    recipient_count: int
+    read_count: int
+    read_rate: float
+    first_read_at: datetime | None
+    last_read_at: datetime | None
+    read_curve: list[InboxReadBucket]
 
 
 class InboxFiltersOptionsResponse(BaseModel):
@@ -106,6 +156,9 @@ class InboxFiltersOptionsResponse(BaseModel):
     marital_statuses: list[dict[str, str]]
     states: list[str]
     cities: list[str]
+    counts: dict[str, dict[str, int]] = Field(
+        default_factory=dict, description="Usuários ativos por faceta e código/valor"
+    )
 
 
 # === PERMISSION SCHEMAS ===
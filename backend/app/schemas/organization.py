@@ -61,6 +61,11 @@ class CreateOrgUnitRequest(BaseModel):
     coordinator_user_ids: List[UUID] = []
 
 
+class MoveOrgUnitRequest(BaseModel):
+    """Request para mover unidade (com a subárvore) para outro pai."""
+    new_parent_id: UUID
+
+
 class OrgUnitOut(BaseModel):
     """Unidade organizacional."""
     id: UUID
@@ -82,6 +87,8 @@ class OrgUnitWithChildren(OrgUnitOut):
     """Unidade com filhos (para árvore)."""
     children: List["OrgUnitWithChildren"] = []
     member_count: int = 0
+    child_count: int = 0
+    has_children: bool = False
 
 
 # Necessário para referência circular
@@ -93,6 +100,13 @@ class OrgTreeResponse(BaseModel):
     root: Optional[OrgUnitWithChildren] = None
 
 
+class OrgChildrenPage(BaseModel):
+    """Um nível de filhos de uma unidade (expansão sob demanda)."""
+    parent_id: UUID
+    items: List[OrgUnitWithChildren] = []
+    next_cursor: Optional[str] = None
+
+
 # =============================================================================
 # INVITES
 # =============================================================================
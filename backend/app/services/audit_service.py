@@ -12,7 +12,7 @@ from typing import Any
 from uuid import UUID
 
 import structlog
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models import AuditLog
 from app.core.settings import settings
@@ -60,7 +60,7 @@ def sanitize_sensitive_data(data: Any) -> Any:
 
 
 def create_audit_log(
-    db: Session,
+    db: AsyncSession,
     actor_user_id: UUID | None,
     action: str,
     entity_type: str | None = None,
@@ -116,7 +116,7 @@ def create_audit_log(
 
 
 def audit_sensitive_access(
-    db: Session,
+    db: AsyncSession,
     viewer_user_id: UUID,
     target_user_id: UUID,
     action: str,
@@ -4,58 +4,320 @@ Inbox Service
 Serviço para gerenciamento de avisos/inbox.
 """
 
-from datetime import datetime, timedelta
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from collections import Counter
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
 from typing import Any
 from uuid import UUID
 
-from sqlalchemy import select, func, and_, or_
-from sqlalchemy.orm import Session, joinedload
+import structlog
+from cachetools import TTLCache
+from sqlalchemy import (
+    Integer, LargeBinary, Select, Text, Uuid, select, func, and_, or_, case, cast, column, delete, false, literal, null, text,
+    true, tuple_, union_all, update, values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.settings import settings
 from app.db.models import (
     InboxMessage, 
     InboxRecipient, 
     InboxMessageType,
+    InboxDeliveryStatus,
+    InboxUnreadCounter,
+    InboxMessageStats,
+    InboxMessageReadBucket,
+    InboxFilterFacet,
+    InboxReadBitmap,
+    MembershipStatus,
+    OrgMembership,
+    OrgUnit,
+    OrgUnitClosure,
     User, 
     UserProfile,
     UserPermission,
+    ProfileCatalog,
     ProfileCatalogItem,
 )
-from app.schemas.inbox import InboxFilters
+from app.db.session import AsyncSessionLocal
+from app.schemas.inbox import InboxFilters, InboxFiltersOptionsResponse
+from app.services.principal import invalidate_principal, load_principal
+from app.services.inbox_templates import has_placeholders, load_template_context, render, unknown_fields
+from app.services.inbox_timeline import inbox_timeline
+from app.services.segment_index import segment_index
 
+logger = structlog.get_logger()
 
 # Constantes
 INBOX_EXPIRATION_DAYS = 30
 PERMISSION_SEND_INBOX = "CAN_SEND_INBOX"
+INBOX_FANOUT_CHUNK_SIZE = 5000  # destinatários por transação no fan-out
+INBOX_PURGE_BATCH_SIZE = 2000  # linhas por transação no expurgo
+INBOX_PARTITION_MONTHS_AHEAD = 3  # partições mensais criadas com antecedência
+INBOX_PARTITIONED_TABLES = ("inbox_messages", "inbox_recipients")  # mensagens primeiro (FK)
+INBOX_SCHEDULE_MAX_DAYS = 60  # antecedência máxima de send_at (partições criadas adiante)
+INBOX_DISPATCH_BATCH_SIZE = 100  # mensagens vencidas por rodada do despachante
+INBOX_DELIVERY_LEASE_SECONDS = 300  # SENDING sem heartbeat há mais que isso é retomado
+INBOX_READ_BITMAP_CHUNK = 8192  # usuários por linha de inbox_read_bitmaps (1 KiB)
+INBOX_TIMELINE_MAX_ITEMS = 2000  # acima disso o usuário é servido só pelo Postgres
+INBOX_PREVIEW_LENGTH = 160  # caracteres do corpo exibidos na lista
+TIMELINE_HEADER_FIELDS = ("title", "preview", "type", "sender_name", "expires_at")
+
+# Faceta -> coluna do perfil (inbox_filter_facets.field)
+FACET_COLUMNS = {
+    "vocational_reality": UserProfile.vocational_reality_item_id,
+    "life_state": UserProfile.life_state_item_id,
+    "marital_status": UserProfile.marital_status_item_id,
+    "state": UserProfile.state,
+    "city": UserProfile.city,
+}
+# Catálogo -> (faceta, chave da resposta de opções)
+FACET_CATALOGS = {
+    "VOCATIONAL_REALITY": ("vocational_reality", "vocational_realities"),
+    "LIFE_STATE": ("life_state", "life_states"),
+    "MARITAL_STATUS": ("marital_status", "marital_statuses"),
+}
+
+
+def _encode_cursor(*values: Any) -> str:
+    raw = json.dumps(
+        list(values),
+        default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v),
+    ).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> list:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    values = json.loads(raw)
+    if not isinstance(values, list):
+        raise ValueError("Cursor inválido")
+    return values
+
+
+def _encode_inbox_cursor(read: bool, created_at: datetime, recipient_id: UUID) -> str:
+    return _encode_cursor(read, created_at, recipient_id)
+
+
+def _decode_inbox_cursor(cursor: str) -> tuple[bool, datetime, UUID]:
+    """Raises ValueError se o cursor for inválido."""
+    try:
+        read, created_at, recipient_id = _decode_cursor(cursor)
+        return bool(read), datetime.fromisoformat(created_at), UUID(recipient_id)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+
+def _decode_sent_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """Raises ValueError se o cursor for inválido."""
+    try:
+        created_at, message_id = _decode_cursor(cursor)
+        return datetime.fromisoformat(created_at), UUID(message_id)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+
+def _read_rate(read_count: int, recipient_count: int) -> float:
+    return round(read_count / recipient_count, 4) if recipient_count else 0.0
+
+
+def _month_start(value: datetime, offset: int = 0) -> datetime:
+    """Primeiro dia do mês de value deslocado de offset meses."""
+    index = value.year * 12 + value.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _unexpired(now: datetime, model: type[InboxRecipient] | type[InboxMessage] = InboxRecipient):
+    """
+    Linhas ainda não expiradas. O limite em created_at decorre de
+    expires_at = created_at + INBOX_EXPIRATION_DAYS (um dia de folga) e é o
+    que permite ao Postgres descartar as partições antigas.
+    """
+    return and_(
+        model.expires_at > now,
+        model.created_at > now - timedelta(days=INBOX_EXPIRATION_DAYS + 1),
+    )
+
+
+def _due_for_delivery(now: datetime):
+    """
+    Mensagens a distribuir: PENDING com horário vencido, ou SENDING cujo
+    lease venceu (o processo que distribuía morreu sem devolver a PENDING).
+    """
+    return or_(
+        and_(
+            InboxMessage.delivery_status == InboxDeliveryStatus.PENDING,
+            InboxMessage.created_at <= now,
+        ),
+        and_(
+            InboxMessage.delivery_status == InboxDeliveryStatus.SENDING,
+            or_(
+                InboxMessage.delivery_heartbeat_at.is_(None),
+                InboxMessage.delivery_heartbeat_at < now - timedelta(seconds=INBOX_DELIVERY_LEASE_SECONDS),
+            ),
+        ),
+    )
+
+
+def profile_facets(profile: UserProfile | None) -> dict[str, str]:
+    """Valores de faceta de um perfil (ids de catálogo como texto)."""
+    if profile is None:
+        return {}
+    values = {field: getattr(profile, column.key) for field, column in FACET_COLUMNS.items()}
+    return {field: str(value) for field, value in values.items() if value is not None}
+
+
+async def adjust_filter_facets(db: AsyncSession, before: dict[str, str], after: dict[str, str]) -> None:
+    """
+    Aplica em inbox_filter_facets a mudança de um perfil (antes/depois de
+    profile_facets). Não faz commit: roda na transação do próprio perfil.
+    """
+    deltas: Counter = Counter()
+    for field, value in before.items():
+        if after.get(field) != value:
+            deltas[(field, value)] -= 1
+    for field, value in after.items():
+        if before.get(field) != value:
+            deltas[(field, value)] += 1
+    if not deltas:
+        return
+    
+    upsert = pg_insert(InboxFilterFacet).values([
+        {"field": field, "value": value, "user_count": delta}
+        for (field, value), delta in deltas.items()
+    ])
+    upsert = upsert.on_conflict_do_update(
+        index_elements=["field", "value"],
+        set_={"user_count": InboxFilterFacet.user_count + upsert.excluded.user_count},
+    )
+    await db.execute(upsert)
+
+
+def _visible_recipients(user_id: UUID, now: datetime):
+    return and_(
+        InboxRecipient.user_id == user_id,
+        InboxRecipient.dismissed_at.is_(None),
+        _unexpired(now),
+    )
+
+
+def _counted_unread():
+    """Linhas somadas em inbox_unread_counters: não lidas e não dispensadas."""
+    return and_(InboxRecipient.read == False, InboxRecipient.dismissed_at.is_(None))
+
+
+def _broadcast_read():
+    """Bit do usuário (User já no FROM) no bitmap de leitura do broadcast."""
+    return func.coalesce(
+        func.get_bit(InboxReadBitmap.bits, User.inbox_seq % INBOX_READ_BITMAP_CHUNK) == 1,
+        false(),
+    )
+
+
+def _user_broadcasts(user_id: UUID, now: datetime) -> Select:
+    """
+    Broadcasts do usuário sem linha de estado em inbox_recipients (que só
+    existe para os dispensados e para leituras anteriores aos bitmaps), com
+    o flag de leitura do bitmap. Audiência: usuário ativo e cadastrado antes
+    do envio, como no fan-out. Agendado só aparece a partir de created_at.
+    """
+    return (
+        select(
+            InboxMessage.id,
+            InboxMessage.created_at,
+            InboxMessage.expires_at,
+            _broadcast_read().label("read"),
+        )
+        .select_from(InboxMessage)
+        .join(User, User.id == user_id)
+        .outerjoin(InboxReadBitmap, and_(
+            InboxReadBitmap.message_id == InboxMessage.id,
+            InboxReadBitmap.chunk == User.inbox_seq // INBOX_READ_BITMAP_CHUNK,
+        ))
+        .where(
+            InboxMessage.is_broadcast == True,
+            InboxMessage.created_at <= now,
+            _unexpired(now, InboxMessage),
+            User.is_active == True,
+            User.created_at <= InboxMessage.created_at,
+            ~select(InboxRecipient.id)
+            .where(
+                InboxRecipient.message_id == InboxMessage.id,
+                InboxRecipient.created_at == InboxMessage.created_at,
+                InboxRecipient.user_id == user_id,
+            )
+            .exists(),
+        )
+    )
+
+
+def _pending_broadcasts(user_id: UUID, now: datetime) -> Select:
+    """Broadcasts que o usuário ainda não leu nem dispensou."""
+    return _user_broadcasts(user_id, now).where(~_broadcast_read())
+
+
+def _message_preview():
+    """Início do corpo para a lista (o corpo inteiro sai por get_message_body)."""
+    return func.substr(InboxMessage.message, 1, INBOX_PREVIEW_LENGTH).label("preview")
+
+
+async def _update_timeline(operation, *args: Any) -> None:
+    """
+    Escrita na timeline depois do commit. Falha só é registrada: a timeline
+    fica defasada até expirar.
+    """
+    if not inbox_timeline.enabled:
+        return
+    try:
+        await operation(*args)
+    except Exception:
+        logger.warning("inbox_timeline_write_failed", operation=operation.__name__, exc_info=True)
+
+
+def _after_inbox_cursor(read: bool, created_at: datetime, recipient_id: UUID, columns: tuple | None = None):
+    """
+    Itens depois do cursor na ordem (read ASC, created_at DESC, id DESC).
+    columns: (read, created_at, id) de outra origem; padrão inbox_recipients.
+    """
+    read_column, created_column, id_column = columns or (
+        InboxRecipient.read, InboxRecipient.created_at, InboxRecipient.id,
+    )
+    older = tuple_(created_column, id_column) < tuple_(created_at, recipient_id)
+    if read:
+        return and_(read_column == True, older)
+    return or_(read_column == True, and_(read_column == False, older))
 
 
 class InboxService:
     """Serviço para operações de inbox."""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
     # === PERMISSÕES ===
     
-    def user_has_permission(self, user_id: UUID, permission_code: str) -> bool:
+    async def user_has_permission(self, user_id: UUID, permission_code: str) -> bool:
         """Verifica se usuário tem uma permissão específica."""
-        result = self.db.execute(
-            select(UserPermission)
-            .where(
-                UserPermission.user_id == user_id,
-                UserPermission.permission_code == permission_code
-            )
-        ).scalar_one_or_none()
-        return result is not None
+        principal = await load_principal(self.db, user_id)
+        return principal.has_permission(permission_code)
     
-    def get_user_permissions(self, user_id: UUID) -> list[str]:
+    async def get_user_permissions(self, user_id: UUID) -> list[str]:
         """Retorna lista de permissões do usuário."""
-        result = self.db.execute(
-            select(UserPermission.permission_code)
-            .where(UserPermission.user_id == user_id)
-        ).scalars().all()
-        return list(result)
+        principal = await load_principal(self.db, user_id)
+        return sorted(principal.permissions)
     
-    def grant_permission(self, user_id: UUID, permission_code: str, granted_by_user_id: UUID | None = None) -> UserPermission:
+    async def grant_permission(self, user_id: UUID, permission_code: str, granted_by_user_id: UUID | None = None) -> UserPermission:
         """Concede uma permissão a um usuário."""
         permission = UserPermission(
             user_id=user_id,
@@ -63,257 +325,761 @@ class InboxService:
             granted_by_user_id=granted_by_user_id,
         )
         self.db.add(permission)
-        self.db.commit()
-        self.db.refresh(permission)
+        await self.db.commit()
+        invalidate_principal(user_id)
+        await self.db.refresh(permission)
         return permission
     
-    def revoke_permission(self, user_id: UUID, permission_code: str) -> bool:
+    async def revoke_permission(self, user_id: UUID, permission_code: str) -> bool:
         """Remove uma permissão de um usuário."""
-        result = self.db.execute(
+        result = (await self.db.execute(
             select(UserPermission)
             .where(
                 UserPermission.user_id == user_id,
                 UserPermission.permission_code == permission_code
             )
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
         
         if result:
-            self.db.delete(result)
-            self.db.commit()
+            await self.db.delete(result)
+            await self.db.commit()
+            invalidate_principal(user_id)
             return True
         return False
     
     # === LEITURA DE INBOX ===
     
-    def get_user_inbox(
+    async def get_user_inbox(
         self, 
         user_id: UUID, 
         include_read: bool = True,
         limit: int = 50,
-        offset: int = 0
-    ) -> tuple[list[dict], int, int]:
+        cursor: str | None = None,
+        offset: int = 0,
+    ) -> tuple[list[dict], int, int, str | None]:
+        """
+        Retorna mensagens do inbox do usuário, paginadas por cursor
+        (read, created_at, id). Da timeline no Redis quando o cache está
+        ligado; senão (ou se ele falhar), do Postgres. Título e prévia saem
+        personalizados para o usuário (marcadores {{campo}}).
+        
+        offset: paginação antiga, aceita por uma versão (sempre no Postgres;
+        ignorado com cursor). A resposta já traz next_cursor para migrar.
+        Returns: (messages, total, unread_count, next_cursor)
+        """
+        after = _decode_inbox_cursor(cursor) if cursor else None
+        if after is not None:
+            offset = 0
+        page = None
+        if inbox_timeline.enabled and not offset:
+            page = await self._inbox_from_timeline(user_id, include_read, limit, after)
+        if page is None:
+            page = await self._query_inbox(user_id, include_read, limit, after, offset)
+        await self._personalize(user_id, page[0])
+        return page
+    
+    async def _personalize(self, user_id: UUID, messages: list[dict]) -> None:
+        """Renderiza título e prévia; o perfil só é lido se a página tiver marcadores."""
+        if not any(has_placeholders(m["title"]) or has_placeholders(m["preview"]) for m in messages):
+            return
+        context = await load_template_context(self.db, user_id)
+        for m in messages:
+            m["title"] = render(m["title"], context)
+            m["preview"] = render(m["preview"], context, preview=True)
+    
+    async def _query_inbox(
+        self,
+        user_id: UUID,
+        include_read: bool,
+        limit: int,
+        after: tuple[bool, datetime, UUID] | None,
+        offset: int = 0,
+    ) -> tuple[list[dict], int, int, str | None]:
         """
-        Retorna mensagens do inbox do usuário.
-        Returns: (messages, total, unread_count)
+        Página, totais e remetente numa única consulta. Só cabeçalhos e o
+        início do corpo: corpo e anexos ficam em get_message_body.
+        
+        Broadcasts sem linha de estado entram aqui com o id da própria
+        mensagem (aceito por mark_as_read/dismiss) e a leitura do bitmap.
         """
         now = datetime.utcnow()
+        visible = _visible_recipients(user_id, now)
+        unread = InboxRecipient.read == False
         
-        # Query base
-        base_query = (
-            select(InboxRecipient, InboxMessage)
-            .join(InboxMessage, InboxRecipient.message_id == InboxMessage.id)
-            .where(
-                InboxRecipient.user_id == user_id,
-                InboxMessage.expires_at > now
+        # Totais por index-only scan em ix_inbox_recipient_user_feed
+        counts = (
+            select(
+                func.count().label("total"),
+                func.count().filter(unread).label("unread_count"),
             )
+            .where(visible)
+            .subquery("counts")
         )
+        broadcasts = _user_broadcasts(user_id, now).subquery("broadcasts")
+        broadcast_counts = select(
+            func.count().label("total"),
+            func.count().filter(broadcasts.c.read == False).label("unread_count"),
+        ).subquery("broadcast_counts")
         
+        # Cada lado já limitado pelo seu índice antes da união
+        received = select(
+            InboxRecipient.id,
+            InboxRecipient.message_id,
+            InboxRecipient.read,
+            InboxRecipient.read_at,
+            InboxRecipient.created_at,
+            InboxRecipient.expires_at,
+        ).where(visible)
         if not include_read:
-            base_query = base_query.where(InboxRecipient.read == False)
-        
-        # Ordenar por não lidos primeiro, depois por data
-        base_query = base_query.order_by(
+            received = received.where(unread)
+        if after:
+            received = received.where(_after_inbox_cursor(*after))
+        received = received.order_by(
             InboxRecipient.read.asc(),
-            InboxMessage.created_at.desc()
+            InboxRecipient.created_at.desc(),
+            InboxRecipient.id.desc(),
+        ).limit(offset + limit + 1).subquery("received")
+        
+        # Bitmap não guarda o horário da leitura
+        broadcast_page = select(
+            broadcasts.c.id,
+            broadcasts.c.id.label("message_id"),
+            broadcasts.c.read,
+            cast(null(), InboxRecipient.read_at.type).label("read_at"),
+            broadcasts.c.created_at,
+            broadcasts.c.expires_at,
+        )
+        if not include_read:
+            broadcast_page = broadcast_page.where(broadcasts.c.read == False)
+        if after:
+            broadcast_page = broadcast_page.where(_after_inbox_cursor(
+                *after, columns=(broadcasts.c.read, broadcasts.c.created_at, broadcasts.c.id),
+            ))
+        broadcast_page = (
+            broadcast_page.order_by(
+                broadcasts.c.read.asc(), broadcasts.c.created_at.desc(), broadcasts.c.id.desc(),
+            )
+            .limit(offset + limit + 1)
+            .subquery("broadcast_page")
         )
         
-        # Contar total
-        count_query = (
-            select(func.count())
-            .select_from(InboxRecipient)
-            .join(InboxMessage, InboxRecipient.message_id == InboxMessage.id)
-            .where(
-                InboxRecipient.user_id == user_id,
-                InboxMessage.expires_at > now
+        feed = union_all(select(received), select(broadcast_page)).subquery("feed")
+        # Não lidos primeiro, depois mais recentes; id desempata
+        page = (
+            select(
+                feed,
+                InboxMessage.title,
+                _message_preview(),
+                InboxMessage.type,
+                UserProfile.full_name.label("sender_name"),
             )
+            .join(InboxMessage, and_(
+                InboxMessage.id == feed.c.message_id,
+                InboxMessage.created_at == feed.c.created_at,
+            ))
+            .join(UserProfile, UserProfile.user_id == InboxMessage.created_by_user_id, isouter=True)
+            .order_by(feed.c.read.asc(), feed.c.created_at.desc(), feed.c.id.desc())
+            .offset(offset or None)
+            .limit(limit + 1)
+            .subquery("page")
         )
-        total = self.db.execute(count_query).scalar() or 0
-        
-        # Contar não lidos
-        unread_query = count_query.where(InboxRecipient.read == False)
-        unread_count = self.db.execute(unread_query).scalar() or 0
-        
-        # Buscar mensagens
-        results = self.db.execute(
-            base_query.limit(limit).offset(offset)
-        ).all()
-        
-        messages = []
-        for recipient, message in results:
-            # Buscar nome do remetente
-            sender = self.db.execute(
-                select(UserProfile.full_name)
-                .where(UserProfile.user_id == message.created_by_user_id)
-            ).scalar_one_or_none()
+        
+        # LEFT JOIN garante a linha dos totais mesmo com página vazia
+        query = (
+            select(
+                (counts.c.total + broadcast_counts.c.total).label("total"),
+                (counts.c.unread_count + broadcast_counts.c.unread_count).label("unread_count"),
+                page,
+            )
+            .select_from(counts.join(broadcast_counts, true()).outerjoin(page, true()))
+            .order_by(page.c.read.asc(), page.c.created_at.desc(), page.c.id.desc())
+        )
+        rows = (await self.db.execute(query)).all()
+        
+        total, unread_count = rows[0].total, rows[0].unread_count
+        rows = [row for row in rows if row.id is not None]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        messages = [
+            {
+                "id": str(row.id),
+                "message_id": str(row.message_id),
+                "title": row.title,
+                "preview": row.preview,
+                "type": row.type.value,
+                "read": bool(row.read),
+                "read_at": row.read_at,
+                "created_at": row.created_at,
+                "expires_at": row.expires_at,
+                "sender_name": row.sender_name or "Lumen+",
+            }
+            for row in rows
+        ]
+        
+        last = rows[-1] if rows else None
+        next_cursor = _encode_inbox_cursor(bool(last.read), last.created_at, last.id) if has_more else None
+        return messages, total, unread_count, next_cursor
+    
+    # === TIMELINE (cache no Redis) ===
+    
+    async def _inbox_from_timeline(
+        self,
+        user_id: UUID,
+        include_read: bool,
+        limit: int,
+        after: tuple[bool, datetime, UUID] | None,
+    ) -> tuple[list[dict], int, int, str | None] | None:
+        """Página da timeline, remontada do Postgres se ausente. None = usar o SQL."""
+        cutoff = datetime.utcnow() - timedelta(days=INBOX_EXPIRATION_DAYS)
+        try:
+            page = await inbox_timeline.page(user_id, include_read, limit, after, cutoff)
+            if page is None and await self._rebuild_timeline(user_id):
+                page = await inbox_timeline.page(user_id, include_read, limit, after, cutoff)
+            if page is None:
+                return None
+            items, total, unread_count, has_more = page
             
-            messages.append({
-                "id": str(recipient.id),
-                "message_id": str(message.id),
-                "title": message.title,
-                "message": message.message,
-                "type": message.type.value,
-                "read": recipient.read,
-                "read_at": recipient.read_at,
-                "created_at": message.created_at,
-                "expires_at": message.expires_at,
-                "attachments": message.attachments,
-                "sender_name": sender or "Lumen+",
-            })
-        
-        return messages, total, unread_count
-    
-    def get_unread_messages(self, user_id: UUID, limit: int = 10) -> list[dict]:
+            message_ids = list(dict.fromkeys(item["message_id"] for item in items))
+            headers = await inbox_timeline.headers(message_ids)
+            missing = [UUID(m) for m in message_ids if m not in headers]
+            if missing:
+                loaded = await self._message_headers(missing)
+                await inbox_timeline.store_headers(loaded)
+                headers.update(loaded)
+        except Exception:
+            logger.warning("inbox_timeline_unavailable", exc_info=True)
+            return None
+        
+        # Mensagem já expurgada: some da página até o próximo rebuild
+        messages = [{**headers[item["message_id"]], **item} for item in items if item["message_id"] in headers]
+        last = items[-1] if items else None
+        next_cursor = (
+            _encode_inbox_cursor(last["read"], last["created_at"], last["id"]) if has_more else None
+        )
+        return messages, total, unread_count, next_cursor
+    
+    async def _rebuild_timeline(self, user_id: UUID) -> bool:
+        """Monta a timeline do usuário a partir do Postgres (até INBOX_TIMELINE_MAX_ITEMS)."""
+        watermark = await inbox_timeline.broadcast_watermark()
+        messages, _, _, next_cursor = await self._query_inbox(user_id, True, INBOX_TIMELINE_MAX_ITEMS, None)
+        if next_cursor is not None:
+            return False
+        await inbox_timeline.rebuild(user_id, watermark, messages)
+        await inbox_timeline.store_headers({
+            m["message_id"]: {key: m[key] for key in TIMELINE_HEADER_FIELDS} for m in messages
+        })
+        return True
+    
+    async def _message_headers(self, message_ids: list[UUID]) -> dict[str, dict]:
+        """Cabeçalhos (campos de TIMELINE_HEADER_FIELDS) das mensagens."""
+        rows = (await self.db.execute(
+            select(
+                InboxMessage.id,
+                InboxMessage.title,
+                _message_preview(),
+                InboxMessage.type,
+                InboxMessage.expires_at,
+                UserProfile.full_name.label("sender_name"),
+            )
+            .join(UserProfile, UserProfile.user_id == InboxMessage.created_by_user_id, isouter=True)
+            .where(InboxMessage.id.in_(message_ids))
+        )).all()
+        return {
+            str(row.id): {
+                "title": row.title,
+                "preview": row.preview,
+                "type": row.type.value,
+                "sender_name": row.sender_name or "Lumen+",
+                "expires_at": row.expires_at,
+            }
+            for row in rows
+        }
+    
+    async def get_unread_messages(self, user_id: UUID, limit: int = 10) -> list[dict]:
         """Retorna apenas mensagens não lidas."""
-        messages, _, _ = self.get_user_inbox(user_id, include_read=False, limit=limit)
+        messages, _, _, _ = await self.get_user_inbox(user_id, include_read=False, limit=limit)
         return messages
     
-    def mark_as_read(self, user_id: UUID, recipient_id: UUID) -> bool:
-        """Marca uma mensagem como lida."""
-        recipient = self.db.execute(
-            select(InboxRecipient)
+    async def get_message_body(self, user_id: UUID, message_id: UUID) -> dict | None:
+        """
+        Corpo e anexos de uma mensagem visível no inbox do usuário (recebida
+        e não dispensada, ou broadcast da sua audiência). O conteúdo não muda
+        depois de send_message, exceto os marcadores preenchidos com o perfil
+        (personalized).
+        Returns: dict ou None se não encontrada / fora do inbox
+        """
+        now = datetime.utcnow()
+        received = (
+            select(InboxRecipient.id)
             .where(
-                InboxRecipient.id == recipient_id,
-                InboxRecipient.user_id == user_id
+                _visible_recipients(user_id, now),
+                InboxRecipient.message_id == InboxMessage.id,
+                InboxRecipient.created_at == InboxMessage.created_at,
             )
-        ).scalar_one_or_none()
-        
-        if recipient and not recipient.read:
-            recipient.read = True
-            recipient.read_at = datetime.utcnow()
-            self.db.commit()
-            return True
-        return False
+            .exists()
+        )
+        broadcast = InboxMessage.id.in_(
+            _user_broadcasts(user_id, now)
+            .with_only_columns(InboxMessage.id)
+            .where(InboxMessage.id == message_id)
+            .correlate(None)
+        )
+        row = (await self.db.execute(
+            select(InboxMessage.id, InboxMessage.message, InboxMessage.attachments)
+            .where(
+                InboxMessage.id == message_id,
+                _unexpired(now, InboxMessage),
+                or_(received, broadcast),
+            )
+        )).first()
+        if row is None:
+            return None
+        message = row.message
+        personalized = has_placeholders(message)
+        if personalized:
+            message = render(message, await load_template_context(self.db, user_id))
+        return {"id": row.id, "message": message, "attachments": row.attachments, "personalized": personalized}
     
-    def mark_all_as_read(self, user_id: UUID) -> int:
-        """Marca todas as mensagens como lidas. Retorna quantidade atualizada."""
-        now = datetime.utcnow()
+    # === CONTADOR DE NÃO LIDAS ===
+    
+    async def get_unread_count(self, user_id: UUID) -> int:
+        """
+        Badge de não lidas: da timeline quando montada; senão leitura por PK
+        em inbox_unread_counters, menos as já expiradas que o expurgo ainda
+        não removeu, mais os broadcasts pendentes (poucos, pelo índice
+        parcial). As expiradas saem por range scan em ix_inbox_recipient_user_feed.
+        """
+        if inbox_timeline.enabled:
+            cutoff = datetime.utcnow() - timedelta(days=INBOX_EXPIRATION_DAYS)
+            try:
+                cached = await inbox_timeline.unread_count(user_id, cutoff)
+            except Exception:
+                logger.warning("inbox_timeline_unavailable", exc_info=True)
+                cached = None
+            if cached is not None:
+                return cached
         
-        # Buscar IDs dos recipients não lidos
-        recipients = self.db.execute(
-            select(InboxRecipient)
-            .join(InboxMessage, InboxRecipient.message_id == InboxMessage.id)
+        now = datetime.utcnow()
+        counter = (
+            select(InboxUnreadCounter.unread_count)
+            .where(InboxUnreadCounter.user_id == user_id)
+            .scalar_subquery()
+        )
+        # Expirada implica created_at <= now - INBOX_EXPIRATION_DAYS (só partições antigas)
+        expired = (
+            select(func.count())
             .where(
                 InboxRecipient.user_id == user_id,
-                InboxRecipient.read == False,
-                InboxMessage.expires_at > now
+                _counted_unread(),
+                InboxRecipient.created_at <= now - timedelta(days=INBOX_EXPIRATION_DAYS),
+                ~_unexpired(now),
             )
-        ).scalars().all()
+            .scalar_subquery()
+        )
+        pending = select(func.count()).select_from(_pending_broadcasts(user_id, now).subquery()).scalar_subquery()
+        count = (await self.db.execute(
+            select(func.greatest(func.coalesce(counter, 0) - expired, 0) + pending)
+        )).scalar()
+        return count or 0
+    
+    async def _decrement_unread(self, user_id: UUID, amount: int) -> None:
+        """Desconta leituras do contador (sem commit; vai na transação do chamador)."""
+        if amount <= 0:
+            return
+        await self.db.execute(
+            update(InboxUnreadCounter)
+            .where(InboxUnreadCounter.user_id == user_id)
+            .values(
+                unread_count=case(
+                    (InboxUnreadCounter.unread_count > amount, InboxUnreadCounter.unread_count - amount),
+                    else_=0,
+                ),
+                updated_at=func.now(),
+            )
+        )
+    
+    async def _subtract_unread(self, purged) -> None:
+        """
+        Desconta dos contadores as não lidas removidas pela expiração
+        (purged: colunas user_id e unread). Sem commit: vai na transação
+        que remove as linhas.
+        """
+        await self.db.execute(
+            update(InboxUnreadCounter)
+            .where(InboxUnreadCounter.user_id == purged.c.user_id)
+            .values(
+                unread_count=case(
+                    (InboxUnreadCounter.unread_count > purged.c.unread, InboxUnreadCounter.unread_count - purged.c.unread),
+                    else_=0,
+                ),
+                updated_at=func.now(),
+            )
+        )
+    
+    async def reconcile_unread_counters(self) -> int:
+        """
+        Recalcula os contadores a partir de inbox_recipients (expiradas
+        incluídas até o expurgo, como no ajuste incremental).
+        Returns: quantidade de contadores corrigidos
+        """
+        actual = (
+            select(
+                InboxRecipient.user_id,
+                func.count().filter(InboxRecipient.read == False),
+            )
+            .where(InboxRecipient.dismissed_at.is_(None))
+            .group_by(InboxRecipient.user_id)
+        )
+        upsert = pg_insert(InboxUnreadCounter).from_select(["user_id", "unread_count"], actual)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={"unread_count": upsert.excluded.unread_count, "updated_at": func.now()},
+            where=InboxUnreadCounter.unread_count != upsert.excluded.unread_count,
+        )
+        repaired = (await self.db.execute(upsert, execution_options={"preserve_rowcount": True})).rowcount
         
-        count = 0
-        for recipient in recipients:
-            recipient.read = True
-            recipient.read_at = now
-            count += 1
+        # Usuários sem nenhum destinatário não dispensado
+        orphaned = (await self.db.execute(
+            update(InboxUnreadCounter)
+            .where(
+                InboxUnreadCounter.unread_count != 0,
+                ~select(InboxRecipient.id)
+                .where(InboxRecipient.user_id == InboxUnreadCounter.user_id, InboxRecipient.dismissed_at.is_(None))
+                .exists(),
+            )
+            .values(unread_count=0, updated_at=func.now())
+        )).rowcount
         
-        self.db.commit()
+        await self.db.commit()
+        return max(repaired, 0) + max(orphaned, 0)
+    
+    async def mark_as_read(self, user_id: UUID, recipient_id: UUID) -> bool:
+        """Marca uma mensagem como lida (id do destinatário ou do broadcast)."""
+        return await self.mark_many_as_read(user_id, [recipient_id]) == 1
+    
+    async def mark_many_as_read(self, user_id: UUID, recipient_ids: list[UUID], commit: bool = True) -> int:
+        """Marca vários destinatários do usuário como lidos num único UPDATE."""
+        if not recipient_ids:
+            return 0
+        count = await self._mark_read(user_id, recipient_ids)
+        if commit:
+            await self.db.commit()
+            await _update_timeline(inbox_timeline.mark_read, user_id, recipient_ids, datetime.utcnow())
         return count
     
+    async def mark_all_as_read(self, user_id: UUID) -> int:
+        """Marca todas as mensagens como lidas. Retorna quantidade atualizada."""
+        count = await self._mark_read(user_id)
+        await self.db.commit()
+        await _update_timeline(inbox_timeline.mark_read, user_id, None, datetime.utcnow())
+        return count
+    
+    async def _mark_read(self, user_id: UUID, ids: list[UUID] | None = None) -> int:
+        """
+        UPDATE set-based das não lidas (todas ou as de ids) + contador e
+        estatísticas (sem commit). Broadcasts pendentes são marcados no
+        bitmap de leitura.
+        """
+        now = datetime.utcnow()
+        stmt = (
+            update(InboxRecipient)
+            .where(_visible_recipients(user_id, now), InboxRecipient.read == False)
+            .values(read=True, read_at=now)
+            .returning(InboxRecipient.message_id)
+            .execution_options(synchronize_session=False)
+        )
+        if ids is not None:
+            stmt = stmt.where(InboxRecipient.id.in_(ids))
+        message_ids = (await self.db.execute(stmt)).scalars().all()
+        await self._decrement_unread(user_id, len(message_ids))
+        
+        broadcast_ids = []
+        if ids is None or len(message_ids) < len(set(ids)):
+            broadcast_ids = await self._mark_broadcasts_read(user_id, now, ids)
+        
+        await self._record_reads(Counter(message_ids) + Counter(broadcast_ids), now)
+        return len(message_ids) + len(broadcast_ids)
+    
+    async def dismiss(self, user_id: UUID, item_id: UUID) -> bool:
+        """Remove um aviso do inbox do usuário (id do destinatário ou do broadcast)."""
+        now = datetime.utcnow()
+        was_read = (await self.db.execute(
+            update(InboxRecipient)
+            .where(_visible_recipients(user_id, now), InboxRecipient.id == item_id)
+            .values(dismissed_at=now)
+            .returning(InboxRecipient.read)
+            .execution_options(synchronize_session=False)
+        )).scalar()
+        
+        if was_read is not None:
+            if not was_read:
+                await self._decrement_unread(user_id, 1)
+            dismissed = True
+        else:
+            dismissed = await self._dismiss_broadcast(user_id, now, item_id)
+        
+        await self.db.commit()
+        if dismissed:
+            await _update_timeline(inbox_timeline.remove, user_id, item_id)
+        return dismissed
+    
+    async def _mark_broadcasts_read(
+        self, user_id: UUID, now: datetime, message_ids: list[UUID] | None,
+    ) -> list[UUID]:
+        """
+        Liga o bit do usuário no bitmap dos broadcasts pendentes (todos ou os
+        de message_ids), sem commit. Broadcasts não entram no contador.
+        Returns: message_ids marcados agora
+        """
+        # No ON CONFLICT só a linha existente está no escopo
+        seq = select(User.inbox_seq).where(User.id == user_id).scalar_subquery()
+        bit = seq % INBOX_READ_BITMAP_CHUNK
+        
+        pending = _pending_broadcasts(user_id, now)
+        if message_ids is not None:
+            pending = pending.where(InboxMessage.id.in_(message_ids))
+        rows = pending.with_only_columns(
+            InboxMessage.id,
+            User.inbox_seq // INBOX_READ_BITMAP_CHUNK,
+            func.set_bit(
+                literal(bytes(INBOX_READ_BITMAP_CHUNK // 8), LargeBinary),
+                User.inbox_seq % INBOX_READ_BITMAP_CHUNK,
+                1,
+            ),
+        )
+        stmt = pg_insert(InboxReadBitmap).from_select(["message_id", "chunk", "bits"], rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["message_id", "chunk"],
+            set_={"bits": func.set_bit(InboxReadBitmap.bits, bit, 1)},
+            # Leitura concorrente já ligou o bit: não conta de novo
+            where=func.get_bit(InboxReadBitmap.bits, bit) == 0,
+        ).returning(InboxReadBitmap.message_id)
+        return (await self.db.execute(stmt)).scalars().all()
+    
+    async def _dismiss_broadcast(self, user_id: UUID, now: datetime, message_id: UUID) -> bool:
+        """
+        Grava a linha de estado (dispensada) do usuário para o broadcast, lido
+        ou não, sem commit. Nunca entra no contador.
+        """
+        rows = (
+            _user_broadcasts(user_id, now)
+            .where(InboxMessage.id == message_id)
+            .with_only_columns(
+                InboxMessage.id,
+                literal(user_id, InboxRecipient.user_id.type),
+                InboxMessage.created_at,
+                InboxMessage.expires_at,
+                _broadcast_read(),
+                literal(now, InboxRecipient.dismissed_at.type),
+            )
+        )
+        stmt = (
+            pg_insert(InboxRecipient)
+            .from_select(
+                ["message_id", "user_id", "created_at", "expires_at", "read", "dismissed_at"],
+                rows,
+            )
+            .on_conflict_do_nothing(index_elements=["message_id", "user_id", "created_at"])
+            .returning(InboxRecipient.message_id)
+        )
+        return bool((await self.db.execute(stmt)).scalars().all())
+    
+    async def _record_reads(self, reads: Counter, read_at: datetime) -> None:
+        """Soma leituras em inbox_message_stats e no bucket da hora (sem commit)."""
+        if not reads:
+            return
+        bucket_start = read_at.replace(minute=0, second=0, microsecond=0)
+        
+        stats = pg_insert(InboxMessageStats).values([
+            {"message_id": message_id, "read_count": n, "first_read_at": read_at, "last_read_at": read_at}
+            for message_id, n in reads.items()
+        ])
+        stats = stats.on_conflict_do_update(
+            index_elements=["message_id"],
+            set_={
+                "read_count": InboxMessageStats.read_count + stats.excluded.read_count,
+                "first_read_at": func.coalesce(InboxMessageStats.first_read_at, stats.excluded.first_read_at),
+                "last_read_at": stats.excluded.last_read_at,
+            },
+        )
+        await self.db.execute(stats)
+        
+        buckets = pg_insert(InboxMessageReadBucket).values([
+            {"message_id": message_id, "bucket_start": bucket_start, "read_count": n}
+            for message_id, n in reads.items()
+        ])
+        buckets = buckets.on_conflict_do_update(
+            index_elements=["message_id", "bucket_start"],
+            set_={"read_count": InboxMessageReadBucket.read_count + buckets.excluded.read_count},
+        )
+        await self.db.execute(buckets)
+    
     # === ENVIO DE AVISOS ===
     
-    def get_filter_options(self) -> dict:
-        """Retorna opções disponíveis para filtros de segmentação."""
-        # Realidades vocacionais
-        vocational = self.db.execute(
-            select(ProfileCatalogItem)
+    async def get_filter_options(self) -> dict:
+        """
+        Retorna opções disponíveis para filtros de segmentação, com a
+        quantidade de usuários ativos em cada uma (de inbox_filter_facets).
+        """
+        items = (await self.db.execute(
+            select(ProfileCatalog.code.label("catalog"), ProfileCatalogItem)
             .join(ProfileCatalogItem.catalog)
-            .where(ProfileCatalogItem.catalog.has(code="VOCATIONAL_REALITY"))
+            .where(ProfileCatalog.code.in_(FACET_CATALOGS))
             .where(ProfileCatalogItem.is_active == True)
             .order_by(ProfileCatalogItem.sort_order)
-        ).scalars().all()
+        )).all()
+        facets = (await self.db.execute(
+            select(InboxFilterFacet.field, InboxFilterFacet.value, InboxFilterFacet.user_count)
+            .where(InboxFilterFacet.user_count > 0)
+            .order_by(InboxFilterFacet.field, InboxFilterFacet.value)
+        )).all()
         
-        # Estados de vida
-        life_states = self.db.execute(
-            select(ProfileCatalogItem)
-            .join(ProfileCatalogItem.catalog)
-            .where(ProfileCatalogItem.catalog.has(code="LIFE_STATE"))
-            .where(ProfileCatalogItem.is_active == True)
-            .order_by(ProfileCatalogItem.sort_order)
-        ).scalars().all()
+        options: dict[str, Any] = {key: [] for _, key in FACET_CATALOGS.values()}
+        item_codes: dict[str, str] = {}
+        for catalog, item in items:
+            options[FACET_CATALOGS[catalog][1]].append({"code": item.code, "label": item.label})
+            item_codes[str(item.id)] = item.code
         
-        # Estados civis
-        marital = self.db.execute(
-            select(ProfileCatalogItem)
-            .join(ProfileCatalogItem.catalog)
-            .where(ProfileCatalogItem.catalog.has(code="MARITAL_STATUS"))
-            .where(ProfileCatalogItem.is_active == True)
-            .order_by(ProfileCatalogItem.sort_order)
-        ).scalars().all()
-        
-        # Estados (UF) únicos dos perfis
-        states = self.db.execute(
-            select(UserProfile.state)
-            .where(UserProfile.state.isnot(None))
-            .distinct()
-            .order_by(UserProfile.state)
-        ).scalars().all()
-        
-        # Cidades únicas dos perfis
-        cities = self.db.execute(
-            select(UserProfile.city)
-            .where(UserProfile.city.isnot(None))
-            .distinct()
-            .order_by(UserProfile.city)
-        ).scalars().all()
+        # Catálogos contam por código; UF e cidade pelo próprio valor
+        counts: dict[str, dict[str, int]] = {field: {} for field in FACET_COLUMNS}
+        for field, value, user_count in facets:
+            if field not in ("state", "city"):
+                value = item_codes.get(value)
+                if value is None:  # item inativo ou removido
+                    continue
+            counts[field][value] = user_count
         
         return {
-            "vocational_realities": [{"code": v.code, "label": v.label} for v in vocational],
-            "life_states": [{"code": l.code, "label": l.label} for l in life_states],
-            "marital_statuses": [{"code": m.code, "label": m.label} for m in marital],
-            "states": list(states),
-            "cities": list(cities),
+            **options,
+            "states": list(counts["state"]),
+            "cities": list(counts["city"]),
+            "counts": counts,
         }
     
-    def _get_recipient_user_ids(self, send_to_all: bool, filters: InboxFilters | None) -> list[UUID]:
-        """Retorna lista de user_ids baseado nos filtros."""
-        query = select(User.id).join(UserProfile, User.id == UserProfile.user_id, isouter=True)
+    async def reconcile_filter_facets(self) -> int:
+        """
+        Recalcula inbox_filter_facets a partir de user_profiles (corrige
+        desvios e usuários ativados/desativados desde a última execução).
+        Returns: quantidade de facetas corrigidas
+        """
+        actual = union_all(*(
+            select(
+                literal(field).label("field"),
+                cast(column, Text).label("value"),
+                func.count().label("user_count"),
+            )
+            .join(User, and_(User.id == UserProfile.user_id, User.is_active == True))
+            .where(column.isnot(None))
+            .group_by(column)
+            for field, column in FACET_COLUMNS.items()
+        )).subquery()
+        
+        upsert = pg_insert(InboxFilterFacet).from_select(
+            ["field", "value", "user_count"], select(actual).where(actual.c.user_count > 0),
+        )
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["field", "value"],
+            set_={"user_count": upsert.excluded.user_count},
+            where=InboxFilterFacet.user_count != upsert.excluded.user_count,
+        )
+        repaired = (await self.db.execute(upsert, execution_options={"preserve_rowcount": True})).rowcount
+        
+        # Valores que nenhum usuário ativo tem mais
+        stale = (await self.db.execute(
+            delete(InboxFilterFacet).where(
+                tuple_(InboxFilterFacet.field, InboxFilterFacet.value)
+                .not_in(select(actual.c.field, actual.c.value))
+            )
+        )).rowcount
+        
+        await self.db.commit()
+        repaired = max(repaired, 0) + max(stale, 0)
+        if repaired:
+            bump_filter_options_version()
+        return repaired
+    
+    def _recipients_query(self, send_to_all: bool, filters: InboxFilters | None) -> Select | None:
+        """SELECT dos user_ids destinatários (sem materializar em Python)."""
+        query = (
+            select(User.id)
+            .select_from(User)
+            .join(UserProfile, User.id == UserProfile.user_id, isouter=True)
+        )
         
         if send_to_all:
             # Todos os usuários ativos
-            query = query.where(User.is_active == True)
-        elif filters:
-            conditions = [User.is_active == True]
-            
-            # Filtro por realidade vocacional
-            if filters.vocational_reality_codes:
-                subq = select(ProfileCatalogItem.id).where(
-                    ProfileCatalogItem.code.in_(filters.vocational_reality_codes)
-                )
-                conditions.append(UserProfile.vocational_reality_item_id.in_(subq))
-            
-            # Filtro por estado de vida
-            if filters.life_state_codes:
-                subq = select(ProfileCatalogItem.id).where(
-                    ProfileCatalogItem.code.in_(filters.life_state_codes)
+            return query.where(User.is_active == True)
+        if not filters:
+            return None
+        
+        conditions = [User.is_active == True]
+        
+        # Filtro por realidade vocacional
+        if filters.vocational_reality_codes:
+            subq = select(ProfileCatalogItem.id).where(
+                ProfileCatalogItem.code.in_(filters.vocational_reality_codes)
+            )
+            conditions.append(UserProfile.vocational_reality_item_id.in_(subq))
+        
+        # Filtro por estado de vida
+        if filters.life_state_codes:
+            subq = select(ProfileCatalogItem.id).where(
+                ProfileCatalogItem.code.in_(filters.life_state_codes)
+            )
+            conditions.append(UserProfile.life_state_item_id.in_(subq))
+        
+        # Filtro por estado civil
+        if filters.marital_status_codes:
+            subq = select(ProfileCatalogItem.id).where(
+                ProfileCatalogItem.code.in_(filters.marital_status_codes)
+            )
+            conditions.append(UserProfile.marital_status_item_id.in_(subq))
+        
+        # Filtro por UF
+        if filters.states:
+            conditions.append(UserProfile.state.in_(filters.states))
+        
+        # Filtro por cidade
+        if filters.cities:
+            conditions.append(UserProfile.city.in_(filters.cities))
+        
+        # Filtro por unidade organizacional (subárvore pela closure table)
+        if filters.org_unit_ids:
+            if filters.include_descendants:
+                unit_ids = select(OrgUnitClosure.descendant_id).where(
+                    OrgUnitClosure.ancestor_id.in_(filters.org_unit_ids)
                 )
-                conditions.append(UserProfile.life_state_item_id.in_(subq))
-            
-            # Filtro por estado civil
-            if filters.marital_status_codes:
-                subq = select(ProfileCatalogItem.id).where(
-                    ProfileCatalogItem.code.in_(filters.marital_status_codes)
+            else:
+                unit_ids = filters.org_unit_ids
+            members = (
+                select(OrgMembership.user_id)
+                .join(OrgUnit, OrgUnit.id == OrgMembership.org_unit_id)
+                .where(
+                    OrgMembership.org_unit_id.in_(unit_ids),
+                    OrgMembership.status == MembershipStatus.ACTIVE,
+                    OrgUnit.is_active == True,
                 )
-                conditions.append(UserProfile.marital_status_item_id.in_(subq))
-            
-            # Filtro por UF
-            if filters.states:
-                conditions.append(UserProfile.state.in_(filters.states))
-            
-            # Filtro por cidade
-            if filters.cities:
-                conditions.append(UserProfile.city.in_(filters.cities))
-            
-            query = query.where(and_(*conditions))
-        else:
-            return []
+            )
+            conditions.append(User.id.in_(members))
         
-        return list(self.db.execute(query).scalars().all())
+        return query.where(and_(*conditions))
     
-    def preview_send(self, send_to_all: bool, filters: InboxFilters | None) -> int:
-        """Retorna quantos usuários receberão o aviso."""
-        user_ids = self._get_recipient_user_ids(send_to_all, filters)
-        return len(user_ids)
+    async def preview_send(self, send_to_all: bool, filters: InboxFilters | None) -> int:
+        """
+        Retorna quantos usuários receberão o aviso. Pelo índice em memória
+        quando já construído (ele não cobre unidades organizacionais);
+        senão, COUNT no banco.
+        """
+        if segment_index.is_ready and not (filters and filters.org_unit_ids):
+            return segment_index.count(send_to_all, filters)
+        query = self._recipients_query(send_to_all, filters)
+        if query is None:
+            return 0
+        count_query = select(func.count()).select_from(query.subquery())
+        return (await self.db.execute(count_query)).scalar() or 0
     
-    def send_message(
+    async def send_message(
         self,
         title: str,
         message: str,
@@ -322,101 +1088,802 @@ class InboxService:
         send_to_all: bool,
         filters: InboxFilters | None = None,
         attachments: list[dict] | None = None,
-    ) -> tuple[UUID, int]:
+        send_at: datetime | None = None,
+        delivery_rate: int | None = None,
+    ) -> tuple[UUID, int, InboxDeliveryStatus]:
         """
-        Envia uma mensagem para os destinatários.
-        Returns: (message_id, recipient_count)
+        Cria a mensagem com status PENDING; os destinatários são gravados
+        depois por deliver_message (em background ou pelo despachante).
+        
+        send_to_all vira broadcast: um único INSERT, já SENT, sem fan-out;
+        o inbox de cada usuário o inclui na leitura.
+        
+        send_at no futuro agenda o envio: created_at (e a expiração) partem
+        dele, e a mensagem fica PENDING até o despachante liberá-la.
+        
+        Título e conteúdo são gravados como enviados; marcadores {{campo}}
+        são preenchidos na leitura (inbox_templates).
+        Returns: (message_id, recipient_count estimado, delivery_status)
         """
+        unknown = unknown_fields(title) + unknown_fields(message)
+        if unknown:
+            raise ValueError(f"Campos desconhecidos no aviso: {', '.join(sorted(set(unknown)))}")
+
+        now = datetime.utcnow()
+        if send_at is not None and send_at.tzinfo is not None:
+            send_at = send_at.astimezone(timezone.utc).replace(tzinfo=None)
+        scheduled = send_at is not None and send_at > now
+        if scheduled and send_at > now + timedelta(days=INBOX_SCHEDULE_MAX_DAYS):
+            raise ValueError(f"send_at deve estar nos próximos {INBOX_SCHEDULE_MAX_DAYS} dias")
+        sent_at = send_at if scheduled else now
+        status = InboxDeliveryStatus.SENT if send_to_all and not scheduled else InboxDeliveryStatus.PENDING
+
         # Converter tipo
         try:
             msg_type = InboxMessageType(message_type)
         except ValueError:
             msg_type = InboxMessageType.INFO
         
+        recipient_count = await self.preview_send(send_to_all, filters)
+        
         # Criar mensagem
         inbox_message = InboxMessage(
             title=title,
             message=message,
             type=msg_type,
             created_by_user_id=created_by_user_id,
-            expires_at=datetime.utcnow() + timedelta(days=INBOX_EXPIRATION_DAYS),
+            expires_at=sent_at + timedelta(days=INBOX_EXPIRATION_DAYS),
             attachments=attachments,
-            filters=filters.model_dump() if filters else None,
+            filters=filters.model_dump(mode="json") if filters else None,
+            delivery_status=status,
+            recipient_count=recipient_count,
+            delivered_count=recipient_count if status == InboxDeliveryStatus.SENT else 0,
+            delivery_rate=delivery_rate,
+            is_broadcast=send_to_all,
+            # Relógio da aplicação, o mesmo das comparações de vencimento
+            created_at=sent_at,
         )
         self.db.add(inbox_message)
-        self.db.flush()  # Para obter o ID
-        
-        # Buscar destinatários
-        user_ids = self._get_recipient_user_ids(send_to_all, filters)
+        if send_to_all:
+            await self.db.flush()
+            self.db.add(InboxMessageStats(message_id=inbox_message.id, recipient_count=recipient_count))
+        await self.db.commit()
+        if status == InboxDeliveryStatus.SENT:
+            await _update_timeline(inbox_timeline.add_broadcast, inbox_message.id, inbox_message.created_at)
         
-        # Criar recipients
-        for user_id in user_ids:
-            recipient = InboxRecipient(
-                message_id=inbox_message.id,
-                user_id=user_id,
+        return inbox_message.id, recipient_count, status
+    
+    async def cancel_scheduled_message(self, message_id: UUID, created_by_user_id: UUID) -> bool | None:
+        """
+        Cancela (remove) uma mensagem do usuário que o fan-out ainda não
+        pegou. Concorre com a reserva de deliver_message pela mesma linha:
+        só um dos dois vê PENDING.
+        Returns: True se cancelada, False se já em distribuição/enviada,
+        None se não encontrada
+        """
+        deleted = (await self.db.execute(
+            delete(InboxMessage)
+            .where(
+                InboxMessage.id == message_id,
+                InboxMessage.created_by_user_id == created_by_user_id,
+                InboxMessage.delivery_status == InboxDeliveryStatus.PENDING,
             )
-            self.db.add(recipient)
+            .returning(InboxMessage.id)
+        )).scalars().all()
+        if not deleted:
+            await self.db.rollback()
+            exists = await self.get_delivery_status(message_id, created_by_user_id)
+            return None if exists is None else False
+        await self._delete_message_stats([message_id])
+        await self.db.commit()
+        return True
+    
+    async def deliver_message(
+        self,
+        message_id: UUID,
+        send_to_all: bool,
+        filters: InboxFilters | None = None,
+        chunk_size: int = INBOX_FANOUT_CHUNK_SIZE,
+        rate: int | None = None,
+    ) -> int:
+        """
+        Fan-out com INSERT ... SELECT em faixas de users.id.
+        Cada faixa é uma transação curta e atualiza delivered_count; com rate
+        (destinatários por segundo) as faixas encolhem e são espaçadas.
+        
+        Só distribui mensagem PENDING já vencida (reserva PENDING -> SENDING
+        com lease): a tarefa da requisição e o despachante podem pegar a
+        mesma mensagem. O heartbeat é renovado a cada faixa. Interrompida no
+        shutdown, volta a PENDING; processo morto deixa SENDING e o
+        despachante a retoma quando o lease vence. Reinserir é seguro
+        (ON CONFLICT e contadores só para quem não tem a mensagem).
+        Returns: destinatários entregues, incluindo execuções anteriores
+        """
+        now = datetime.utcnow()
+        claimed = (await self.db.execute(
+            update(InboxMessage)
+            .where(InboxMessage.id == message_id, _due_for_delivery(now))
+            .values(delivery_status=InboxDeliveryStatus.SENDING, delivery_heartbeat_at=now)
+            .returning(InboxMessage.delivered_count)
+        )).first()
+        await self.db.commit()
+        if claimed is None:
+            return 0
+        
+        query = self._recipients_query(send_to_all, filters)
+        if rate:
+            chunk_size = min(chunk_size, rate)
         
-        self.db.commit()
+        # Retomada: as faixas já entregues não inserem de novo
+        delivered = claimed.delivered_count
+        last_user_id: UUID | None = None
+        try:
+            while query is not None:
+                started = time.monotonic()
+                chunk = query if last_user_id is None else query.where(User.id > last_user_id)
+                
+                # Último id da faixa; None = o restante cabe neste chunk
+                boundary = (await self.db.execute(
+                    chunk.order_by(User.id).offset(chunk_size - 1).limit(1)
+                )).scalar()
+                if boundary is not None:
+                    chunk = chunk.where(User.id <= boundary)
+                
+                rows = (
+                    chunk.with_only_columns(
+                        InboxMessage.id, User.id, InboxMessage.created_at, InboxMessage.expires_at
+                    )
+                    .join(InboxMessage, InboxMessage.id == message_id)
+                )
+                # Contadores primeiro: só usuários que ainda não têm a mensagem
+                new_users = chunk.with_only_columns(User.id, literal(1)).where(
+                    ~select(InboxRecipient.id)
+                    .where(InboxRecipient.message_id == message_id, InboxRecipient.user_id == User.id)
+                    .exists()
+                )
+                counter_stmt = pg_insert(InboxUnreadCounter).from_select(["user_id", "unread_count"], new_users)
+                counter_stmt = counter_stmt.on_conflict_do_update(
+                    index_elements=["user_id"],
+                    set_={
+                        "unread_count": InboxUnreadCounter.unread_count + counter_stmt.excluded.unread_count,
+                        "updated_at": func.now(),
+                    },
+                )
+                await self.db.execute(counter_stmt)
+                
+                insert_stmt = (
+                    pg_insert(InboxRecipient)
+                    .from_select(["message_id", "user_id", "created_at", "expires_at"], rows)
+                    .on_conflict_do_nothing(index_elements=["message_id", "user_id", "created_at"])
+                )
+                recipients = []
+                if inbox_timeline.enabled:
+                    insert_stmt = insert_stmt.returning(
+                        InboxRecipient.id, InboxRecipient.user_id, InboxRecipient.created_at,
+                    )
+                    recipients = (await self.db.execute(insert_stmt)).all()
+                    inserted = len(recipients)
+                else:
+                    # INSERT sem RETURNING: o rowcount só é lido com preserve_rowcount
+                    inserted = max((await self.db.execute(
+                        insert_stmt, execution_options={"preserve_rowcount": True}
+                    )).rowcount, 0)
+                
+                stats_stmt = pg_insert(InboxMessageStats).values(message_id=message_id, recipient_count=inserted)
+                stats_stmt = stats_stmt.on_conflict_do_update(
+                    index_elements=["message_id"],
+                    set_={"recipient_count": InboxMessageStats.recipient_count + stats_stmt.excluded.recipient_count},
+                )
+                await self.db.execute(stats_stmt)
+                
+                delivered += inserted
+                await self._set_delivery(
+                    message_id, delivered_count=delivered, delivery_heartbeat_at=datetime.utcnow(),
+                )
+                if recipients:
+                    await _update_timeline(
+                        inbox_timeline.add_items,
+                        message_id,
+                        recipients[0].created_at,
+                        [(row.id, row.user_id) for row in recipients],
+                    )
+                
+                if boundary is None:
+                    break
+                last_user_id = boundary
+                if rate:
+                    await asyncio.sleep(max(0.0, inserted / rate - (time.monotonic() - started)))
+        except asyncio.CancelledError:
+            await self.db.rollback()
+            await self._set_delivery(message_id, delivery_status=InboxDeliveryStatus.PENDING)
+            raise
+        except Exception:
+            await self.db.rollback()
+            await self._set_delivery(message_id, delivery_status=InboxDeliveryStatus.FAILED)
+            raise
         
-        return inbox_message.id, len(user_ids)
+        await self._set_delivery(message_id, delivery_status=InboxDeliveryStatus.SENT)
+        return delivered
     
-    def get_sent_messages(self, user_id: UUID, limit: int = 20) -> list[dict]:
-        """Retorna mensagens enviadas por um usuário."""
-        messages = self.db.execute(
-            select(InboxMessage)
-            .where(InboxMessage.created_by_user_id == user_id)
-            .order_by(InboxMessage.created_at.desc())
+    async def due_messages(self, limit: int = INBOX_DISPATCH_BATCH_SIZE) -> list:
+        """
+        Mensagens PENDING com horário de envio vencido e SENDING com lease
+        vencido (ix_inbox_messages_pending / ix_inbox_messages_sending).
+        """
+        now = datetime.utcnow()
+        return (await self.db.execute(
+            select(
+                InboxMessage.id,
+                InboxMessage.created_at,
+                InboxMessage.is_broadcast,
+                InboxMessage.filters,
+                InboxMessage.delivery_rate,
+            )
+            .where(_due_for_delivery(now), _unexpired(now, InboxMessage))
+            .order_by(InboxMessage.created_at)
             .limit(limit)
-        ).scalars().all()
-        
-        result = []
-        for msg in messages:
-            # Contar destinatários
-            recipient_count = self.db.execute(
-                select(func.count())
-                .select_from(InboxRecipient)
-                .where(InboxRecipient.message_id == msg.id)
-            ).scalar() or 0
-            
-            # Contar lidos
-            read_count = self.db.execute(
-                select(func.count())
-                .select_from(InboxRecipient)
-                .where(
-                    InboxRecipient.message_id == msg.id,
-                    InboxRecipient.read == True
+        )).all()
+    
+    async def release_broadcast(self, message_id: UUID, created_at: datetime) -> bool:
+        """
+        Broadcast agendado vencido: já entra no inbox pela data; aqui só vira
+        SENT e é publicado para as timelines em cache.
+        """
+        released = await self.db.execute(
+            update(InboxMessage)
+            .where(
+                InboxMessage.id == message_id,
+                InboxMessage.delivery_status == InboxDeliveryStatus.PENDING,
+            )
+            .values(delivery_status=InboxDeliveryStatus.SENT, delivered_count=InboxMessage.recipient_count)
+        )
+        await self.db.commit()
+        if released.rowcount:
+            await _update_timeline(inbox_timeline.add_broadcast, message_id, created_at)
+        return bool(released.rowcount)
+    
+    async def _set_delivery(self, message_id: UUID, **values: Any) -> None:
+        await self.db.execute(
+            update(InboxMessage).where(InboxMessage.id == message_id).values(**values)
+        )
+        await self.db.commit()
+    
+    async def get_delivery_status(self, message_id: UUID, created_by_user_id: UUID) -> dict | None:
+        """Progresso da distribuição de uma mensagem enviada pelo usuário."""
+        row = (await self.db.execute(
+            select(
+                InboxMessage.delivery_status,
+                InboxMessage.recipient_count,
+                InboxMessage.delivered_count,
+            )
+            .where(
+                InboxMessage.id == message_id,
+                InboxMessage.created_by_user_id == created_by_user_id,
+            )
+        )).one_or_none()
+        
+        if row is None:
+            return None
+        return {
+            "message_id": message_id,
+            "status": row.delivery_status.value,
+            "recipient_count": row.recipient_count,
+            "delivered_count": row.delivered_count,
+        }
+    
+    async def get_sent_messages(
+        self,
+        user_id: UUID,
+        limit: int = 20,
+        cursor: str | None = None,
+    ) -> tuple[list[dict], str | None]:
+        """
+        Retorna mensagens enviadas por um usuário com as estatísticas de
+        leitura, numa única consulta paginada por cursor (created_at, id).
+        Returns: (messages, next_cursor)
+        """
+        query = (
+            select(
+                InboxMessage.id,
+                InboxMessage.title,
+                InboxMessage.message,
+                InboxMessage.type,
+                InboxMessage.created_at,
+                InboxMessage.expires_at,
+                InboxMessage.delivery_status,
+                InboxMessage.delivered_count,
+                InboxMessage.filters,
+                func.coalesce(InboxMessageStats.recipient_count, 0).label("recipient_count"),
+                func.coalesce(InboxMessageStats.read_count, 0).label("read_count"),
+                InboxMessageStats.first_read_at,
+            )
+            .join(InboxMessageStats, InboxMessageStats.message_id == InboxMessage.id, isouter=True)
+            .where(InboxMessage.created_by_user_id == user_id)
+        )
+        if cursor:
+            query = query.where(tuple_(InboxMessage.created_at, InboxMessage.id) < tuple_(*_decode_sent_cursor(cursor)))
+        query = query.order_by(InboxMessage.created_at.desc(), InboxMessage.id.desc()).limit(limit + 1)
+        
+        rows = (await self.db.execute(query)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        result = [
+            {
+                "id": str(row.id),
+                "title": row.title,
+                "message": row.message,
+                "type": row.type.value,
+                "created_at": row.created_at,
+                "expires_at": row.expires_at,
+                "recipient_count": row.recipient_count,
+                "read_count": row.read_count,
+                "read_rate": _read_rate(row.read_count, row.recipient_count),
+                "first_read_at": row.first_read_at,
+                "delivery_status": row.delivery_status.value,
+                "delivered_count": row.delivered_count,
+                "filters": row.filters,
+            }
+            for row in rows
+        ]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        return result, next_cursor
+    
+    async def get_message_stats(self, message_id: UUID, created_by_user_id: UUID) -> dict | None:
+        """Estatísticas de leitura de uma mensagem enviada, com a curva por hora."""
+        stats = (await self.db.execute(
+            select(
+                func.coalesce(InboxMessageStats.recipient_count, 0).label("recipient_count"),
+                func.coalesce(InboxMessageStats.read_count, 0).label("read_count"),
+                InboxMessageStats.first_read_at,
+                InboxMessageStats.last_read_at,
+            )
+            .select_from(InboxMessage)
+            .join(InboxMessageStats, InboxMessageStats.message_id == InboxMessage.id, isouter=True)
+            .where(
+                InboxMessage.id == message_id,
+                InboxMessage.created_by_user_id == created_by_user_id,
+            )
+        )).one_or_none()
+        
+        if stats is None:
+            return None
+        
+        curve = (await self.db.execute(
+            select(InboxMessageReadBucket.bucket_start, InboxMessageReadBucket.read_count)
+            .where(InboxMessageReadBucket.message_id == message_id)
+            .order_by(InboxMessageReadBucket.bucket_start)
+        )).all()
+        
+        return {
+            "message_id": message_id,
+            "recipient_count": stats.recipient_count,
+            "read_count": stats.read_count,
+            "read_rate": _read_rate(stats.read_count, stats.recipient_count),
+            "first_read_at": stats.first_read_at,
+            "last_read_at": stats.last_read_at,
+            "read_curve": [
+                {"bucket_start": bucket_start, "read_count": read_count}
+                for bucket_start, read_count in curve
+            ],
+        }
+    
+    # === LIMPEZA ===
+    
+    async def cleanup_expired_messages(self, batch_size: int = INBOX_PURGE_BATCH_SIZE) -> int:
+        """
+        Remove mensagens expiradas em lotes curtos (commit entre lotes).
+        Caminho para bancos sem particionamento; no Postgres a expiração é
+        feita por drop_expired_partitions.
+        
+        Primeiro os destinatários (DELETE ... WHERE id IN (SELECT ... LIMIT n
+        FOR UPDATE SKIP LOCKED)), depois as mensagens já sem destinatários.
+        SKIP LOCKED deixa vários workers rodarem ao mesmo tempo sem disputar
+        as mesmas linhas. Progresso em purge_progress.
+        Returns: quantidade de mensagens removidas
+        """
+        now = datetime.utcnow()
+        progress = purge_progress
+        progress.start()
+        
+        expired_ids = select(InboxMessage.id).where(InboxMessage.expires_at < now)
+        
+        try:
+            while True:
+                batch = (
+                    select(InboxRecipient.id)
+                    .where(InboxRecipient.message_id.in_(expired_ids))
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
                 )
-            ).scalar() or 0
+                deleted = (await self.db.execute(
+                    delete(InboxRecipient)
+                    .where(InboxRecipient.id.in_(batch))
+                    .returning(InboxRecipient.user_id, _counted_unread())
+                    .execution_options(synchronize_session=False)
+                )).all()
+                # Não lidas removidas saem do contador no mesmo lote
+                unread = Counter(user_id for user_id, counted in deleted if counted)
+                if unread:
+                    await self._subtract_unread(
+                        values(column("user_id", Uuid), column("unread", Integer), name="purged")
+                        .data(list(unread.items()))
+                    )
+                await self.db.commit()
+                
+                progress.batches += 1
+                progress.recipients_deleted += len(deleted)
+                if len(deleted) < batch_size:
+                    break
             
-            result.append({
-                "id": str(msg.id),
-                "title": msg.title,
-                "message": msg.message,
-                "type": msg.type.value,
-                "created_at": msg.created_at,
-                "expires_at": msg.expires_at,
-                "recipient_count": recipient_count,
-                "read_count": read_count,
-                "filters": msg.filters,
-            })
-        
-        return result
+            while True:
+                batch = (
+                    expired_ids
+                    .where(~select(InboxRecipient.id).where(InboxRecipient.message_id == InboxMessage.id).exists())
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                deleted = (await self.db.execute(
+                    delete(InboxMessage)
+                    .where(InboxMessage.id.in_(batch))
+                    .returning(InboxMessage.id)
+                    .execution_options(synchronize_session=False)
+                )).scalars().all()
+                if deleted:
+                    await self._delete_message_stats(deleted)
+                await self.db.commit()
+                
+                progress.batches += 1
+                progress.messages_deleted += len(deleted)
+                if len(deleted) < batch_size:
+                    break
+        finally:
+            progress.finish()
+        
+        return progress.messages_deleted
     
-    # === LIMPEZA ===
+    async def _delete_message_stats(self, message_ids: list[UUID] | Select) -> None:
+        """Estatísticas e bitmaps das mensagens removidas (sem FK para inbox_messages)."""
+        for model in (InboxMessageStats, InboxMessageReadBucket, InboxReadBitmap):
+            await self.db.execute(
+                delete(model)
+                .where(model.message_id.in_(message_ids))
+                .execution_options(synchronize_session=False)
+            )
+    
+    # === PARTIÇÕES (Postgres) ===
     
-    def cleanup_expired_messages(self) -> int:
-        """Remove mensagens expiradas. Retorna quantidade removida."""
+    async def ensure_inbox_partitions(self, months_ahead: int = INBOX_PARTITION_MONTHS_AHEAD) -> int:
+        """
+        Cria as partições mensais do mês corrente até months_ahead meses à
+        frente, nas duas tabelas. Idempotente.
+        Returns: quantidade de meses criados
+        """
+        await self._lock_partitions()
+        existing = set(await self._partition_months())
         now = datetime.utcnow()
         
-        expired = self.db.execute(
-            select(InboxMessage)
-            .where(InboxMessage.expires_at < now)
-        ).scalars().all()
+        created = 0
+        for offset in range(months_ahead + 1):
+            month = _month_start(now, offset)
+            if month in existing:
+                continue
+            for table in INBOX_PARTITIONED_TABLES:
+                await self.db.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {_partition_name(table, month)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') "
+                    f"TO ('{_month_start(month, 1):%Y-%m-%d} 00:00:00+00')"
+                ))
+            created += 1
+        await self.db.commit()
+        return created
+    
+    async def drop_expired_partitions(self) -> int:
+        """
+        Remove os meses cujas linhas já expiraram todas (mesmo limite de
+        _unexpired), com DROP TABLE em vez de DELETE: sem varredura nem bloat.
+        Um mês por transação, junto com as estatísticas das suas mensagens e
+        o desconto das suas não lidas nos contadores.
+        Returns: quantidade de meses removidos
+        """
+        cutoff = datetime.utcnow() - timedelta(days=INBOX_EXPIRATION_DAYS + 1)
+        progress = purge_progress
+        progress.start()
         
-        count = len(expired)
-        for msg in expired:
-            self.db.delete(msg)
+        try:
+            for month in await self._partition_months():
+                if _month_start(month, 1) > cutoff:
+                    break
+                await self._lock_partitions()
+                messages = _partition_name("inbox_messages", month)
+                await self._delete_message_stats(select(text("id")).select_from(text(messages)))
+                await self._subtract_unread(
+                    select(InboxRecipient.user_id, func.count().label("unread"))
+                    .where(
+                        InboxRecipient.created_at >= month,
+                        InboxRecipient.created_at < _month_start(month, 1),
+                        _counted_unread(),
+                    )
+                    .group_by(InboxRecipient.user_id)
+                    .subquery()
+                )
+                # DROP precisa de lock exclusivo no pai: não esperar atrás de consultas longas
+                await self.db.execute(text("SET LOCAL lock_timeout = '5s'"))
+                # DETACH antes do DROP nas duas tabelas: a FK dos destinatários
+                # depende da partição de mensagens
+                for table in reversed(INBOX_PARTITIONED_TABLES):
+                    partition = _partition_name(table, month)
+                    await self.db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                    await self.db.execute(text(f"DROP TABLE {partition}"))
+                await self.db.commit()
+                
+                progress.batches += 1
+                progress.partitions_dropped += 1
+        finally:
+            progress.finish()
         
-        self.db.commit()
+        return progress.partitions_dropped
+    
+    async def _partition_months(self) -> list[datetime]:
+        """Meses com partição em inbox_messages, em ordem (pelo nome da partição)."""
+        names = (await self.db.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'inbox_messages'::regclass"
+        ))).scalars().all()
+        months = []
+        for name in names:
+            with suppress(ValueError):
+                months.append(datetime.strptime(name.removeprefix("inbox_messages_p"), "%Y_%m"))
+        return sorted(months)
+    
+    async def _lock_partitions(self) -> None:
+        """Serializa criação/remoção de partições entre workers (até o commit)."""
+        await self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext('inbox_partitions'))"))
+
+
+async def run_inbox_delivery(
+    message_id: UUID,
+    send_to_all: bool,
+    filters: InboxFilters | None,
+    rate: int | None = None,
+) -> None:
+    """Executa o fan-out fora da requisição, com sessão própria."""
+    async with AsyncSessionLocal() as db:
+        try:
+            delivered = await InboxService(db).deliver_message(message_id, send_to_all, filters, rate=rate)
+        except Exception:
+            logger.exception("inbox_delivery_failed", message_id=str(message_id))
+            return
+    logger.info("inbox_delivered", message_id=str(message_id), delivered=delivered)
+
+
+@dataclass
+class InboxPurgeProgress:
+    """Progresso do expurgo neste worker (execução atual ou última)."""
+    running: bool = False
+    batches: int = 0
+    recipients_deleted: int = 0
+    messages_deleted: int = 0
+    partitions_dropped: int = 0
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    
+    def start(self) -> None:
+        self.running = True
+        self.batches = self.recipients_deleted = self.messages_deleted = self.partitions_dropped = 0
+        self.started_at, self.finished_at = datetime.utcnow(), None
+    
+    def finish(self) -> None:
+        self.running = False
+        self.finished_at = datetime.utcnow()
+
+
+purge_progress = InboxPurgeProgress()
+
+
+def get_purge_progress() -> dict[str, Any]:
+    return asdict(purge_progress)
+
+
+class ReadReceiptBuffer:
+    """
+    Agrupa PATCH /inbox/{id}/read em UPDATEs periódicos por usuário.
+    
+    Opcional (inbox_read_receipt_flush_seconds > 0). Leituras pendentes ficam
+    só em memória até o próximo flush; stop() grava o que restar.
+    """
+    
+    def __init__(self, flush_interval: float, max_pending: int = 10_000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[UUID, set[UUID]] = {}
+        self._size = 0
+        self._task: asyncio.Task[None] | None = None
+    
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def add(self, user_id: UUID, recipient_id: UUID) -> bool:
+        """Enfileira a leitura. False = buffer cheio (grave direto)."""
+        if self._size >= self.max_pending:
+            return False
+        ids = self._pending.setdefault(user_id, set())
+        if recipient_id not in ids:
+            ids.add(recipient_id)
+            self._size += 1
+        return True
+    
+    async def flush(self) -> int:
+        """Grava as leituras pendentes numa única transação."""
+        pending, self._pending, self._size = self._pending, {}, 0
+        if not pending:
+            return 0
+        try:
+            async with AsyncSessionLocal() as db:
+                service = InboxService(db)
+                count = 0
+                for user_id, recipient_ids in pending.items():
+                    count += await service.mark_many_as_read(user_id, list(recipient_ids), commit=False)
+                await db.commit()
+            read_at = datetime.utcnow()
+            for user_id, recipient_ids in pending.items():
+                await _update_timeline(inbox_timeline.mark_read, user_id, list(recipient_ids), read_at)
+        except Exception:
+            # Devolve ao buffer para a próxima tentativa
+            for user_id, recipient_ids in pending.items():
+                for recipient_id in recipient_ids:
+                    self.add(user_id, recipient_id)
+            raise
         return count
+    
+    def start(self) -> None:
+        if not self.is_running:
+            self._task = asyncio.create_task(self._flush_loop())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+    
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("inbox_read_receipts_flush_failed")
+
+
+read_receipts = ReadReceiptBuffer(settings.inbox_read_receipt_flush_seconds)
+
+
+# Opções de filtro do envio: mesma estratégia de versão + ETag da árvore
+# organizacional. O TTL limita quanto tempo outro worker (que não viu o
+# bump) serve contagens anteriores.
+_filter_options_version = 0
+_filter_options_cache: TTLCache[int, tuple[str, bytes]] = TTLCache(
+    maxsize=4, ttl=settings.inbox_filter_options_cache_ttl_seconds
+)
+
+
+def bump_filter_options_version() -> None:
+    """Invalida as opções em cache (chamar após commit de perfis/facetas)."""
+    global _filter_options_version
+    _filter_options_version += 1
+
+
+async def get_filter_options_snapshot(db: AsyncSession) -> tuple[str, bytes]:
+    """Retorna (ETag, JSON serializado) das opções de filtro com contagens."""
+    version = _filter_options_version
+    cached = _filter_options_cache.get(version)
+    if cached is not None:
+        return cached
+    
+    options = await InboxService(db).get_filter_options()
+    body = InboxFiltersOptionsResponse(**options).model_dump_json().encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    
+    if version == _filter_options_version:
+        _filter_options_cache[version] = (etag, body)
+    return etag, body
+
+
+async def ensure_partitions_on_startup() -> int:
+    """
+    Partições do mês corrente e dos próximos na subida do processo, com ou
+    sem a manutenção periódica: sem elas todo INSERT no inbox falha.
+    Returns: quantidade de meses criados (0 fora do Postgres)
+    """
+    async with AsyncSessionLocal() as db:
+        if db.bind.dialect.name != "postgresql":
+            return 0
+        return await InboxService(db).ensure_inbox_partitions()
+
+
+async def run_inbox_maintenance() -> None:
+    """Partições, expurgo de mensagens expiradas e reconciliação de contadores e facetas."""
+    async with AsyncSessionLocal() as db:
+        service = InboxService(db)
+        if db.bind.dialect.name == "postgresql":
+            await service.ensure_inbox_partitions()
+            expired = await service.drop_expired_partitions()
+        else:
+            expired = await service.cleanup_expired_messages()
+        repaired = await service.reconcile_unread_counters()
+        facets = await service.reconcile_filter_facets()
+    if repaired:
+        logger.warning("inbox_unread_counters_drift", repaired=repaired)
+    logger.info("inbox_maintenance", expired=expired, repaired=repaired, facets=facets)
+
+
+# Fan-outs em andamento neste processo (requisição ou despachante)
+_deliveries: dict[UUID, asyncio.Task] = {}
+
+
+def start_inbox_delivery(
+    message_id: UUID,
+    send_to_all: bool,
+    filters: InboxFilters | None,
+    rate: int | None = None,
+) -> None:
+    """Inicia o fan-out numa tarefa deste processo, interrompida por stop_inbox_deliveries."""
+    if message_id in _deliveries:
+        return
+    task = asyncio.create_task(run_inbox_delivery(message_id, send_to_all, filters, rate))
+    _deliveries[message_id] = task
+    task.add_done_callback(lambda _: _deliveries.pop(message_id, None))
+
+
+async def stop_inbox_deliveries() -> None:
+    """Shutdown: interrompe os fan-outs em andamento (voltam a PENDING)."""
+    tasks = list(_deliveries.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def dispatch_due_messages() -> int:
+    """
+    Libera os broadcasts vencidos e inicia o fan-out das demais mensagens
+    vencidas, uma tarefa por mensagem (no ritmo de delivery_rate). Também
+    retoma fan-outs que ficaram PENDING (shutdown) ou SENDING com lease
+    vencido (processo morto).
+    Returns: quantidade de mensagens vencidas encontradas
+    """
+    async with AsyncSessionLocal() as db:
+        service = InboxService(db)
+        due = await service.due_messages()
+        for row in due:
+            if row.is_broadcast:
+                await service.release_broadcast(row.id, row.created_at)
+            else:
+                filters = InboxFilters.model_validate(row.filters) if row.filters else None
+                start_inbox_delivery(row.id, False, filters, row.delivery_rate)
+    return len(due)
+
+
+async def inbox_dispatch_loop(interval_seconds: int) -> None:
+    """Roda dispatch_due_messages a cada intervalo até ser cancelada."""
+    while True:
+        try:
+            due = await dispatch_due_messages()
+            if due:
+                logger.info("inbox_dispatch", due=due)
+        except Exception:
+            logger.exception("inbox_dispatch_failed")
+        await asyncio.sleep(interval_seconds)
+
+
+async def inbox_maintenance_loop(interval_seconds: int) -> None:
+    """Roda run_inbox_maintenance já na subida e depois a cada intervalo, até ser cancelada."""
+    while True:
+        try:
+            await run_inbox_maintenance()
+        except Exception:
+            logger.exception("inbox_maintenance_failed")
+        await asyncio.sleep(interval_seconds)
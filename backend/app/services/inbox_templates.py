@@ -0,0 +1,84 @@
+"""
+Inbox Templates
+===============
+Personalização dos avisos na leitura: título e conteúdo podem ter
+marcadores {{campo}} preenchidos com o perfil de quem lê.
+
+A mensagem é gravada uma vez, como enviada; nada por destinatário. Cada
+texto é compilado uma vez (partes fixas + campos) e fica num LRU, então
+renderizar uma página é só juntar strings.
+"""
+
+import re
+from functools import lru_cache
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import UserProfile
+
+TEMPLATE_CACHE_SIZE = 4096  # textos compilados mantidos em memória
+
+# Campo -> valor a partir do perfil (full_name, city, state); vazio se não preenchido
+TEMPLATE_FIELDS = {
+    "first_name": lambda p: next(iter((p.full_name or "").split()), ""),
+    "full_name": lambda p: p.full_name or "",
+    "city": lambda p: p.city or "",
+    "state": lambda p: p.state or "",
+}
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+def has_placeholders(text: str) -> bool:
+    return "{{" in text
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(text: str) -> tuple[str | tuple[str], ...]:
+    """Partes do texto: str fixa ou (campo,). Marcador desconhecido fica como texto."""
+    parts: list[str | tuple[str]] = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(text):
+        parts.append(text[position:match.start()])
+        field = match.group(1)
+        parts.append((field,) if field in TEMPLATE_FIELDS else match.group(0))
+        position = match.end()
+    parts.append(text[position:])
+    return tuple(part for part in parts if part)
+
+
+def unknown_fields(text: str) -> list[str]:
+    """Marcadores que não são campos conhecidos (validação no envio)."""
+    return [f for f in _PLACEHOLDER.findall(text) if f not in TEMPLATE_FIELDS]
+
+
+def render(text: str, context: dict[str, str], preview: bool = False) -> str:
+    """preview: texto cortado no fim, onde um marcador pela metade é descartado."""
+    if not has_placeholders(text):
+        return text
+    if preview:
+        cut = text.rfind("{{")
+        if "}}" not in text[cut:]:
+            text = text[:cut]
+    return "".join(
+        part if isinstance(part, str) else context[part[0]]
+        for part in compile_template(text)
+    )
+
+
+def template_context(profile) -> dict[str, str]:
+    """profile: linha/objeto com full_name, city e state (None = sem perfil)."""
+    if profile is None:
+        return dict.fromkeys(TEMPLATE_FIELDS, "")
+    return {field: value(profile) for field, value in TEMPLATE_FIELDS.items()}
+
+
+async def load_template_context(db: AsyncSession, user_id: UUID) -> dict[str, str]:
+    """Valores dos campos para o usuário (uma leitura por PK)."""
+    profile = (await db.execute(
+        select(UserProfile.full_name, UserProfile.city, UserProfile.state)
+        .where(UserProfile.user_id == user_id)
+    )).first()
+    return template_context(profile)
@@ -0,0 +1,338 @@
+"""
+Inbox Timeline
+==============
+Cache opcional do inbox de cada usuário no Redis (Postgres continua sendo a
+fonte da verdade).
+
+Por usuário:
+- inbox:{user}:unread / inbox:{user}:read: sorted sets de ids de item
+  (destinatário ou broadcast) com score = created_at em microssegundos;
+  empates saem em ordem decrescente de id, como no SQL
+- inbox:{user}:items: hash item -> {"m": message_id, "r": read_at}
+- inbox:{user}:gen: último broadcast (sequência) já incluído na timeline
+Compartilhado:
+- inbox:msg:{message_id}: cabeçalho da mensagem (JSON), expira com ela
+- inbox:broadcasts: sorted set "message_id|created_at" com score =
+  sequência de publicação (inbox:broadcast_seq)
+
+Broadcast não é copiado para as timelines: cada uma incorpora, na própria
+leitura, os publicados depois do seu "gen" (sem remontar ninguém).
+
+Timeline ausente ou Redis indisponível: o chamador lê do Postgres e
+remonta (rebuild). Fan-out, leituras e dispensas escrevem aqui depois do
+commit, só em timelines já montadas. Uso renova o TTL das chaves do
+usuário: só timeline parada expira.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import UUID
+
+import structlog
+
+from app.core.settings import settings
+
+logger = structlog.get_logger()
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_BROADCASTS_KEY = "inbox:broadcasts"
+_BROADCAST_SEQ_KEY = "inbox:broadcast_seq"
+_BROADCASTS_KEPT = 1000  # broadcasts mais recentes mantidos no sorted set compartilhado
+
+
+def _score(value: datetime) -> int:
+    """created_at -> microssegundos desde a época (exato em float até 2^53)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_score(score: float) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(score))
+
+
+def _json_default(value: Any) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class InboxTimeline:
+    """Timelines por usuário em sorted sets; cabeçalhos compartilhados."""
+
+    def __init__(self, redis_url: str | None, ttl_seconds: int, client: Any = None) -> None:
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+
+    @property
+    def enabled(self) -> bool:
+        return self._client is not None or bool(self.redis_url)
+
+    @property
+    def redis(self) -> Any:
+        if self._client is None:
+            # Import tardio: o Redis só é necessário com o cache ligado
+            import redis.asyncio as aioredis
+            self._client = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._client
+
+    @staticmethod
+    def _keys(user_id: UUID) -> tuple[str, str, str, str]:
+        prefix = f"inbox:{user_id}"
+        return f"{prefix}:unread", f"{prefix}:read", f"{prefix}:items", f"{prefix}:gen"
+
+    # === LEITURA ===
+
+    async def broadcast_watermark(self) -> str:
+        """Último broadcast publicado (ler antes de consultar o Postgres para o rebuild)."""
+        return await self.redis.get(_BROADCAST_SEQ_KEY) or "0"
+
+    def _touch(self, pipe: Any, user_id: UUID) -> None:
+        for key in self._keys(user_id):
+            pipe.expire(key, self.ttl_seconds)
+
+    async def _fresh(self, user_id: UUID, cutoff: datetime) -> tuple[int, int] | None:
+        """
+        Descarta itens expirados, incorpora broadcasts novos, renova o TTL e
+        devolve (não lidas, lidas), ou None se a timeline não existe.
+        """
+        unread_key, read_key, items_key, gen_key = self._keys(user_id)
+        expired = f"({_score(cutoff)}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(gen_key)
+        pipe.get(_BROADCAST_SEQ_KEY)
+        pipe.exists(items_key)
+        pipe.zremrangebyscore(unread_key, "-inf", expired)
+        pipe.zremrangebyscore(read_key, "-inf", expired)
+        pipe.zcard(unread_key)
+        pipe.zcard(read_key)
+        self._touch(pipe, user_id)
+        built, published, has_items, _, _, unread, read, *_ = await pipe.execute()
+        if built is None or (not has_items and unread + read):
+            return None
+        if int(published or 0) > int(built):
+            merged = await self._merge_broadcasts(user_id, int(built), _score(cutoff))
+            if merged is None:
+                return None
+            unread += merged
+        return unread, read
+
+    async def _merge_broadcasts(self, user_id: UUID, watermark: int, cutoff: int) -> int | None:
+        """
+        Broadcasts publicados depois de watermark entram como não lidos.
+        Returns: quantos entraram, ou None se parte deles já saiu do sorted set
+        compartilhado (a timeline precisa ser remontada)
+        """
+        unread_key, _, items_key, gen_key = self._keys(user_id)
+        rows = await self.redis.zrangebyscore(_BROADCASTS_KEY, f"({watermark}", "+inf", withscores=True)
+        if rows and int(rows[0][1]) > watermark + 1:
+            return None
+        broadcasts = []
+        for member, _ in rows:
+            message_id, score = member.split("|")
+            if int(score) >= cutoff:
+                broadcasts.append((message_id, int(score)))
+        # HSETNX: o rebuild pode já ter trazido (e o usuário lido) o broadcast
+        pipe = self.redis.pipeline(transaction=False)
+        for message_id, _ in broadcasts:
+            pipe.hsetnx(items_key, message_id, json.dumps({"m": message_id, "r": None}))
+        added = [b for b, new in zip(broadcasts, await pipe.execute()) if new]
+
+        pipe = self.redis.pipeline(transaction=True)
+        if added:
+            pipe.zadd(unread_key, dict(added))
+        pipe.set(gen_key, int(rows[-1][1]) if rows else watermark, ex=self.ttl_seconds)
+        await pipe.execute()
+        return len(added)
+
+    async def _catch_up(self, user_id: UUID) -> None:
+        """
+        Antes de uma escrita: incorpora os broadcasts pendentes, senão
+        ler/dispensar um deles não acharia o item. Broadcasts já fora do
+        sorted set ficam para o rebuild da próxima leitura.
+        """
+        built, published = await self.redis.mget([self._keys(user_id)[3], _BROADCAST_SEQ_KEY])
+        if built is not None and int(published or 0) > int(built):
+            await self._merge_broadcasts(user_id, int(built), 0)
+
+    async def unread_count(self, user_id: UUID, cutoff: datetime) -> int | None:
+        fresh = await self._fresh(user_id, cutoff)
+        return None if fresh is None else fresh[0]
+
+    async def page(
+        self,
+        user_id: UUID,
+        include_read: bool,
+        limit: int,
+        after: tuple[bool, datetime, UUID] | None,
+        cutoff: datetime,
+    ) -> tuple[list[dict], int, int, bool] | None:
+        """
+        Página na ordem (read ASC, created_at DESC, id DESC) a partir do cursor.
+        Returns: (itens sem cabeçalho, total, não lidas, has_more) ou None
+        """
+        fresh = await self._fresh(user_id, cutoff)
+        if fresh is None:
+            return None
+        unread_count, read_count = fresh
+        unread_key, read_key, items_key, _ = self._keys(user_id)
+
+        wanted = limit + 1
+        rows: list[tuple[str, int, bool]] = []
+        if after is None or not after[0]:
+            start = None if after is None else (_score(after[1]), str(after[2]))
+            rows += [(m, s, False) for m, s in await self._after(unread_key, start, wanted)]
+        if include_read and len(rows) < wanted:
+            start = (_score(after[1]), str(after[2])) if after and after[0] else None
+            rows += [(m, s, True) for m, s in await self._after(read_key, start, wanted - len(rows))]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            return [], unread_count + read_count, unread_count, False
+
+        states = await self.redis.hmget(items_key, [member for member, _, _ in rows])
+        if any(state is None for state in states):
+            return None
+        items = []
+        for (member, score, read), state in zip(rows, states):
+            state = json.loads(state)
+            items.append({
+                "id": member,
+                "message_id": state["m"],
+                "read": read,
+                "read_at": datetime.fromisoformat(state["r"]) if read and state.get("r") else None,
+                "created_at": _from_score(score),
+            })
+        return items, unread_count + read_count, unread_count, has_more
+
+    async def _after(self, key: str, start: tuple[int, str] | None, count: int) -> list[tuple[str, int]]:
+        """Até count membros depois de start = (score, id), em ordem decrescente."""
+        if start is None:
+            rows = await self.redis.zrevrangebyscore(key, "+inf", "-inf", start=0, num=count, withscores=True)
+        else:
+            score, member = start
+            ties = await self.redis.zcount(key, score, score)
+            rows = await self.redis.zrevrangebyscore(
+                key, score, "-inf", start=0, num=count + ties, withscores=True,
+            )
+            rows = [(m, s) for m, s in rows if s < score or m < member]
+        return [(m, int(s)) for m, s in rows[:count]]
+
+    async def headers(self, message_ids: list[str]) -> dict[str, dict]:
+        """Cabeçalhos em cache (ausentes ficam de fora)."""
+        if not message_ids:
+            return {}
+        values = await self.redis.mget([f"inbox:msg:{m}" for m in message_ids])
+        headers = {m: json.loads(v) for m, v in zip(message_ids, values) if v is not None}
+        for header in headers.values():
+            header["expires_at"] = datetime.fromisoformat(header["expires_at"])
+        return headers
+
+    # === ESCRITA ===
+
+    async def store_headers(self, headers: dict[str, dict]) -> None:
+        """Grava cabeçalhos com TTL até a expiração da mensagem."""
+        now = datetime.now(timezone.utc)
+        pipe = self.redis.pipeline(transaction=False)
+        for message_id, header in headers.items():
+            expires_at = header["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            ttl = int((expires_at - now).total_seconds())
+            if ttl > 0:
+                pipe.set(f"inbox:msg:{message_id}", json.dumps(header, default=_json_default), ex=ttl)
+        await pipe.execute()
+
+    async def rebuild(self, user_id: UUID, watermark: str, items: list[dict]) -> None:
+        """
+        Substitui a timeline do usuário pelos itens lidos do Postgres;
+        watermark = broadcast_watermark() lido antes da consulta.
+        """
+        unread_key, read_key, items_key, gen_key = self._keys(user_id)
+        unread = {i["id"]: _score(i["created_at"]) for i in items if not i["read"]}
+        read = {i["id"]: _score(i["created_at"]) for i in items if i["read"]}
+        states = {
+            i["id"]: json.dumps({"m": i["message_id"], "r": i["read_at"]}, default=_json_default)
+            for i in items
+        }
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(unread_key, read_key, items_key)
+        if unread:
+            pipe.zadd(unread_key, unread)
+        if read:
+            pipe.zadd(read_key, read)
+        if states:
+            pipe.hset(items_key, mapping=states)
+        pipe.set(gen_key, watermark)
+        self._touch(pipe, user_id)
+        await pipe.execute()
+
+    async def add_items(self, message_id: UUID, created_at: datetime, recipients: list[tuple[UUID, UUID]]) -> None:
+        """Fan-out: (recipient_id, user_id) entram como não lidos nas timelines montadas."""
+        if not recipients:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for _, user_id in recipients:
+            pipe.exists(self._keys(user_id)[3])
+        built = await pipe.execute()
+
+        score = _score(created_at)
+        state = json.dumps({"m": str(message_id), "r": None})
+        pipe = self.redis.pipeline(transaction=False)
+        for (recipient_id, user_id), exists in zip(recipients, built):
+            if exists:
+                unread_key, _, items_key, _ = self._keys(user_id)
+                pipe.hset(items_key, str(recipient_id), state)
+                pipe.zadd(unread_key, {str(recipient_id): score})
+                self._touch(pipe, user_id)
+        await pipe.execute()
+
+    async def mark_read(self, user_id: UUID, item_ids: list[UUID] | None, read_at: datetime) -> None:
+        """Move itens (todos se None) de não lidos para lidos."""
+        await self._catch_up(user_id)
+        unread_key, read_key, items_key, _ = self._keys(user_id)
+        if item_ids is None:
+            members = await self.redis.zrange(unread_key, 0, -1, withscores=True)
+        else:
+            ids = [str(i) for i in item_ids]
+            scores = await self.redis.zmscore(unread_key, ids)
+            members = [(m, s) for m, s in zip(ids, scores) if s is not None]
+        if not members:
+            return
+        states = await self.redis.hmget(items_key, [m for m, _ in members])
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrem(unread_key, *[m for m, _ in members])
+        pipe.zadd(read_key, dict(members))
+        for (member, _), state in zip(members, states):
+            if state is not None:
+                state = json.loads(state)
+                state["r"] = read_at.isoformat()
+                pipe.hset(items_key, member, json.dumps(state))
+        self._touch(pipe, user_id)
+        await pipe.execute()
+
+    async def remove(self, user_id: UUID, item_id: UUID) -> None:
+        """Item dispensado."""
+        await self._catch_up(user_id)
+        unread_key, read_key, items_key, _ = self._keys(user_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrem(unread_key, str(item_id))
+        pipe.zrem(read_key, str(item_id))
+        pipe.hdel(items_key, str(item_id))
+        await pipe.execute()
+
+    async def add_broadcast(self, message_id: UUID, created_at: datetime) -> None:
+        """Publica um broadcast; as timelines o incorporam na próxima leitura."""
+        seq = await self.redis.incr(_BROADCAST_SEQ_KEY)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(_BROADCASTS_KEY, {f"{message_id}|{_score(created_at)}": seq})
+        pipe.zremrangebyrank(_BROADCASTS_KEY, 0, -_BROADCASTS_KEPT - 1)
+        await pipe.execute()
+
+
+inbox_timeline = InboxTimeline(
+    settings.redis_url if settings.inbox_timeline_cache_enabled else None,
+    settings.inbox_timeline_ttl_seconds,
+)
@@ -6,19 +6,29 @@ Gerencia hierarquia organizacional e convites.
 
 from datetime import datetime, timedelta, timezone
 from uuid import UUID
+import base64
+import hashlib
+import json
 import re
 
-from sqlalchemy import select, func
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from sqlalchemy import and_, delete, distinct, exists, insert, select, func, literal, or_, true, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, selectinload
 
 from app.db.models import (
-    OrgUnit, OrgUnitType, GroupType, Visibility,
+    OrgUnit, OrgUnitType, GroupType, Visibility, OrgUnitClosure,
     OrgMembership, MembershipStatus, OrgRoleCode,
     OrgInvite, InviteStatus,
-    User, UserGlobalRole, GlobalRole,
+    User,
 )
 from app.core.settings import settings
-from app.schemas.organization import HIERARCHY_PERMISSIONS, GROUP_TYPES
+from app.schemas.organization import HIERARCHY_PERMISSIONS, GROUP_TYPES, OrgTreeResponse, OrgUnitWithChildren
+from app.services.principal import clear_principal_cache, invalidate_principal, load_principal
+
+
+# Profundidade máxima da árvore (Conselho Geral -> ... -> Grupo)
+ORG_TREE_MAX_DEPTH = 5
 
 
 class OrgServiceError(Exception):
@@ -43,44 +53,25 @@ def slugify(text: str) -> str:
     return text
 
 
-def get_user_global_roles(db: Session, user_id: UUID) -> list[str]:
+async def get_user_global_roles(db: AsyncSession, user_id: UUID) -> list[str]:
     """Retorna roles globais do usuário."""
-    result = db.execute(
-        select(GlobalRole.code)
-        .join(UserGlobalRole, UserGlobalRole.global_role_id == GlobalRole.id)
-        .where(UserGlobalRole.user_id == user_id)
-    )
-    return [r[0] for r in result.all()]
+    principal = await load_principal(db, user_id)
+    return sorted(principal.global_roles)
 
 
-def is_coordinator_of(db: Session, user_id: UUID, org_unit_id: UUID) -> bool:
+async def is_coordinator_of(db: AsyncSession, user_id: UUID, org_unit_id: UUID) -> bool:
     """Verifica se usuário é coordenador da unidade."""
-    result = db.execute(
-        select(OrgMembership)
-        .where(
-            OrgMembership.user_id == user_id,
-            OrgMembership.org_unit_id == org_unit_id,
-            OrgMembership.role == OrgRoleCode.COORDINATOR,
-            OrgMembership.status == MembershipStatus.ACTIVE,
-        )
-    )
-    return result.scalar_one_or_none() is not None
+    principal = await load_principal(db, user_id)
+    return principal.is_coordinator_of(org_unit_id)
 
 
-def is_member_of(db: Session, user_id: UUID, org_unit_id: UUID) -> bool:
+async def is_member_of(db: AsyncSession, user_id: UUID, org_unit_id: UUID) -> bool:
     """Verifica se usuário é membro da unidade."""
-    result = db.execute(
-        select(OrgMembership)
-        .where(
-            OrgMembership.user_id == user_id,
-            OrgMembership.org_unit_id == org_unit_id,
-            OrgMembership.status == MembershipStatus.ACTIVE,
-        )
-    )
-    return result.scalar_one_or_none() is not None
+    principal = await load_principal(db, user_id)
+    return principal.is_member_of(org_unit_id)
 
 
-def can_user_create_child(db: Session, user_id: UUID, parent_unit: OrgUnit, child_type: OrgUnitType) -> bool:
+async def can_user_create_child(db: AsyncSession, user_id: UUID, parent_unit: OrgUnit, child_type: OrgUnitType) -> bool:
     """
     Verifica se usuário pode criar filho do tipo especificado.
     
@@ -88,18 +79,18 @@ def can_user_create_child(db: Session, user_id: UUID, parent_unit: OrgUnit, chil
     - DEV pode criar CONSELHO_GERAL (sem parent)
     - Coordenador de uma unidade pode criar filhos permitidos
     """
-    global_roles = get_user_global_roles(db, user_id)
+    principal = await load_principal(db, user_id)
     
     # CONSELHO_GERAL só pode ser criado por DEV
     if child_type == OrgUnitType.CONSELHO_GERAL:
-        return "DEV" in global_roles
+        return principal.is_dev
     
     # Outros tipos precisam de parent
     if not parent_unit:
         return False
     
     # Verifica se é coordenador do parent
-    if not is_coordinator_of(db, user_id, parent_unit.id):
+    if not principal.is_coordinator_of(parent_unit.id):
         return False
     
     # Verifica hierarquia permitida
@@ -110,8 +101,231 @@ def can_user_create_child(db: Session, user_id: UUID, parent_unit: OrgUnit, chil
     return child_type.value in allowed_children
 
 
-def create_org_unit(
-    db: Session,
+# =============================================================================
+# HIERARQUIA (closure table)
+# =============================================================================
+
+async def add_org_unit_closure(db: AsyncSession, org_unit_id: UUID, parent_id: UUID | None) -> None:
+    """Registra a unidade recém-criada (já com flush) na closure table."""
+    db.add(OrgUnitClosure(ancestor_id=org_unit_id, descendant_id=org_unit_id, depth=0))
+    if parent_id:
+        await db.execute(
+            insert(OrgUnitClosure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(
+                    OrgUnitClosure.ancestor_id,
+                    literal(org_unit_id, OrgUnitClosure.descendant_id.type),
+                    OrgUnitClosure.depth + 1,
+                ).where(OrgUnitClosure.descendant_id == parent_id),
+            )
+        )
+
+
+async def get_ancestor_ids(db: AsyncSession, org_unit_id: UUID) -> list[UUID]:
+    """Ancestrais da unidade, do pai imediato até a raiz."""
+    result = await db.execute(
+        select(OrgUnitClosure.ancestor_id)
+        .where(
+            OrgUnitClosure.descendant_id == org_unit_id,
+            OrgUnitClosure.depth > 0,
+        )
+        .order_by(OrgUnitClosure.depth)
+    )
+    return list(result.scalars().all())
+
+
+async def get_descendant_ids(
+    db: AsyncSession,
+    org_unit_id: UUID,
+    include_self: bool = False,
+    active_only: bool = True,
+) -> list[UUID]:
+    """Descendentes da unidade, em ordem de profundidade."""
+    stmt = (
+        select(OrgUnitClosure.descendant_id)
+        .join(OrgUnit, OrgUnit.id == OrgUnitClosure.descendant_id)
+        .where(OrgUnitClosure.ancestor_id == org_unit_id)
+        .order_by(OrgUnitClosure.depth, OrgUnit.name)
+    )
+    if not include_self:
+        stmt = stmt.where(OrgUnitClosure.depth > 0)
+    if active_only:
+        stmt = stmt.where(OrgUnit.is_active == True)
+    return list((await db.execute(stmt)).scalars().all())
+
+
+async def is_descendant_of(db: AsyncSession, org_unit_id: UUID, ancestor_id: UUID) -> bool:
+    """Verifica se org_unit_id está na subárvore de ancestor_id (inclusive ela mesma)."""
+    return bool((await db.execute(
+        select(exists().where(
+            OrgUnitClosure.ancestor_id == ancestor_id,
+            OrgUnitClosure.descendant_id == org_unit_id,
+        ))
+    )).scalar())
+
+
+async def expand_org_units_for_user(db: AsyncSession, user_id: UUID) -> set[UUID]:
+    """Unidades em que o usuário é membro ativo + todos os seus ancestrais."""
+    result = await db.execute(
+        select(distinct(OrgUnitClosure.ancestor_id))
+        .join(OrgMembership, OrgMembership.org_unit_id == OrgUnitClosure.descendant_id)
+        .where(
+            OrgMembership.user_id == user_id,
+            OrgMembership.status == MembershipStatus.ACTIVE,
+        )
+    )
+    return set(result.scalars().all())
+
+
+async def get_subtree_counts(db: AsyncSession, org_unit_id: UUID) -> dict[str, int]:
+    """Unidades ativas (incluindo a própria) e membros ativos distintos na subárvore."""
+    unit_count, member_count = (await db.execute(
+        select(
+            func.count(distinct(OrgUnitClosure.descendant_id)),
+            func.count(distinct(OrgMembership.user_id)),
+        )
+        .select_from(OrgUnitClosure)
+        .join(OrgUnit, OrgUnit.id == OrgUnitClosure.descendant_id)
+        .outerjoin(OrgMembership, and_(
+            OrgMembership.org_unit_id == OrgUnitClosure.descendant_id,
+            OrgMembership.status == MembershipStatus.ACTIVE,
+        ))
+        .where(
+            OrgUnitClosure.ancestor_id == org_unit_id,
+            OrgUnit.is_active == True,
+        )
+    )).one()
+    return {"unit_count": unit_count, "member_count": member_count}
+
+
+async def can_manage_subtree(db: AsyncSession, user_id: UUID, org_unit_id: UUID) -> bool:
+    """Admin, ou coordenador da unidade ou de algum ancestral dela."""
+    principal = await load_principal(db, user_id)
+    if principal.is_admin:
+        return True
+    
+    coordinated = {
+        unit_id for unit_id, role in principal.memberships.items()
+        if role == OrgRoleCode.COORDINATOR
+    }
+    if not coordinated:
+        return False
+    if org_unit_id in coordinated:
+        return True
+    return bool(coordinated & set(await get_ancestor_ids(db, org_unit_id)))
+
+
+async def move_org_unit(
+    db: AsyncSession,
+    org_unit_id: UUID,
+    new_parent_id: UUID,
+    acting_user_id: UUID,
+) -> OrgUnit:
+    """
+    Move a unidade (com toda a subárvore) para outro pai.
+    
+    - Precisa gerenciar o pai atual e o novo pai
+    - Novo pai não pode estar dentro da subárvore movida
+    - Respeita HIERARCHY_PERMISSIONS
+    """
+    org_unit = await db.get(OrgUnit, org_unit_id)
+    if not org_unit:
+        raise OrgServiceError("org_unit_not_found", "Unidade não encontrada")
+    
+    if org_unit.parent_id is None:
+        raise OrgServiceError("cannot_move_root", "A raiz da hierarquia não pode ser movida")
+    
+    new_parent = await db.get(OrgUnit, new_parent_id)
+    if not new_parent or not new_parent.is_active:
+        raise OrgServiceError("parent_not_found", "Unidade pai não encontrada")
+    
+    if new_parent_id == org_unit.parent_id:
+        return org_unit
+    
+    if not (
+        await can_manage_subtree(db, acting_user_id, org_unit.parent_id)
+        and await can_manage_subtree(db, acting_user_id, new_parent_id)
+    ):
+        raise OrgServiceError("permission_denied", "Você não tem permissão para mover esta unidade")
+    
+    if await is_descendant_of(db, new_parent_id, org_unit_id):
+        raise OrgServiceError("invalid_move", "Não é possível mover uma unidade para dentro dela mesma")
+    
+    allowed_children = HIERARCHY_PERMISSIONS.get(new_parent.type.value, {}).get("can_create", [])
+    if org_unit.type.value not in allowed_children:
+        raise OrgServiceError("invalid_hierarchy", f"{new_parent.type.value} não pode conter {org_unit.type.value}")
+    
+    subtree = select(OrgUnitClosure.descendant_id).where(OrgUnitClosure.ancestor_id == org_unit_id)
+    
+    # Desliga a subárvore dos ancestrais antigos
+    await db.execute(
+        delete(OrgUnitClosure)
+        .where(
+            OrgUnitClosure.descendant_id.in_(subtree),
+            OrgUnitClosure.ancestor_id.notin_(subtree),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    
+    # Liga cada ancestral do novo pai a cada nó da subárvore
+    above = aliased(OrgUnitClosure)
+    below = aliased(OrgUnitClosure)
+    await db.execute(
+        insert(OrgUnitClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1)
+            .join(below, true())
+            .where(
+                above.descendant_id == new_parent_id,
+                below.ancestor_id == org_unit_id,
+            ),
+        )
+    )
+    
+    org_unit.parent_id = new_parent_id
+    await db.commit()
+    bump_org_tree_version()
+    await db.refresh(org_unit)
+    return org_unit
+
+
+async def deactivate_org_unit(db: AsyncSession, org_unit_id: UUID, acting_user_id: UUID) -> int:
+    """
+    Desativa a unidade e toda a subárvore. Retorna quantas unidades foram desativadas.
+    
+    - Precisa gerenciar o pai da unidade
+    - A raiz não pode ser desativada
+    """
+    org_unit = await db.get(OrgUnit, org_unit_id)
+    if not org_unit:
+        raise OrgServiceError("org_unit_not_found", "Unidade não encontrada")
+    
+    if org_unit.parent_id is None:
+        raise OrgServiceError("cannot_deactivate_root", "A raiz da hierarquia não pode ser desativada")
+    
+    if not await can_manage_subtree(db, acting_user_id, org_unit.parent_id):
+        raise OrgServiceError("permission_denied", "Você não tem permissão para desativar esta unidade")
+    
+    result = await db.execute(
+        update(OrgUnit)
+        .where(
+            OrgUnit.id.in_(
+                select(OrgUnitClosure.descendant_id).where(OrgUnitClosure.ancestor_id == org_unit_id)
+            ),
+            OrgUnit.is_active == True,
+        )
+        .values(is_active=False)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    # Memberships da subárvore deixam de valer: qualquer Principal pode estar afetado
+    clear_principal_cache()
+    bump_org_tree_version()
+    return result.rowcount
+
+
+async def create_org_unit(
+    db: AsyncSession,
     user_id: UUID,
     parent_id: UUID | None,
     org_type: OrgUnitType,
@@ -132,12 +346,12 @@ def create_org_unit(
     # Busca parent se existir
     parent_unit = None
     if parent_id:
-        parent_unit = db.get(OrgUnit, parent_id)
+        parent_unit = await db.get(OrgUnit, parent_id)
         if not parent_unit:
             raise OrgServiceError("parent_not_found", "Unidade pai não encontrada")
     
     # Valida permissão de criação
-    if not can_user_create_child(db, user_id, parent_unit, org_type):
+    if not await can_user_create_child(db, user_id, parent_unit, org_type):
         raise OrgServiceError("permission_denied", "Você não tem permissão para criar este tipo de unidade")
     
     # Valida group_type
@@ -153,7 +367,7 @@ def create_org_unit(
     base_slug = slugify(name)
     slug = base_slug
     counter = 1
-    while db.execute(select(OrgUnit).where(OrgUnit.slug == slug)).scalar_one_or_none():
+    while (await db.execute(select(OrgUnit).where(OrgUnit.slug == slug))).scalar_one_or_none():
         slug = f"{base_slug}-{counter}"
         counter += 1
     
@@ -169,7 +383,8 @@ def create_org_unit(
         created_by_user_id=user_id,
     )
     db.add(org_unit)
-    db.flush()
+    await db.flush()
+    await add_org_unit_closure(db, org_unit.id, parent_id)
     
     # Adiciona criador como coordenador
     creator_membership = OrgMembership(
@@ -181,12 +396,13 @@ def create_org_unit(
     db.add(creator_membership)
     
     # Adiciona coordenadores extras (se existirem)
+    new_member_ids = [user_id]
     if coordinator_user_ids:
         for coord_id in coordinator_user_ids:
             if coord_id == user_id:
                 continue  # Já adicionado
             
-            user = db.get(User, coord_id)
+            user = await db.get(User, coord_id)
             if not user:
                 continue
             
@@ -197,14 +413,17 @@ def create_org_unit(
                 status=MembershipStatus.ACTIVE,
             )
             db.add(membership)
+            new_member_ids.append(coord_id)
     
-    db.commit()
-    db.refresh(org_unit)
+    await db.commit()
+    invalidate_principal(*new_member_ids)
+    bump_org_tree_version()
+    await db.refresh(org_unit)
     return org_unit
 
 
-def send_invite(
-    db: Session,
+async def send_invite(
+    db: AsyncSession,
     org_unit_id: UUID,
     invited_user_id: UUID,
     invited_by_user_id: UUID,
@@ -219,32 +438,32 @@ def send_invite(
     - Verifica se já existe convite pendente
     """
     # Verifica unidade
-    org_unit = db.get(OrgUnit, org_unit_id)
+    org_unit = await db.get(OrgUnit, org_unit_id)
     if not org_unit:
         raise OrgServiceError("org_unit_not_found", "Unidade não encontrada")
     
     # Verifica se é coordenador
-    if not is_coordinator_of(db, invited_by_user_id, org_unit_id):
+    if not await is_coordinator_of(db, invited_by_user_id, org_unit_id):
         raise OrgServiceError("permission_denied", "Apenas coordenadores podem enviar convites")
     
     # Verifica se usuário existe
-    invited_user = db.get(User, invited_user_id)
+    invited_user = await db.get(User, invited_user_id)
     if not invited_user:
         raise OrgServiceError("user_not_found", "Usuário não encontrado")
     
     # Verifica se já é membro
-    if is_member_of(db, invited_user_id, org_unit_id):
+    if await is_member_of(db, invited_user_id, org_unit_id):
         raise OrgServiceError("already_member", "Usuário já é membro desta unidade")
     
     # Verifica se já existe convite pendente
-    existing = db.execute(
+    existing = (await db.execute(
         select(OrgInvite)
         .where(
             OrgInvite.org_unit_id == org_unit_id,
             OrgInvite.invited_user_id == invited_user_id,
             OrgInvite.status == InviteStatus.PENDING,
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if existing:
         raise OrgServiceError("invite_exists", "Já existe convite pendente para este usuário")
@@ -262,14 +481,14 @@ def send_invite(
         expires_at=expires_at,
     )
     db.add(invite)
-    db.commit()
-    db.refresh(invite)
+    await db.commit()
+    await db.refresh(invite)
     
     return invite
 
 
-def respond_to_invite(
-    db: Session,
+async def respond_to_invite(
+    db: AsyncSession,
     invite_id: UUID,
     user_id: UUID,
     accept: bool,
@@ -281,7 +500,7 @@ def respond_to_invite(
     - Verifica se está pendente
     - Se aceito, cria membership
     """
-    invite = db.get(OrgInvite, invite_id)
+    invite = await db.get(OrgInvite, invite_id)
     if not invite:
         raise OrgServiceError("invite_not_found", "Convite não encontrado")
     
@@ -294,7 +513,7 @@ def respond_to_invite(
     # Verifica expiração
     if invite.expires_at and invite.expires_at < datetime.now(timezone.utc):
         invite.status = InviteStatus.EXPIRED
-        db.commit()
+        await db.commit()
         raise OrgServiceError("invite_expired", "Convite expirado")
     
     now = datetime.now(timezone.utc)
@@ -315,95 +534,349 @@ def respond_to_invite(
     else:
         invite.status = InviteStatus.REJECTED
     
-    db.commit()
-    db.refresh(invite)
+    await db.commit()
+    invalidate_principal(user_id)
+    if accept:
+        bump_org_tree_version()
+    await db.refresh(invite)
     return invite
 
 
-def get_user_pending_invites(db: Session, user_id: UUID) -> list[OrgInvite]:
+async def get_user_pending_invites(db: AsyncSession, user_id: UUID) -> list[OrgInvite]:
     """Retorna convites pendentes do usuário."""
-    result = db.execute(
+    result = await db.execute(
         select(OrgInvite)
         .where(
             OrgInvite.invited_user_id == user_id,
             OrgInvite.status == InviteStatus.PENDING,
         )
+        .options(
+            selectinload(OrgInvite.org_unit),
+            selectinload(OrgInvite.invited_by_user).selectinload(User.profile),
+        )
         .order_by(OrgInvite.created_at.desc())
     )
     return list(result.scalars().all())
 
 
-def get_org_unit_pending_invites(db: Session, org_unit_id: UUID, user_id: UUID) -> list[OrgInvite]:
+async def get_org_unit_pending_invites(db: AsyncSession, org_unit_id: UUID, user_id: UUID) -> list[OrgInvite]:
     """Retorna convites pendentes de uma unidade (só coordenador pode ver)."""
-    if not is_coordinator_of(db, user_id, org_unit_id):
+    if not await is_coordinator_of(db, user_id, org_unit_id):
         raise OrgServiceError("permission_denied", "Apenas coordenadores podem ver convites")
     
-    result = db.execute(
+    result = await db.execute(
         select(OrgInvite)
         .where(
             OrgInvite.org_unit_id == org_unit_id,
             OrgInvite.status == InviteStatus.PENDING,
         )
+        .options(
+            selectinload(OrgInvite.org_unit),
+            selectinload(OrgInvite.invited_user).selectinload(User.profile),
+            selectinload(OrgInvite.invited_user).selectinload(User.identities),
+            selectinload(OrgInvite.invited_by_user).selectinload(User.profile),
+        )
         .order_by(OrgInvite.created_at.desc())
     )
     return list(result.scalars().all())
 
 
-def get_org_tree(db: Session, user_id: UUID) -> OrgUnit | None:
+async def get_org_tree(db: AsyncSession, user_id: UUID) -> OrgUnitWithChildren | None:
     """
     Retorna árvore organizacional visível para o usuário.
     
     - Unidades PUBLIC são visíveis para todos
-    - Unidades RESTRICTED só para membros
+    - Unidades RESTRICTED só para membros (e admins); a subárvore abaixo delas também some
+    
+    Uma única consulta: CTE recursiva com o filtro de visibilidade + contagem
+    agregada de membros ativos. A árvore é montada a partir das linhas em O(n).
     """
-    # IDs das unidades que o usuário é membro
-    user_unit_ids = set()
-    memberships = db.execute(
-        select(OrgMembership.org_unit_id)
+    principal = await load_principal(db, user_id)
+    
+    visible = true() if principal.is_admin else or_(
+        OrgUnit.visibility == Visibility.PUBLIC,
+        OrgUnit.id.in_(principal.member_unit_ids),
+    )
+    
+    columns = (
+        OrgUnit.id, OrgUnit.parent_id, OrgUnit.type, OrgUnit.group_type, OrgUnit.name,
+        OrgUnit.slug, OrgUnit.description, OrgUnit.visibility, OrgUnit.is_active, OrgUnit.created_at,
+    )
+    tree = (
+        select(*columns, literal(0).label("depth"))
+        .where(
+            OrgUnit.type == OrgUnitType.CONSELHO_GERAL,
+            OrgUnit.is_active == True,
+        )
+        .cte("org_tree", recursive=True)
+    )
+    tree = tree.union_all(
+        select(*columns, (tree.c.depth + 1).label("depth"))
+        .join(tree, OrgUnit.parent_id == tree.c.id)
+        .where(
+            OrgUnit.is_active == True,
+            tree.c.depth < ORG_TREE_MAX_DEPTH,
+            visible,
+        )
+    )
+    
+    member_counts = (
+        select(OrgMembership.org_unit_id, func.count().label("member_count"))
         .where(
-            OrgMembership.user_id == user_id,
             OrgMembership.status == MembershipStatus.ACTIVE,
+            OrgMembership.org_unit_id.in_(select(tree.c.id)),
         )
+        .group_by(OrgMembership.org_unit_id)
+        .subquery()
     )
-    for row in memberships:
-        user_unit_ids.add(row[0])
     
-    # Busca raiz (CONSELHO_GERAL)
-    root = db.execute(
-        select(OrgUnit)
+    rows = (await db.execute(
+        select(tree, func.coalesce(member_counts.c.member_count, 0).label("member_count"))
+        .outerjoin(member_counts, member_counts.c.org_unit_id == tree.c.id)
+        .order_by(tree.c.depth, tree.c.name)
+    )).all()
+    
+    return build_org_tree(rows)
+
+
+def build_org_tree(rows) -> OrgUnitWithChildren | None:
+    """Monta a árvore a partir de linhas planas ordenadas por profundidade."""
+    nodes: dict[UUID, OrgUnitWithChildren] = {}
+    root = None
+    
+    for row in rows:
+        node = OrgUnitWithChildren(
+            id=row.id,
+            type=row.type.value,
+            group_type=row.group_type.value if row.group_type else None,
+            name=row.name,
+            slug=row.slug,
+            description=row.description,
+            visibility=row.visibility.value,
+            is_active=row.is_active,
+            parent_id=row.parent_id,
+            created_at=row.created_at,
+            member_count=row.member_count,
+        )
+        if row.depth == 0:
+            if root is None:
+                root = node
+                nodes[row.id] = node
+            continue
+        
+        parent = nodes.get(row.parent_id)
+        if parent is not None:
+            parent.children.append(node)
+            parent.child_count += 1
+            parent.has_children = True
+            nodes[row.id] = node
+    
+    return root
+
+
+def _encode_cursor(name: str, org_unit_id: UUID) -> str:
+    raw = json.dumps([name, str(org_unit_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        name, org_unit_id = json.loads(raw)
+        return str(name), UUID(org_unit_id)
+    except (ValueError, TypeError):
+        raise OrgServiceError("invalid_cursor", "Cursor inválido")
+
+
+async def get_org_unit_children_page(
+    db: AsyncSession,
+    user_id: UUID,
+    org_unit_id: UUID,
+    limit: int = 50,
+    cursor: str | None = None,
+) -> tuple[list[OrgUnitWithChildren], str | None]:
+    """
+    Retorna um nível de filhos visíveis da unidade, paginado por (name, id).
+    
+    Cada item traz member_count, child_count e has_children (contagens
+    correlacionadas, apoiadas no índice de parent_id). A unidade e seus
+    ancestrais precisam estar ativos e visíveis para o usuário.
+    """
+    principal = await load_principal(db, user_id)
+    
+    # A unidade pedida e seus ancestrais (closure table, uma consulta)
+    path = (await db.execute(
+        select(OrgUnit.visibility, OrgUnit.is_active, OrgUnit.id)
+        .join(OrgUnitClosure, OrgUnitClosure.ancestor_id == OrgUnit.id)
+        .where(OrgUnitClosure.descendant_id == org_unit_id)
+    )).all()
+    if not path:
+        raise OrgServiceError("org_unit_not_found", "Unidade não encontrada")
+    for visibility, is_active, unit_id in path:
+        if not is_active:
+            raise OrgServiceError("org_unit_not_found", "Unidade não encontrada")
+        if (
+            visibility == Visibility.RESTRICTED
+            and not principal.is_admin
+            and not principal.is_member_of(unit_id)
+        ):
+            raise OrgServiceError("permission_denied", "Unidade restrita")
+    
+    def visible(unit):
+        if principal.is_admin:
+            return true()
+        return or_(unit.visibility == Visibility.PUBLIC, unit.id.in_(principal.member_unit_ids))
+    
+    grandchild = aliased(OrgUnit)
+    child_count = (
+        select(func.count())
+        .where(grandchild.parent_id == OrgUnit.id, grandchild.is_active == True, visible(grandchild))
+        .correlate(OrgUnit)
+        .scalar_subquery()
+    )
+    member_count = (
+        select(func.count())
         .where(
-            OrgUnit.type == OrgUnitType.CONSELHO_GERAL,
+            OrgMembership.org_unit_id == OrgUnit.id,
+            OrgMembership.status == MembershipStatus.ACTIVE,
+        )
+        .correlate(OrgUnit)
+        .scalar_subquery()
+    )
+    
+    stmt = (
+        select(OrgUnit, member_count.label("member_count"), child_count.label("child_count"))
+        .where(
+            OrgUnit.parent_id == org_unit_id,
             OrgUnit.is_active == True,
+            visible(OrgUnit),
         )
-    ).scalar_one_or_none()
+        .order_by(OrgUnit.name, OrgUnit.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        after_name, after_id = _decode_cursor(cursor)
+        stmt = stmt.where(tuple_(OrgUnit.name, OrgUnit.id) > tuple_(after_name, after_id))
     
-    return root
+    rows = (await db.execute(stmt)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    items = [
+        OrgUnitWithChildren(
+            id=unit.id,
+            type=unit.type.value,
+            group_type=unit.group_type.value if unit.group_type else None,
+            name=unit.name,
+            slug=unit.slug,
+            description=unit.description,
+            visibility=unit.visibility.value,
+            is_active=unit.is_active,
+            parent_id=unit.parent_id,
+            created_at=unit.created_at,
+            member_count=members,
+            child_count=children,
+            has_children=children > 0,
+        )
+        for unit, members, children in rows
+    ]
+    next_cursor = _encode_cursor(rows[-1][0].name, rows[-1][0].id) if has_more else None
+    return items, next_cursor
+
+
+# =============================================================================
+# CACHE DA ÁRVORE
+# =============================================================================
+# Versão da hierarquia: incrementada a cada mutação de unidade/membership.
+# Entradas antigas ficam inalcançáveis e expiram pelo TTL, que também limita
+# quanto tempo outro worker (que não viu o bump) serve a árvore anterior.
+_org_tree_version = 0
+_org_tree_cache: TTLCache[tuple, tuple[str, bytes]] = TTLCache(
+    maxsize=1024, ttl=settings.org_tree_cache_ttl_seconds
+)
+_restricted_units_cache: TTLCache[int, frozenset[UUID]] = TTLCache(
+    maxsize=4, ttl=settings.org_tree_cache_ttl_seconds
+)
 
 
-def get_org_unit_members(db: Session, org_unit_id: UUID, user_id: UUID) -> list[OrgMembership]:
+def bump_org_tree_version() -> None:
+    """Invalida a árvore em cache (chamar após commit de mutações da hierarquia)."""
+    global _org_tree_version
+    _org_tree_version += 1
+
+
+async def _restricted_unit_ids(db: AsyncSession, version: int) -> frozenset[UUID]:
+    cached = _restricted_units_cache.get(version)
+    if cached is None:
+        ids = (await db.execute(
+            select(OrgUnit.id).where(OrgUnit.visibility == Visibility.RESTRICTED)
+        )).scalars().all()
+        cached = _restricted_units_cache[version] = frozenset(ids)
+    return cached
+
+
+async def get_org_tree_snapshot(db: AsyncSession, user_id: UUID) -> tuple[str, bytes]:
+    """
+    Retorna (ETag, JSON serializado) da árvore visível para o usuário.
+    
+    A chave é a versão da hierarquia + o conjunto de unidades RESTRICTED de que
+    o usuário é membro (ou "admin"), então usuários com a mesma visibilidade
+    compartilham a mesma entrada. O ETag é o hash do conteúdo (forte).
+    Com Principal, unidades restritas e árvore em cache, nenhuma consulta;
+    num miss do Principal, uma consulta para carregá-lo.
+    """
+    version = _org_tree_version
+    principal = await load_principal(db, user_id)
+    
+    if principal.is_admin:
+        visibility_key: object = "admin"
+    else:
+        restricted = await _restricted_unit_ids(db, version)
+        visibility_key = frozenset(principal.member_unit_ids & restricted)
+    
+    key = ("tree", version, visibility_key)
+    cached = _org_tree_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    tree = await get_org_tree(db, user_id)
+    body = OrgTreeResponse(root=tree).model_dump_json().encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    
+    # Só grava se nenhuma mutação aconteceu durante a montagem
+    if version == _org_tree_version:
+        _org_tree_cache[key] = (etag, body)
+    return etag, body
+
+
+async def get_org_unit_members(db: AsyncSession, org_unit_id: UUID, user_id: UUID) -> list[OrgMembership]:
     """Retorna membros de uma unidade."""
-    org_unit = db.get(OrgUnit, org_unit_id)
+    org_unit = await db.get(OrgUnit, org_unit_id)
     if not org_unit:
         raise OrgServiceError("org_unit_not_found", "Unidade não encontrada")
     
     # Verifica visibilidade
     if org_unit.visibility == Visibility.RESTRICTED:
-        if not is_member_of(db, user_id, org_unit_id):
+        if not await is_member_of(db, user_id, org_unit_id):
             raise OrgServiceError("permission_denied", "Unidade restrita")
     
-    result = db.execute(
+    result = await db.execute(
         select(OrgMembership)
         .where(
             OrgMembership.org_unit_id == org_unit_id,
             OrgMembership.status == MembershipStatus.ACTIVE,
         )
+        .options(
+            selectinload(OrgMembership.user).selectinload(User.profile),
+            selectinload(OrgMembership.user).selectinload(User.identities),
+        )
         .order_by(OrgMembership.role, OrgMembership.joined_at)
     )
     return list(result.scalars().all())
 
 
-def search_users_for_invite(
-    db: Session,
+async def search_users_for_invite(
+    db: AsyncSession,
     org_unit_id: UUID,
     user_id: UUID,
     query: str,
@@ -419,26 +892,26 @@ def search_users_for_invite(
     from app.db.models import UserProfile
     
     # Verifica se é coordenador
-    if not is_coordinator_of(db, user_id, org_unit_id):
+    if not await is_coordinator_of(db, user_id, org_unit_id):
         raise OrgServiceError("permission_denied", "Apenas coordenadores podem buscar usuários")
     
     # IDs de membros atuais
-    member_ids = db.execute(
+    member_ids = (await db.execute(
         select(OrgMembership.user_id)
         .where(
             OrgMembership.org_unit_id == org_unit_id,
             OrgMembership.status == MembershipStatus.ACTIVE,
         )
-    ).scalars().all()
+    )).scalars().all()
     
     # IDs com convite pendente
-    pending_ids = db.execute(
+    pending_ids = (await db.execute(
         select(OrgInvite.invited_user_id)
         .where(
             OrgInvite.org_unit_id == org_unit_id,
             OrgInvite.status == InviteStatus.PENDING,
         )
-    ).scalars().all()
+    )).scalars().all()
     
     exclude_ids = set(member_ids) | set(pending_ids)
     
@@ -451,6 +924,7 @@ def search_users_for_invite(
             User.is_active == True,
             UserProfile.full_name.ilike(search_term),
         )
+        .options(selectinload(User.profile), selectinload(User.identities))
     )
     
     if exclude_ids:
@@ -458,11 +932,11 @@ def search_users_for_invite(
     
     stmt = stmt.limit(limit)
     
-    return list(db.execute(stmt).scalars().all())
+    return list((await db.execute(stmt)).scalars().all())
 
 
-def update_member_role(
-    db: Session,
+async def update_member_role(
+    db: AsyncSession,
     org_unit_id: UUID,
     target_user_id: UUID,
     acting_user_id: UUID,
@@ -475,32 +949,32 @@ def update_member_role(
     - Não pode rebaixar a si mesmo se for único coordenador
     """
     # Verifica se é coordenador
-    if not is_coordinator_of(db, acting_user_id, org_unit_id):
+    if not await is_coordinator_of(db, acting_user_id, org_unit_id):
         raise OrgServiceError("permission_denied", "Apenas coordenadores podem alterar papéis")
     
     # Busca membership do target
-    membership = db.execute(
+    membership = (await db.execute(
         select(OrgMembership)
         .where(
             OrgMembership.org_unit_id == org_unit_id,
             OrgMembership.user_id == target_user_id,
             OrgMembership.status == MembershipStatus.ACTIVE,
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if not membership:
         raise OrgServiceError("member_not_found", "Membro não encontrado")
     
     # Se está rebaixando a si mesmo, verifica se há outros coordenadores
     if target_user_id == acting_user_id and new_role != OrgRoleCode.COORDINATOR:
-        coord_count = db.execute(
+        coord_count = (await db.execute(
             select(func.count(OrgMembership.id))
             .where(
                 OrgMembership.org_unit_id == org_unit_id,
                 OrgMembership.role == OrgRoleCode.COORDINATOR,
                 OrgMembership.status == MembershipStatus.ACTIVE,
             )
-        ).scalar()
+        )).scalar()
         
         if coord_count <= 1:
             raise OrgServiceError(
@@ -509,13 +983,15 @@ def update_member_role(
             )
     
     membership.role = new_role
-    db.commit()
-    db.refresh(membership)
+    await db.commit()
+    invalidate_principal(target_user_id)
+    bump_org_tree_version()
+    await db.refresh(membership)
     return membership
 
 
-def remove_member(
-    db: Session,
+async def remove_member(
+    db: AsyncSession,
     org_unit_id: UUID,
     target_user_id: UUID,
     acting_user_id: UUID,
@@ -528,35 +1004,35 @@ def remove_member(
     - Não pode remover último coordenador
     """
     # Busca membership do target
-    membership = db.execute(
+    membership = (await db.execute(
         select(OrgMembership)
         .where(
             OrgMembership.org_unit_id == org_unit_id,
             OrgMembership.user_id == target_user_id,
             OrgMembership.status == MembershipStatus.ACTIVE,
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if not membership:
         raise OrgServiceError("member_not_found", "Membro não encontrado")
     
     # Verifica permissão
     is_self = target_user_id == acting_user_id
-    is_coord = is_coordinator_of(db, acting_user_id, org_unit_id)
+    is_coord = await is_coordinator_of(db, acting_user_id, org_unit_id)
     
     if not is_self and not is_coord:
         raise OrgServiceError("permission_denied", "Você não tem permissão para remover este membro")
     
     # Se é coordenador sendo removido, verifica se há outros
     if membership.role == OrgRoleCode.COORDINATOR:
-        coord_count = db.execute(
+        coord_count = (await db.execute(
             select(func.count(OrgMembership.id))
             .where(
                 OrgMembership.org_unit_id == org_unit_id,
                 OrgMembership.role == OrgRoleCode.COORDINATOR,
                 OrgMembership.status == MembershipStatus.ACTIVE,
             )
-        ).scalar()
+        )).scalar()
         
         if coord_count <= 1:
             raise OrgServiceError(
@@ -567,21 +1043,23 @@ def remove_member(
     # Marca como removido (soft delete)
     membership.status = MembershipStatus.REMOVED
     membership.left_at = datetime.now(timezone.utc)
-    db.commit()
+    await db.commit()
+    invalidate_principal(target_user_id)
+    bump_org_tree_version()
 
 
-def get_user_permissions(db: Session, user_id: UUID, org_unit_id: UUID) -> dict:
+async def get_user_permissions(db: AsyncSession, user_id: UUID, org_unit_id: UUID) -> dict:
     """
     Retorna permissões do usuário em uma unidade.
     """
-    org_unit = db.get(OrgUnit, org_unit_id)
+    org_unit = await db.get(OrgUnit, org_unit_id)
     if not org_unit:
         return {"can_view": False}
     
-    is_coord = is_coordinator_of(db, user_id, org_unit_id)
-    is_memb = is_member_of(db, user_id, org_unit_id)
-    global_roles = get_user_global_roles(db, user_id)
-    is_admin = "ADMIN" in global_roles or "DEV" in global_roles
+    principal = await load_principal(db, user_id)
+    is_coord = principal.is_coordinator_of(org_unit_id)
+    is_memb = principal.is_member_of(org_unit_id)
+    is_admin = principal.is_admin
     
     # Verifica o que pode criar
     can_create = []
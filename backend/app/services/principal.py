@@ -0,0 +1,146 @@
+"""
+Principal
+=========
+Roles globais, memberships ativas e permissões do usuário autenticado.
+
+Carregado numa única consulta (UNION ALL) e mantido num cache curto entre
+requisições. Toda mutação de membership, convite, role ou permissão deve
+chamar invalidate_principal() para os usuários afetados.
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from cachetools import TTLCache
+from sqlalchemy import String, cast, literal, null, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.settings import settings
+from app.db.models import (
+    GlobalRole, UserGlobalRole,
+    OrgMembership, MembershipStatus, OrgRoleCode, OrgUnit,
+    UserPermission,
+)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Snapshot das permissões de um usuário."""
+    user_id: UUID
+    global_roles: frozenset[str] = frozenset()
+    memberships: Mapping[UUID, OrgRoleCode] = field(default_factory=dict)  # org_unit_id -> role
+    permissions: frozenset[str] = frozenset()
+
+    @property
+    def is_dev(self) -> bool:
+        return "DEV" in self.global_roles
+
+    @property
+    def is_admin(self) -> bool:
+        return "ADMIN" in self.global_roles or "DEV" in self.global_roles
+
+    @property
+    def member_unit_ids(self) -> set[UUID]:
+        return set(self.memberships)
+
+    def is_member_of(self, org_unit_id: UUID) -> bool:
+        return org_unit_id in self.memberships
+
+    def is_coordinator_of(self, org_unit_id: UUID) -> bool:
+        return self.memberships.get(org_unit_id) == OrgRoleCode.COORDINATOR
+
+    def has_permission(self, permission_code: str) -> bool:
+        return permission_code in self.permissions
+
+
+_principal_cache: TTLCache[UUID, Principal] = TTLCache(
+    maxsize=10_000, ttl=settings.principal_cache_ttl_seconds
+)
+# Incrementado a cada invalidação: um load concorrente não grava dado anterior à mutação
+_cache_epoch = 0
+
+
+async def load_principal(db: AsyncSession, user_id: UUID) -> Principal:
+    """Retorna o Principal do usuário (cache curto, uma consulta no miss)."""
+    cached = _principal_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    epoch = _cache_epoch
+    principal = await _fetch_principal(db, user_id)
+    if epoch == _cache_epoch:
+        _principal_cache[user_id] = principal
+    return principal
+
+
+def invalidate_principal(*user_ids: UUID) -> None:
+    """Descarta o Principal em cache dos usuários afetados por uma mutação."""
+    global _cache_epoch
+    _cache_epoch += 1
+    for user_id in user_ids:
+        _principal_cache.pop(user_id, None)
+
+
+def clear_principal_cache() -> None:
+    global _cache_epoch
+    _cache_epoch += 1
+    _principal_cache.clear()
+
+
+async def _fetch_principal(db: AsyncSession, user_id: UUID) -> Principal:
+    roles = (
+        select(
+            literal("role", String).label("kind"),
+            GlobalRole.code.label("value"),
+            null().label("extra"),
+        )
+        .join(UserGlobalRole, UserGlobalRole.global_role_id == GlobalRole.id)
+        .where(UserGlobalRole.user_id == user_id)
+    )
+    # Unidade desativada não dá direitos aos seus membros
+    memberships = (
+        select(
+            literal("membership", String),
+            cast(OrgMembership.org_unit_id, String),
+            cast(OrgMembership.role, String),
+        )
+        .join(OrgUnit, OrgUnit.id == OrgMembership.org_unit_id)
+        .where(
+            OrgMembership.user_id == user_id,
+            OrgMembership.status == MembershipStatus.ACTIVE,
+            OrgUnit.is_active == True,
+        )
+    )
+    permissions = (
+        select(
+            literal("permission", String),
+            UserPermission.permission_code,
+            null(),
+        )
+        .where(UserPermission.user_id == user_id)
+    )
+
+    global_roles: set[str] = set()
+    unit_roles: dict[UUID, OrgRoleCode] = {}
+    permission_codes: set[str] = set()
+
+    result = await db.execute(union_all(roles, memberships, permissions))
+    for kind, value, extra in result.all():
+        if kind == "role":
+            global_roles.add(value)
+        elif kind == "membership":
+            org_unit_id = UUID(value)
+            role = OrgRoleCode(extra)
+            # Se houver duas memberships ativas na mesma unidade, vale a de coordenador
+            if unit_roles.get(org_unit_id) != OrgRoleCode.COORDINATOR:
+                unit_roles[org_unit_id] = role
+        else:
+            permission_codes.add(value)
+
+    return Principal(
+        user_id=user_id,
+        global_roles=frozenset(global_roles),
+        memberships=unit_roles,
+        permissions=frozenset(permission_codes),
+    )
@@ -9,8 +9,10 @@ SEGURANÇA: CPF e RG são criptografados antes de armazenar.
 from datetime import datetime, timezone
 from uuid import UUID
 
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.core.settings import settings
 from app.crypto.service import crypto_service
@@ -22,6 +24,8 @@ from app.schemas.profile import (
     ProfileUpdateRequest,
 )
 from app.services.audit_service import create_audit_log
+from app.services.inbox_service import adjust_filter_facets, bump_filter_options_version, profile_facets
+from app.services.segment_index import segment_index
 
 
 class ProfileServiceError(Exception):
@@ -47,24 +51,23 @@ class EncryptionNotConfiguredError(ProfileServiceError):
 class ProfileService:
     """Serviço de gerenciamento de perfis."""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def get_catalogs(self) -> list[dict]:
+    async def get_catalogs(self) -> list[dict]:
         """Retorna todos os catálogos com itens ativos."""
-        catalogs = self.db.query(ProfileCatalog).all()
+        catalogs = (await self.db.execute(select(ProfileCatalog))).scalars().all()
         result = []
         
         for catalog in catalogs:
-            items = (
-                self.db.query(ProfileCatalogItem)
-                .filter(
+            items = (await self.db.execute(
+                select(ProfileCatalogItem)
+                .where(
                     ProfileCatalogItem.catalog_id == catalog.id,
                     ProfileCatalogItem.is_active == True,
                 )
                 .order_by(ProfileCatalogItem.sort_order)
-                .all()
-            )
+            )).scalars().all()
             result.append({
                 "code": catalog.code,
                 "name": catalog.name,
@@ -76,9 +79,13 @@ class ProfileService:
         
         return result
     
-    def get_profile(self, user_id: UUID) -> ProfileResponse:
+    async def get_profile(self, user_id: UUID) -> ProfileResponse:
         """Retorna perfil do usuário (sem CPF/RG)."""
-        profile = self.db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+        profile = (await self.db.execute(
+            select(UserProfile)
+            .where(UserProfile.user_id == user_id)
+            .options(selectinload(UserProfile.emergency_contacts))
+        )).scalar_one_or_none()
         
         if not profile:
             return ProfileResponse(
@@ -125,7 +132,7 @@ class ProfileService:
             has_documents=bool(profile.cpf_encrypted and profile.rg_encrypted),
         )
     
-    def update_profile(
+    async def update_profile(
         self,
         user_id: UUID,
         data: ProfileUpdateRequest,
@@ -146,8 +153,11 @@ class ProfileService:
         except ValueError as e:
             raise ProfileServiceError(str(e))
         
-        profile = self.db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+        profile = (await self.db.execute(
+            select(UserProfile).where(UserProfile.user_id == user_id)
+        )).scalar_one_or_none()
         
+        facets_before = profile_facets(profile)
         try:
             if profile:
                 self._update_existing_profile(profile, data, cpf_hash, cpf_encrypted, rg_encrypted)
@@ -156,7 +166,8 @@ class ProfileService:
                 profile = self._create_new_profile(user_id, data, cpf_hash, cpf_encrypted, rg_encrypted)
                 action = "profile_created"
             
-            self.db.flush()
+            await self.db.flush()
+            await adjust_filter_facets(self.db, facets_before, profile_facets(profile))
             
             if settings.enable_audit:
                 create_audit_log(
@@ -170,11 +181,13 @@ class ProfileService:
                     metadata={"status": profile.status},
                 )
             
-            self.db.commit()
-            self.db.refresh(profile)
+            await self.db.commit()
+            await self.db.refresh(profile)
+            segment_index.update_profile(profile)
+            bump_filter_options_version()
             
         except IntegrityError as e:
-            self.db.rollback()
+            await self.db.rollback()
             error_str = str(e)
             if "cpf_hash" in error_str:
                 raise CPFAlreadyExistsError("CPF já cadastrado")
@@ -182,7 +195,7 @@ class ProfileService:
                 raise PhoneAlreadyExistsError("Telefone já cadastrado")
             raise
         
-        return self.get_profile(user_id)
+        return await self.get_profile(user_id)
     
     def _update_existing_profile(
         self,
@@ -247,22 +260,22 @@ class ProfileService:
         else:
             profile.status = "PENDING_VERIFICATION"
     
-    def add_emergency_contact(
+    async def add_emergency_contact(
         self,
         user_id: UUID,
         data: EmergencyContactRequest,
     ) -> EmergencyContactResponse:
         """Adiciona ou atualiza contato de emergência."""
-        profile = self.db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+        profile = await self.db.get(UserProfile, user_id)
         
         if not profile:
             raise ProfileServiceError("Perfil deve ser criado primeiro")
         
-        existing = (
-            self.db.query(UserEmergencyContact)
-            .filter(UserEmergencyContact.user_id == user_id)
-            .first()
-        )
+        existing = (await self.db.execute(
+            select(UserEmergencyContact)
+            .where(UserEmergencyContact.user_id == user_id)
+            .limit(1)
+        )).scalar_one_or_none()
         
         if existing:
             existing.contact_name = data.name
@@ -278,8 +291,8 @@ class ProfileService:
             )
             self.db.add(contact)
         
-        self.db.commit()
-        self.db.refresh(contact)
+        await self.db.commit()
+        await self.db.refresh(contact)
         
         return EmergencyContactResponse(
             id=contact.id,
@@ -0,0 +1,225 @@
+"""
+Segment Index
+=============
+Índice em memória dos segmentos de público do inbox (prévia de envio).
+
+Um bitmap por valor de realidade vocacional, estado de vida, estado civil,
+UF e cidade, sobre posições densas atribuídas aos usuários. Contar um
+filtro é AND entre campos e OR dentro de cada campo, sem ir ao banco.
+
+Construído no startup e reconstruído periodicamente; perfis alterados e
+usuários novos entram incrementalmente neste processo (os demais workers
+os veem no próximo rebuild).
+"""
+
+import asyncio
+from datetime import datetime
+from uuid import UUID
+
+import structlog
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import ProfileCatalogItem, User, UserProfile
+from app.db.session import AsyncSessionLocal
+from app.schemas.inbox import InboxFilters
+
+logger = structlog.get_logger()
+
+# Campo do índice -> atributo de InboxFilters
+SEGMENT_FIELDS = {
+    "vocational_reality": "vocational_reality_codes",
+    "life_state": "life_state_codes",
+    "marital_status": "marital_status_codes",
+    "state": "states",
+    "city": "cities",
+}
+_NO_VALUES = (None,) * len(SEGMENT_FIELDS)
+
+
+class Bitmap:
+    """
+    Bitmap sobre int a partir da menor posição (offset): um segmento ocupa
+    só o trecho entre o primeiro e o último usuário dele. O rebuild agrupa
+    as posições por (UF, cidade), então esses segmentos ficam contíguos.
+    """
+    __slots__ = ("offset", "bits")
+
+    def __init__(self) -> None:
+        self.offset = 0
+        self.bits = 0
+
+    def add(self, position: int) -> None:
+        if not self.bits:
+            self.offset, self.bits = position, 1
+        elif position < self.offset:
+            self.bits = (self.bits << (self.offset - position)) | 1
+            self.offset = position
+        else:
+            self.bits |= 1 << (position - self.offset)
+
+    def discard(self, position: int) -> None:
+        if self.bits and position >= self.offset:
+            self.bits &= ~(1 << (position - self.offset))
+
+    def __int__(self) -> int:
+        return self.bits << self.offset
+
+
+class SegmentIndex:
+    """Bitmaps por valor de segmento + bitmap dos usuários ativos."""
+
+    def __init__(self) -> None:
+        self._positions: dict[UUID, int] = {}
+        self._values: list[tuple] = []  # posição -> valores atuais, na ordem de SEGMENT_FIELDS
+        self._active = 0
+        self._segments: dict[str, dict[str, Bitmap]] = {f: {} for f in SEGMENT_FIELDS}
+        self._item_codes: dict[UUID, str] = {}
+        self._replay: list[tuple] | None = None  # alterações durante um rebuild
+        self.built_at: datetime | None = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.built_at is not None
+
+    # === CONSULTA ===
+
+    def count(self, send_to_all: bool, filters: InboxFilters | None) -> int:
+        """Mesma semântica de InboxService._recipients_query."""
+        if send_to_all:
+            return self._active.bit_count()
+        if not filters:
+            return 0
+
+        result = self._active
+        for field, attr in SEGMENT_FIELDS.items():
+            values = getattr(filters, attr)
+            if not values:
+                continue
+            segments = self._segments[field]
+            union = 0
+            for value in values:
+                if value in segments:
+                    union |= int(segments[value])
+            result &= union
+            if not result:
+                break
+        return result.bit_count()
+
+    # === MANUTENÇÃO ===
+
+    async def rebuild(self, db: AsyncSession) -> int:
+        """
+        Recarrega o índice inteiro. Alterações que chegam durante a carga são
+        reaplicadas sobre o resultado.
+        Returns: quantidade de usuários indexados
+        """
+        self._replay = []
+        try:
+            items = (await db.execute(
+                select(ProfileCatalogItem.id, ProfileCatalogItem.code)
+            )).all()
+            rows = (await db.execute(
+                select(
+                    User.id,
+                    User.is_active,
+                    UserProfile.vocational_reality_item_id,
+                    UserProfile.life_state_item_id,
+                    UserProfile.marital_status_item_id,
+                    UserProfile.state,
+                    UserProfile.city,
+                )
+                .join(UserProfile, UserProfile.user_id == User.id, isouter=True)
+                .order_by(UserProfile.state, UserProfile.city, User.id)
+            )).all()
+        finally:
+            replay, self._replay = self._replay, None
+
+        fresh = SegmentIndex()
+        fresh._item_codes = {item_id: code for item_id, code in items}
+        for row in rows:
+            fresh._set(row.id, row.is_active, fresh._profile_values(
+                row.vocational_reality_item_id, row.life_state_item_id, row.marital_status_item_id,
+                row.state, row.city,
+            ))
+        for user_id, is_active, profile in replay:
+            fresh._apply(user_id, is_active, profile)
+
+        self._positions, self._values, self._active = fresh._positions, fresh._values, fresh._active
+        self._segments, self._item_codes = fresh._segments, fresh._item_codes
+        self.built_at = datetime.utcnow()
+        return len(rows)
+
+    def add_user(self, user_id: UUID) -> None:
+        """Usuário novo (ativo, sem perfil)."""
+        self._record(user_id, True, None)
+
+    def update_profile(self, profile: UserProfile) -> None:
+        """Perfil criado ou alterado (chamar após o commit)."""
+        self._record(profile.user_id, None, profile)
+
+    def _record(self, user_id: UUID, is_active: bool | None, profile: UserProfile | None) -> None:
+        if self._replay is not None:
+            self._replay.append((user_id, is_active, profile))
+        if self.is_ready:
+            self._apply(user_id, is_active, profile)
+
+    def _apply(self, user_id: UUID, is_active: bool | None, profile: UserProfile | None) -> None:
+        position = self._positions.get(user_id)
+        if is_active is None:
+            is_active = True if position is None else bool(self._active >> position & 1)
+        if profile is not None:
+            values = self._profile_values(
+                profile.vocational_reality_item_id, profile.life_state_item_id,
+                profile.marital_status_item_id, profile.state, profile.city,
+            )
+        elif position is not None:
+            values = self._values[position]
+        else:
+            values = _NO_VALUES
+        self._set(user_id, is_active, values)
+
+    def _profile_values(self, vocational_id, life_state_id, marital_id, state, city) -> tuple:
+        return (
+            self._item_codes.get(vocational_id),
+            self._item_codes.get(life_state_id),
+            self._item_codes.get(marital_id),
+            state,
+            city,
+        )
+
+    def _set(self, user_id: UUID, is_active: bool, values: tuple) -> None:
+        position = self._positions.get(user_id)
+        if position is None:
+            position = self._positions[user_id] = len(self._values)
+            self._values.append(_NO_VALUES)
+
+        previous = self._values[position]
+        for field, old, new in zip(SEGMENT_FIELDS, previous, values):
+            if old == new:
+                continue
+            if old is not None:
+                self._segments[field][old].discard(position)
+            if new is not None:
+                self._segments[field].setdefault(new, Bitmap()).add(position)
+        self._values[position] = values
+
+        if is_active:
+            self._active |= 1 << position
+        else:
+            self._active &= ~(1 << position)
+
+
+segment_index = SegmentIndex()
+
+
+async def segment_index_loop(interval_seconds: int) -> None:
+    """Constrói o índice no startup e o reconstrói a cada intervalo."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                users = await segment_index.rebuild(db)
+            logger.info("inbox_segment_index_built", users=users)
+        except Exception:
+            logger.exception("inbox_segment_index_failed")
+        await asyncio.sleep(interval_seconds)
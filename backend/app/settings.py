@@ -33,6 +33,7 @@ class Settings(BaseSettings):
     # =========================================================================
     secret_key: str = Field(default="change-me-in-production")
     auth_mode: Literal["DEV", "PROD"] = Field(default="DEV")
+    principal_cache_ttl_seconds: int = Field(default=30)  # Cache de roles/memberships por usuário
     cors_origins: str = Field(default="http://localhost:3000,http://localhost:8080,http://localhost:8081")
     
     # Criptografia (CPF/RG)
@@ -51,6 +52,7 @@ class Settings(BaseSettings):
     # INTEGRATIONS
     # =========================================================================
     firebase_project_id: str = Field(default="")
+    firebase_certs_cache_path: str = Field(default="")  # Cache em disco das chaves públicas (warm-start)
 
     # =========================================================================
     # FEATURE FLAGS
@@ -74,6 +76,22 @@ class Settings(BaseSettings):
     # =========================================================================
     invite_expiration_days: int = Field(default=7)
 
+    # =========================================================================
+    # ORGANIZATION
+    # =========================================================================
+    org_tree_cache_ttl_seconds: int = Field(default=60)
+
+    # =========================================================================
+    # INBOX
+    # =========================================================================
+    inbox_maintenance_interval_seconds: int = Field(default=600)  # expurgo + reconciliação; 0 desliga
+    inbox_read_receipt_flush_seconds: float = Field(default=0)  # >0 agrupa leituras individuais em lotes
+    inbox_segment_index_refresh_seconds: int = Field(default=900)  # índice da prévia de envio; 0 desliga
+    inbox_filter_options_cache_ttl_seconds: int = Field(default=60)  # opções de filtro com contagens
+    inbox_timeline_cache_enabled: bool = Field(default=False)  # timelines no Redis (redis_url)
+    inbox_timeline_ttl_seconds: int = Field(default=3600)  # timeline sem uso é remontada depois disso
+    inbox_dispatch_interval_seconds: int = Field(default=30)  # envios agendados e retomada de fan-out; 0 desliga
+
     # =========================================================================
     # COMPUTED
     # =========================================================================
@@ -81,6 +99,25 @@ class Settings(BaseSettings):
     def cors_origins_list(self) -> list[str]:
         return [o.strip() for o in self.cors_origins.split(",") if o.strip()]
 
+    def _database_url_with_driver(self, sqlite_driver: str | None) -> str:
+        """DATABASE_URL com driver explícito: psycopg3 no Postgres (o psycopg2 não é dependência)."""
+        url = self.database_url
+        if url.startswith("postgresql://"):
+            return url.replace("postgresql://", "postgresql+psycopg://", 1)
+        if sqlite_driver and url.startswith("sqlite://"):
+            return url.replace("sqlite://", f"sqlite+{sqlite_driver}://", 1)
+        return url
+
+    @property
+    def async_database_url(self) -> str:
+        """URL do banco com driver assíncrono (psycopg3 / aiosqlite)."""
+        return self._database_url_with_driver("aiosqlite")
+
+    @property
+    def sync_database_url(self) -> str:
+        """URL do banco com driver síncrono (psycopg3 / sqlite3), usada pelo Alembic."""
+        return self._database_url_with_driver(None)
+
     @property
     def is_dev(self) -> bool:
         return self.environment in ("dev", "test")
@@ -0,0 +1,134 @@
+"""
+Inbox Benchmark
+===============
+Compara a listagem do inbox antiga (2 counts + página + 1 consulta de
+remetente por mensagem) com a consulta única de InboxService.get_user_inbox.
+
+Usa o DATABASE_URL configurado (rode `alembic upgrade head` antes). Os dados
+são criados numa transação que é desfeita no final.
+
+    python -m scripts.bench_inbox --messages 500 --limit 50 --runs 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import InboxMessage, InboxMessageType, InboxRecipient, User, UserProfile
+from app.db.session import engine
+from app.services.inbox_service import InboxService
+
+
+async def legacy_get_user_inbox(db: AsyncSession, user_id: UUID, limit: int, offset: int) -> tuple[list[dict], int, int]:
+    """Implementação anterior, mantida só para comparação."""
+    now = datetime.utcnow()
+    base_query = (
+        select(InboxRecipient, InboxMessage)
+        .join(InboxMessage, InboxRecipient.message_id == InboxMessage.id)
+        .where(InboxRecipient.user_id == user_id, InboxMessage.expires_at > now)
+        .order_by(InboxRecipient.read.asc(), InboxMessage.created_at.desc())
+    )
+    count_query = (
+        select(func.count())
+        .select_from(InboxRecipient)
+        .join(InboxMessage, InboxRecipient.message_id == InboxMessage.id)
+        .where(InboxRecipient.user_id == user_id, InboxMessage.expires_at > now)
+    )
+    total = (await db.execute(count_query)).scalar() or 0
+    unread_count = (await db.execute(count_query.where(InboxRecipient.read == False))).scalar() or 0
+
+    messages = []
+    for recipient, message in (await db.execute(base_query.limit(limit).offset(offset))).all():
+        sender = (await db.execute(
+            select(UserProfile.full_name).where(UserProfile.user_id == message.created_by_user_id)
+        )).scalar_one_or_none()
+        messages.append({"id": str(recipient.id), "title": message.title, "sender_name": sender or "Lumen+"})
+    return messages, total, unread_count
+
+
+async def seed(db: AsyncSession, message_count: int) -> UUID:
+    """Um leitor e um remetente com perfil; message_count mensagens, 1/3 lidas."""
+    reader_id, sender_id = uuid4(), uuid4()
+    now = datetime.utcnow()
+    await db.execute(insert(User), [{"id": reader_id}, {"id": sender_id}])
+    await db.execute(insert(UserProfile), [{"user_id": sender_id, "full_name": "Remetente"}])
+
+    messages, recipients = [], []
+    for i in range(message_count):
+        message_id = uuid4()
+        messages.append({
+            "id": message_id,
+            "title": f"Aviso {i}",
+            "message": "Conteúdo do aviso de benchmark",
+            "type": InboxMessageType.INFO,
+            "created_by_user_id": sender_id,
+            "created_at": now - timedelta(minutes=i),
+            "expires_at": now + timedelta(days=30),
+        })
+        recipients.append({
+            "id": uuid4(),
+            "message_id": message_id,
+            "user_id": reader_id,
+            "read": i % 3 == 0,
+            "created_at": messages[-1]["created_at"],
+            "expires_at": messages[-1]["expires_at"],
+        })
+    await db.execute(insert(InboxMessage), messages)
+    await db.execute(insert(InboxRecipient), recipients)
+    await db.flush()
+    return reader_id
+
+
+async def measure(label: str, runs: int, call) -> None:
+    statements = 0
+
+    def count(*_args) -> None:
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        timings = []
+        for _ in range(runs):
+            statements = 0
+            started = time.perf_counter()
+            await call()
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+    print(
+        f"{label:<8} round trips={statements:<4} "
+        f"p50={statistics.median(timings):7.2f}ms  max={max(timings):7.2f}ms"
+    )
+
+
+async def main(message_count: int, limit: int, runs: int) -> None:
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        db = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+        try:
+            user_id = await seed(db, message_count)
+            service = InboxService(db)
+            print(f"{message_count} mensagens, página de {limit}, {runs} execuções")
+            await measure("antes", runs, lambda: legacy_get_user_inbox(db, user_id, limit, 0))
+            await measure("depois", runs, lambda: service.get_user_inbox(user_id, limit=limit))
+        finally:
+            await db.close()
+            await transaction.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da listagem do inbox")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.limit, args.runs))
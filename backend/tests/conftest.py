@@ -4,15 +4,25 @@ Test Configuration
 Fixtures e configurações para pytest.
 """
 
+import asyncio
 import os
-from typing import Generator
-from uuid import uuid4
+from collections.abc import AsyncGenerator, Awaitable, Callable, Generator
+from datetime import datetime
+from typing import Any, TypeVar
+from uuid import UUID, uuid4
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+# Postgres dos testes que dependem dele (partições, ON CONFLICT, bitmaps):
+# TEST_POSTGRES_URL ou o DATABASE_URL do CI, lido antes de ser trocado abaixo
+_ENV_DATABASE_URL = os.environ.get("DATABASE_URL", "")
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL") or (
+    _ENV_DATABASE_URL if _ENV_DATABASE_URL.startswith("postgresql://") else ""
+)
 
 # Configura ambiente de teste ANTES de importar app
 os.environ["ENVIRONMENT"] = "test"
@@ -22,47 +32,60 @@ os.environ["DEBUG_VERIFICATION_CODE"] = "true"
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
 os.environ["ENCRYPTION_KEY"] = "dGVzdC1lbmNyeXB0aW9uLWtleS0zMi1ieXRlcyE="  # 32 bytes base64
 os.environ["HMAC_PEPPER"] = "dGVzdC1obWFjLXBlcHBlci0zMi1ieXRlcyEh"  # 32 bytes base64
+os.environ["INBOX_SEGMENT_INDEX_REFRESH_SECONDS"] = "0"  # sem rebuild do índice contra o banco do app
 
-from app.db.models import Base
+from app.db.models import (
+    Base,
+    InboxDeliveryStatus,
+    InboxMessage,
+    InboxRecipient,
+    OrgMembership,
+    OrgRoleCode,
+    OrgUnit,
+    OrgUnitType,
+    ProfileCatalog,
+    ProfileCatalogItem,
+    User,
+    UserProfile,
+)
 from app.db.session import get_db
 from app.main import app
+from app.schemas.inbox import InboxFilters
+from app.services import inbox_service, segment_index
+from app.services.inbox_service import INBOX_PARTITIONED_TABLES, _month_start, _partition_name
+from app.services.organization import add_org_unit_closure
+from app.settings import Settings
+
+T = TypeVar("T")
 
 
 # =============================================================================
 # DATABASE FIXTURES
 # =============================================================================
 @pytest.fixture(scope="function")
-def db_engine():
-    """Cria engine de teste em memória."""
-    engine = create_engine(
-        "sqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    Base.metadata.create_all(bind=engine)
-    yield engine
-    Base.metadata.drop_all(bind=engine)
+def db_engine(tmp_path) -> Generator[AsyncEngine, None, None]:
+    """Cria engine assíncrona de teste num SQLite temporário.
 
+    O schema é criado com uma engine síncrona; a engine assíncrona usa
+    NullPool para que cada conexão nasça no event loop do TestClient.
+    """
+    db_file = tmp_path / "test.db"
+    sync_engine = create_engine(f"sqlite:///{db_file}")
+    Base.metadata.create_all(bind=sync_engine)
+    sync_engine.dispose()
 
-@pytest.fixture(scope="function")
-def db_session(db_engine) -> Generator[Session, None, None]:
-    """Cria sessão de teste."""
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
-    session = TestingSessionLocal()
-    try:
-        yield session
-    finally:
-        session.close()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}", poolclass=NullPool)
+    yield engine
 
 
 @pytest.fixture(scope="function")
-def client(db_session: Session) -> Generator[TestClient, None, None]:
+def client(db_engine: AsyncEngine) -> Generator[TestClient, None, None]:
     """Cliente de teste com banco isolado."""
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    TestingSessionLocal = async_sessionmaker(db_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db() -> AsyncGenerator[AsyncSession, None]:
+        async with TestingSessionLocal() as db:
+            yield db
     
     app.dependency_overrides[get_db] = override_get_db
     
@@ -72,6 +95,183 @@ def client(db_session: Session) -> Generator[TestClient, None, None]:
     app.dependency_overrides.clear()
 
 
+# =============================================================================
+# POSTGRES FIXTURES
+# =============================================================================
+class PostgresTestDatabase:
+    """Postgres limpo para um teste, com fábricas de dados."""
+
+    def __init__(self, sessions: async_sessionmaker[AsyncSession]) -> None:
+        self.sessions = sessions
+
+    def run(self, scenario: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """Roda scenario(session) num event loop próprio."""
+        async def main() -> T:
+            async with self.sessions() as db:
+                return await scenario(db)
+        return asyncio.run(main())
+
+    async def user(
+        self,
+        db: AsyncSession,
+        *,
+        is_active: bool = True,
+        created_at: datetime | None = None,
+        full_name: str | None = None,
+        state: str | None = None,
+        city: str | None = None,
+        marital_status: str | None = None,
+    ) -> UUID:
+        """Usuário com perfil (marital_status = código do catálogo). Commita."""
+        user = User(id=uuid4(), is_active=is_active)
+        if created_at is not None:
+            user.created_at = created_at
+        db.add(user)
+        await db.flush()
+        db.add(UserProfile(
+            user_id=user.id,
+            full_name=full_name,
+            state=state,
+            city=city,
+            marital_status_item_id=await self.catalog_item(db, "MARITAL_STATUS", marital_status),
+        ))
+        await db.commit()
+        return user.id
+
+    async def catalog_item(self, db: AsyncSession, catalog: str, code: str | None) -> UUID | None:
+        """Id do item de catálogo, criado na primeira vez."""
+        if code is None:
+            return None
+        catalog_id = (await db.execute(
+            select(ProfileCatalog.id).where(ProfileCatalog.code == catalog)
+        )).scalar()
+        if catalog_id is None:
+            catalog_id = uuid4()
+            db.add(ProfileCatalog(id=catalog_id, code=catalog, name=catalog))
+            await db.flush()
+        item_id = (await db.execute(
+            select(ProfileCatalogItem.id)
+            .where(ProfileCatalogItem.catalog_id == catalog_id, ProfileCatalogItem.code == code)
+        )).scalar()
+        if item_id is None:
+            item_id = uuid4()
+            db.add(ProfileCatalogItem(id=item_id, catalog_id=catalog_id, code=code, label=code))
+            await db.flush()
+        return item_id
+
+    async def org_unit(self, db: AsyncSession, parent_id: UUID | None = None, is_active: bool = True) -> UUID:
+        """Unidade (com closure) abaixo de parent_id. Commita."""
+        unit = OrgUnit(
+            id=uuid4(),
+            type=OrgUnitType.GRUPO if parent_id else OrgUnitType.CONSELHO_GERAL,
+            name="Unidade",
+            slug=f"unidade-{uuid4().hex[:12]}",
+            parent_id=parent_id,
+            is_active=is_active,
+        )
+        db.add(unit)
+        await db.flush()
+        await add_org_unit_closure(db, unit.id, parent_id)
+        await db.commit()
+        return unit.id
+
+    async def member(
+        self, db: AsyncSession, user_id: UUID, org_unit_id: UUID, role: OrgRoleCode = OrgRoleCode.MEMBER,
+    ) -> None:
+        db.add(OrgMembership(user_id=user_id, org_unit_id=org_unit_id, role=role))
+        await db.commit()
+
+    async def send(
+        self,
+        db: AsyncSession,
+        filters: InboxFilters | None = None,
+        *,
+        deliver: bool = True,
+        sender: UUID | None = None,
+        title: str = "Aviso",
+        message: str = "Conteúdo do aviso",
+        **kwargs: Any,
+    ) -> UUID:
+        """Aviso de um remetente novo: broadcast sem filters; segmentado já distribuído se deliver."""
+        sender = sender or await self.user(db)
+        service = inbox_service.InboxService(db)
+        message_id, _, status = await service.send_message(
+            title=title, message=message, message_type="info", created_by_user_id=sender,
+            send_to_all=filters is None, filters=filters, **kwargs,
+        )
+        if deliver and filters is not None and status == InboxDeliveryStatus.PENDING:
+            await service.deliver_message(message_id, send_to_all=False, filters=filters)
+        return message_id
+
+    async def recipients(self, db: AsyncSession, message_id: UUID) -> set[UUID]:
+        """Usuários com linha em inbox_recipients para a mensagem."""
+        return set((await db.execute(
+            select(InboxRecipient.user_id).where(InboxRecipient.message_id == message_id)
+        )).scalars())
+
+    async def message(self, db: AsyncSession, message_id: UUID) -> InboxMessage:
+        """Mensagem relida do banco (não da identity map)."""
+        return (await db.execute(
+            select(InboxMessage).where(InboxMessage.id == message_id).execution_options(populate_existing=True)
+        )).scalar_one()
+
+    async def scalar(self, db: AsyncSession, sql: str, **params: Any) -> Any:
+        return (await db.execute(text(sql), params)).scalar()
+
+
+async def _reset_postgres(engine: AsyncEngine) -> None:
+    """Esvazia as tabelas e garante as partições do inbox de 3 meses atrás a 3 à frente."""
+    async with engine.begin() as conn:
+        tables = (await conn.execute(
+            text("""
+                SELECT c.relname FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+                  AND NOT c.relispartition
+            """)
+        )).scalars().all()
+        await conn.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+        now = datetime.utcnow()
+        for offset in range(-3, 4):
+            month = _month_start(now, offset)
+            for table in INBOX_PARTITIONED_TABLES:
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {_partition_name(table, month)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') "
+                    f"TO ('{_month_start(month, 1):%Y-%m-%d} 00:00:00+00')"
+                ))
+
+
+@pytest.fixture(scope="session")
+def pg_url() -> str:
+    """URL assíncrona do Postgres de teste; schema recriado dos modelos uma vez por sessão."""
+    if not TEST_POSTGRES_URL:
+        pytest.skip("Postgres de teste não configurado (TEST_POSTGRES_URL)")
+    test_settings = Settings(database_url=TEST_POSTGRES_URL)
+    sync_engine = create_engine(test_settings.sync_database_url)
+    with sync_engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+        Base.metadata.create_all(bind=conn)
+    sync_engine.dispose()
+    return test_settings.async_database_url
+
+
+@pytest.fixture
+def pg(pg_url: str, monkeypatch: pytest.MonkeyPatch) -> Generator[PostgresTestDatabase, None, None]:
+    """
+    Postgres limpo para o teste. Os serviços que abrem sessão própria
+    (AsyncSessionLocal) usam o mesmo banco.
+    """
+    engine = create_async_engine(pg_url, poolclass=NullPool)
+    asyncio.run(_reset_postgres(engine))
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    monkeypatch.setattr(inbox_service, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(segment_index, "AsyncSessionLocal", sessions)
+    yield PostgresTestDatabase(sessions)
+    asyncio.run(engine.dispose())
+
+
 # =============================================================================
 # AUTH FIXTURES
 # =============================================================================
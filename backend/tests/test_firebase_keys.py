@@ -0,0 +1,196 @@
+"""
+Firebase Key Manager Tests
+==========================
+Testes de cache/renovação das chaves públicas contra um servidor stub local.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.auth.firebase import FirebaseKeyManager, parse_max_age
+
+
+class StubCertServer:
+    """Servidor HTTP local que imita o endpoint de certificados do Google."""
+
+    def __init__(self, keys: dict[str, str], max_age: int = 3600, delay: float = 0.0):
+        self.keys = keys
+        self.max_age = max_age
+        self.delay = delay
+        self.hits = 0
+        self.fail = False
+        self.fail_status = 503
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                stub.hits += 1
+                time.sleep(stub.delay)
+                if stub.fail:
+                    self.send_response(stub.fail_status)
+                    self.end_headers()
+                    return
+                body = json.dumps(stub.keys).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", f"public, max-age={stub.max_age}, must-revalidate")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/certs"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def cert_server():
+    server = StubCertServer({"kid-1": "cert-1"}, max_age=120, delay=0.05)
+    yield server
+    server.close()
+
+
+class TestParseMaxAge:
+    def test_reads_max_age(self):
+        assert parse_max_age("public, max-age=19302, must-revalidate, no-transform") == 19302
+
+    def test_missing_header(self):
+        assert parse_max_age(None) is None
+        assert parse_max_age("no-cache") is None
+
+
+class TestFirebaseKeyManager:
+    def test_concurrent_requests_share_single_fetch(self, cert_server: StubCertServer):
+        """Requisições simultâneas com cache frio disparam um único fetch."""
+        async def scenario():
+            manager = FirebaseKeyManager(certs_url=cert_server.url)
+            results = await asyncio.gather(*(manager.get_keys() for _ in range(20)))
+            await manager.stop()
+            return results
+
+        results = asyncio.run(scenario())
+        assert all(r == {"kid-1": "cert-1"} for r in results)
+        assert cert_server.hits == 1
+
+    def test_honours_cache_control_max_age(self, cert_server: StubCertServer):
+        async def scenario():
+            manager = FirebaseKeyManager(certs_url=cert_server.url)
+            await manager.get_keys()
+            await manager.get_keys()
+            await manager.stop()
+            return manager
+
+        manager = asyncio.run(scenario())
+        assert cert_server.hits == 1
+        assert 100 < manager._expires_at - time.time() <= 120
+
+    def test_background_refresh_ahead_of_expiry(self, cert_server: StubCertServer):
+        """A task de background renova antes de expirar, sem requisição no caminho."""
+        cert_server.max_age = 2
+        cert_server.delay = 0
+
+        async def scenario():
+            manager = FirebaseKeyManager(certs_url=cert_server.url, refresh_margin=1)
+            await manager.get_keys()
+            cert_server.keys = {"kid-2": "cert-2"}
+            manager.start()
+            await asyncio.sleep(1.5)
+            keys = manager._keys
+            await manager.stop()
+            return keys
+
+        assert asyncio.run(scenario()) == {"kid-2": "cert-2"}
+        assert cert_server.hits >= 2
+
+    def test_warm_start_from_disk(self, cert_server: StubCertServer, tmp_path):
+        """Worker novo verifica tokens com as chaves persistidas, sem fetch."""
+        cache_path = str(tmp_path / "certs.json")
+
+        async def first_worker():
+            manager = FirebaseKeyManager(certs_url=cert_server.url, cache_path=cache_path)
+            await manager.get_keys()
+            await manager.stop()
+
+        async def cold_worker():
+            manager = FirebaseKeyManager(certs_url=cert_server.url, cache_path=cache_path)
+            keys = await manager.get_keys()
+            await manager.stop()
+            return keys
+
+        asyncio.run(first_worker())
+        assert asyncio.run(cold_worker()) == {"kid-1": "cert-1"}
+        assert cert_server.hits == 1
+
+    def test_stale_keys_served_when_fetch_fails(self, cert_server: StubCertServer, tmp_path):
+        cache_path = tmp_path / "certs.json"
+        cache_path.write_text(json.dumps({"keys": {"kid-old": "cert-old"}, "expires_at": 0}))
+        cert_server.fail = True
+
+        async def scenario():
+            manager = FirebaseKeyManager(certs_url=cert_server.url, cache_path=str(cache_path))
+            keys = await manager.get_keys()
+            await manager.stop()
+            return keys
+
+        assert asyncio.run(scenario()) == {"kid-old": "cert-old"}
+
+    def test_fetch_failure_without_keys_raises(self, cert_server: StubCertServer):
+        cert_server.fail = True
+
+        async def scenario():
+            manager = FirebaseKeyManager(certs_url=cert_server.url)
+            try:
+                await manager.get_keys()
+            finally:
+                await manager.stop()
+
+        with pytest.raises(ValueError, match="Failed to fetch Firebase public keys"):
+            asyncio.run(scenario())
+
+    def test_expired_keys_served_without_waiting_on_failed_fetch(self, cert_server: StubCertServer, tmp_path):
+        """Google fora do ar: nenhuma requisição espera o fetch, e só um é feito até retry_at."""
+        cache_path = tmp_path / "certs.json"
+        cache_path.write_text(json.dumps({"keys": {"kid-old": "cert-old"}, "expires_at": 0}))
+        cert_server.fail = True
+        cert_server.fail_status = 500
+        cert_server.delay = 0.5
+
+        async def scenario():
+            manager = FirebaseKeyManager(certs_url=cert_server.url, cache_path=str(cache_path))
+            started = time.monotonic()
+            results = await asyncio.gather(*(manager.get_keys() for _ in range(20)))
+            elapsed = time.monotonic() - started
+            await manager._stale_refresh
+            results.append(await manager.get_keys())
+            await manager.stop()
+            return results, elapsed
+
+        results, elapsed = asyncio.run(scenario())
+        assert all(r == {"kid-old": "cert-old"} for r in results)
+        assert elapsed < cert_server.delay
+        assert cert_server.hits == 1
+
+    def test_failed_fetch_without_keys_not_repeated_before_retry(self, cert_server: StubCertServer):
+        cert_server.fail = True
+
+        async def scenario():
+            manager = FirebaseKeyManager(certs_url=cert_server.url)
+            outcomes = await asyncio.gather(*(manager.get_keys() for _ in range(5)), return_exceptions=True)
+            await manager.stop()
+            return outcomes
+
+        assert all(isinstance(o, ValueError) for o in asyncio.run(scenario()))
+        assert cert_server.hits == 1
@@ -0,0 +1,136 @@
+"""
+Firebase Token Verification Tests
+=================================
+Cache de chaves parseadas e de tokens já verificados (RS256).
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from jose import jwt
+
+from app.auth.firebase import FirebaseAuth, FirebaseKeyManager
+
+PROJECT_ID = "lumen-test"
+
+
+def _make_signing_key() -> tuple[str, str]:
+    """Gera chave privada + certificado autoassinado (PEM)."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(private_key, hashes.SHA256())
+    )
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    return private_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+@pytest.fixture(scope="module")
+def signing_key() -> tuple[str, str]:
+    return _make_signing_key()
+
+
+def _make_auth(keys: dict[str, str]) -> FirebaseAuth:
+    manager = FirebaseKeyManager(certs_url="http://127.0.0.1:9/unused")
+    manager._keys = keys
+    manager._expires_at = time.time() + 3600
+    return FirebaseAuth(project_id=PROJECT_ID, key_manager=manager)
+
+
+def _make_token(private_pem: str, kid: str = "kid-1", sub: str = "user-1", ttl: int = 3600) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": sub,
+        "email": f"{sub}@example.com",
+        "email_verified": True,
+        "iat": now - 1,
+        "exp": now + ttl,
+    }
+    return jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": kid})
+
+
+class TestVerificationCache:
+    def test_same_token_verified_once(self, signing_key):
+        private_pem, cert_pem = signing_key
+        auth = _make_auth({"kid-1": cert_pem})
+        token = _make_token(private_pem)
+
+        first = asyncio.run(auth.verify_token(token))
+        second = asyncio.run(auth.verify_token(token))
+
+        assert first == second
+        assert first.uid == "user-1"
+        assert auth.get_cache_stats() == {
+            "key_hits": 0,
+            "key_misses": 1,
+            "token_hits": 1,
+            "token_misses": 1,
+        }
+
+    def test_parsed_key_reused_across_tokens(self, signing_key):
+        private_pem, cert_pem = signing_key
+        auth = _make_auth({"kid-1": cert_pem})
+
+        asyncio.run(auth.verify_token(_make_token(private_pem, sub="a")))
+        asyncio.run(auth.verify_token(_make_token(private_pem, sub="b")))
+
+        stats = auth.get_cache_stats()
+        assert stats["key_misses"] == 1
+        assert stats["key_hits"] == 1
+        assert stats["token_misses"] == 2
+
+    def test_rotated_certificate_is_reparsed(self, signing_key):
+        private_pem, cert_pem = signing_key
+        other_private, other_cert = _make_signing_key()
+        auth = _make_auth({"kid-1": cert_pem})
+        asyncio.run(auth.verify_token(_make_token(private_pem)))
+
+        auth.key_manager._keys = {"kid-1": other_cert}
+        payload = asyncio.run(auth.verify_token(_make_token(other_private, sub="rotated")))
+
+        assert payload.uid == "rotated"
+        assert auth.get_cache_stats()["key_misses"] == 2
+
+    def test_cache_entry_expires_with_token(self, signing_key):
+        private_pem, cert_pem = signing_key
+        auth = _make_auth({"kid-1": cert_pem})
+        token = _make_token(private_pem, ttl=1)
+
+        asyncio.run(auth.verify_token(token))
+        assert len(auth._token_cache) == 1
+        time.sleep(1.1)
+
+        assert len(auth._token_cache) == 0
+        with pytest.raises(ValueError):
+            asyncio.run(auth.verify_token(token))
+
+    def test_invalid_signature_not_cached(self, signing_key):
+        _, cert_pem = signing_key
+        other_private, _ = _make_signing_key()
+        auth = _make_auth({"kid-1": cert_pem})
+        token = _make_token(other_private)
+
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Token verification failed"):
+                asyncio.run(auth.verify_token(token))
+        assert auth.get_cache_stats()["token_misses"] == 2
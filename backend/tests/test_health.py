@@ -4,9 +4,16 @@ Health Tests
 Testes do endpoint de health check.
 """
 
+from uuid import uuid4
+
 import pytest
 from fastapi.testclient import TestClient
 
+from app.api.routes.auth import get_current_principal
+from app.core.settings import settings
+from app.main import app
+from app.services.principal import Principal
+
 
 class TestHealth:
     """Testes do endpoint /health."""
@@ -33,3 +40,39 @@ class TestHealth:
         response = client.get("/health")
         data = response.json()
         assert "version" in data
+
+    def test_health_has_no_internal_telemetry(self, client: TestClient, monkeypatch):
+        """Caches de auth e expurgo do inbox só saem em /health/details."""
+        monkeypatch.setattr(settings, "auth_mode", "PROD")
+        monkeypatch.setattr(settings, "inbox_maintenance_interval_seconds", 600)
+        response = client.get("/health")
+        assert not {"auth_cache", "inbox_purge"} & set(response.json())
+
+
+class TestHealthDetails:
+    """Testes do endpoint /health/details (ADMIN/DEV)."""
+    
+    @pytest.fixture
+    def as_principal(self, client: TestClient):
+        def use(*roles: str) -> None:
+            app.dependency_overrides[get_current_principal] = lambda: Principal(uuid4(), frozenset(roles))
+        return use
+    
+    def test_requires_auth(self, client: TestClient):
+        """Sem token não expõe nada."""
+        response = client.get("/health/details")
+        assert response.status_code == 401
+    
+    def test_forbidden_without_admin(self, client: TestClient, as_principal):
+        as_principal()
+        response = client.get("/health/details")
+        assert response.status_code == 403
+    
+    def test_admin_sees_auth_cache_and_purge(self, client: TestClient, as_principal, monkeypatch):
+        monkeypatch.setattr(settings, "auth_mode", "PROD")
+        monkeypatch.setattr(settings, "inbox_maintenance_interval_seconds", 600)
+        as_principal("ADMIN")
+        response = client.get("/health/details")
+        assert response.status_code == 200
+        assert set(response.json()["auth_cache"]) >= {"token_hits", "token_misses"}
+        assert "running" in response.json()["inbox_purge"]
@@ -0,0 +1,131 @@
+"""
+Inbox Filter Facets Tests
+=========================
+Opções de filtro do envio a partir de inbox_filter_facets: ajuste
+incremental por perfil, contagens por código e cache com ETag.
+"""
+
+from types import SimpleNamespace
+from uuid import uuid4
+
+from sqlalchemy import select, update
+
+from app.db.models import InboxFilterFacet, ProfileCatalogItem
+from app.services.inbox_service import (
+    InboxService,
+    adjust_filter_facets,
+    bump_filter_options_version,
+    get_filter_options_snapshot,
+    profile_facets,
+)
+
+
+def _profile(state=None, city=None, marital=None):
+    return SimpleNamespace(
+        vocational_reality_item_id=None, life_state_item_id=None, marital_status_item_id=marital,
+        state=state, city=city,
+    )
+
+
+async def _facets(db) -> dict[tuple[str, str], int]:
+    rows = (await db.execute(
+        select(InboxFilterFacet.field, InboxFilterFacet.value, InboxFilterFacet.user_count)
+    )).all()
+    return {(field, value): user_count for field, value, user_count in rows}
+
+
+async def _seed_users(pg, db) -> None:
+    """7 em Fortaleza, 2 em Sobral; casados, solteiros e um item de catálogo inativo."""
+    for city, marital, count in (
+        ("Fortaleza", "MARRIED", 3), ("Fortaleza", "SINGLE", 4), ("Sobral", "WIDOWED", 2),
+    ):
+        for _ in range(count):
+            await pg.user(db, state="CE", city=city, marital_status=marital)
+    await pg.user(db, is_active=False, state="SP", marital_status="MARRIED")
+    await db.execute(
+        update(ProfileCatalogItem).where(ProfileCatalogItem.code == "WIDOWED").values(is_active=False)
+    )
+    await db.commit()
+
+
+class TestAdjustFacets:
+    def test_profile_facets_skip_empty_fields(self):
+        single = uuid4()
+
+        facets = profile_facets(_profile(state="CE", marital=single))
+
+        assert facets == {"marital_status": str(single), "state": "CE"}
+        assert profile_facets(None) == {}
+
+    def test_moves_only_changed_values(self, pg):
+        async def scenario(db):
+            fortaleza = profile_facets(_profile(state="CE", city="Fortaleza"))
+            for _ in range(2):
+                await adjust_filter_facets(db, {}, fortaleza)
+            await adjust_filter_facets(db, fortaleza, profile_facets(_profile(state="CE", city="Sobral")))
+            await db.commit()
+            return await _facets(db)
+
+        assert pg.run(scenario) == {("state", "CE"): 2, ("city", "Fortaleza"): 1, ("city", "Sobral"): 1}
+
+    def test_unchanged_profile_writes_nothing(self, pg):
+        async def scenario(db):
+            facets = profile_facets(_profile(state="CE"))
+            await adjust_filter_facets(db, facets, dict(facets))
+            await db.commit()
+            return await _facets(db)
+
+        assert pg.run(scenario) == {}
+
+
+class TestFilterOptions:
+    def test_counts_by_code_for_active_users(self, pg):
+        async def scenario(db):
+            await _seed_users(pg, db)
+            service = InboxService(db)
+            await service.reconcile_filter_facets()
+            return await service.get_filter_options()
+
+        options = pg.run(scenario)
+
+        assert sorted(item["code"] for item in options["marital_statuses"]) == ["MARRIED", "SINGLE"]
+        assert options["states"] == ["CE"]
+        assert options["cities"] == ["Fortaleza", "Sobral"]
+        assert options["counts"]["city"] == {"Fortaleza": 7, "Sobral": 2}
+        # Item inativo no catálogo não aparece; usuário inativo não conta
+        assert options["counts"]["marital_status"] == {"MARRIED": 3, "SINGLE": 4}
+
+    def test_reconcile_repairs_drift(self, pg):
+        async def scenario(db):
+            await _seed_users(pg, db)
+            await adjust_filter_facets(db, {}, {"city": "Crato"})
+            await db.commit()
+            service = InboxService(db)
+            return await service.reconcile_filter_facets(), await service.reconcile_filter_facets(), await _facets(db)
+
+        first, second, facets = pg.run(scenario)
+
+        # state, 2 cidades, 3 estados civis e a faceta sem usuários
+        assert (first, second) == (7, 0)
+        assert ("city", "Crato") not in facets
+
+    def test_snapshot_cached_until_bump(self, pg):
+        async def scenario(db):
+            await pg.user(db, state="CE", city="Fortaleza")
+            service = InboxService(db)
+            await service.reconcile_filter_facets()
+            bump_filter_options_version()
+            etag, body = await get_filter_options_snapshot(db)
+
+            await adjust_filter_facets(db, {}, {"city": "Sobral"})
+            await db.commit()
+            cached = await get_filter_options_snapshot(db)
+            bump_filter_options_version()
+            fresh_etag, fresh_body = await get_filter_options_snapshot(db)
+            return (etag, body), cached, fresh_etag, fresh_body
+
+        first, cached, fresh_etag, fresh_body = pg.run(scenario)
+
+        assert cached == first
+        assert fresh_etag != first[0]
+        assert b"Sobral" in fresh_body and b"Sobral" not in first[1]
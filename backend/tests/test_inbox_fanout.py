@@ -0,0 +1,111 @@
+"""
+Inbox Fan-out Tests
+===================
+Distribuição em chunks com INSERT ... SELECT, sem materializar destinatários,
+e público por unidade organizacional (Postgres).
+"""
+
+from sqlalchemy import func, select
+
+from app.db.models import InboxDeliveryStatus, InboxMessageStats, InboxRecipient
+from app.schemas.inbox import InboxFilters
+from app.services.inbox_service import InboxService
+
+
+class TestDeliverMessage:
+    def test_delivers_whole_audience_in_chunks(self, pg):
+        async def scenario(db):
+            audience = {await pg.user(db, state="CE") for _ in range(5)}
+            await pg.user(db, state="SP")
+            message_id = await pg.send(db, InboxFilters(states=["CE"]), deliver=False)
+
+            delivered = await InboxService(db).deliver_message(
+                message_id, send_to_all=False, filters=InboxFilters(states=["CE"]), chunk_size=2,
+            )
+
+            return audience, delivered, await pg.recipients(db, message_id), await pg.message(db, message_id)
+
+        audience, delivered, recipients, message = pg.run(scenario)
+
+        assert delivered == 5
+        assert recipients == audience
+        assert message.delivery_status == InboxDeliveryStatus.SENT
+        assert message.delivered_count == 5
+
+    def test_no_audience_marks_sent(self, pg):
+        async def scenario(db):
+            message_id = await pg.send(db, InboxFilters(states=["RJ"]), deliver=False)
+            delivered = await InboxService(db).deliver_message(
+                message_id, send_to_all=False, filters=InboxFilters(states=["RJ"]),
+            )
+            return delivered, (await pg.message(db, message_id)).delivery_status
+
+        assert pg.run(scenario) == (0, InboxDeliveryStatus.SENT)
+
+    def test_redelivery_adds_no_rows_or_unread(self, pg):
+        """Reentrega (fan-out retomado) não duplica linhas nem contadores."""
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            filters = InboxFilters(states=["CE"])
+            message_id = await pg.send(db, filters, deliver=False)
+            service = InboxService(db)
+            await service.deliver_message(message_id, send_to_all=False, filters=filters)
+            await service._set_delivery(message_id, delivery_status=InboxDeliveryStatus.PENDING)
+
+            await service.deliver_message(message_id, send_to_all=False, filters=filters)
+
+            rows = (await db.execute(
+                select(func.count()).where(InboxRecipient.message_id == message_id)
+            )).scalar()
+            stats = await db.get(InboxMessageStats, message_id)
+            return rows, await service.get_unread_count(user_id), stats.recipient_count
+
+        assert pg.run(scenario) == (1, 1, 1)
+
+
+class TestOrgUnitTargeting:
+    def test_subtree_includes_descendants_of_active_units(self, pg):
+        async def scenario(db):
+            root = await pg.org_unit(db)
+            child = await pg.org_unit(db, parent_id=root)
+            inactive = await pg.org_unit(db, parent_id=root, is_active=False)
+            in_root, in_child, in_inactive, outside = [await pg.user(db, state="CE") for _ in range(4)]
+            await pg.member(db, in_root, root)
+            await pg.member(db, in_child, child)
+            await pg.member(db, in_inactive, inactive)
+            await pg.member(db, outside, await pg.org_unit(db))
+
+            filters = InboxFilters(org_unit_ids=[root], include_descendants=True, states=["CE"])
+            message_id = await pg.send(db, filters)
+            return {in_root, in_child}, await pg.recipients(db, message_id)
+
+        expected, recipients = pg.run(scenario)
+
+        assert recipients == expected
+
+    def test_units_only_without_descendants(self, pg):
+        async def scenario(db):
+            root = await pg.org_unit(db)
+            child = await pg.org_unit(db, parent_id=root)
+            in_root, in_child = await pg.user(db), await pg.user(db)
+            await pg.member(db, in_root, root)
+            await pg.member(db, in_child, child)
+
+            filters = InboxFilters(org_unit_ids=[root])
+            message_id = await pg.send(db, filters)
+            return in_root, await pg.recipients(db, message_id)
+
+        in_root, recipients = pg.run(scenario)
+
+        assert recipients == {in_root}
+
+    def test_preview_counts_subtree(self, pg):
+        async def scenario(db):
+            root = await pg.org_unit(db)
+            child = await pg.org_unit(db, parent_id=root)
+            for unit in (root, child, child):
+                await pg.member(db, await pg.user(db), unit)
+            filters = InboxFilters(org_unit_ids=[root], include_descendants=True)
+            return await InboxService(db).preview_send(False, filters)
+
+        assert pg.run(scenario) == 3
@@ -0,0 +1,184 @@
+"""
+Inbox Listing Tests
+===================
+Listagem do inbox: página, totais e remetente numa única consulta;
+corpo da mensagem servido à parte.
+"""
+
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+
+import pytest
+
+from app.schemas.inbox import InboxFilters
+from app.services.inbox_service import (
+    INBOX_PREVIEW_LENGTH,
+    InboxService,
+    _decode_inbox_cursor,
+    _encode_inbox_cursor,
+)
+
+CE = InboxFilters(states=["CE"])
+
+
+class TestGetUserInbox:
+    def test_page_totals_and_sender(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            maria = await pg.user(db, full_name="Maria")
+            await pg.send(db, CE, title="Primeiro", sender=maria)
+            await pg.send(db, CE, title="Segundo")
+            return await InboxService(db).get_user_inbox(user_id)
+
+        messages, total, unread, next_cursor = pg.run(scenario)
+
+        assert (total, unread, next_cursor) == (2, 2, None)
+        # Mais recente primeiro; sem nome no perfil, "Lumen+"
+        assert [(m["title"], m["sender_name"]) for m in messages] == [("Segundo", "Lumen+"), ("Primeiro", "Maria")]
+
+    def test_unread_before_read(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE, title="Antigo")
+            await pg.send(db, CE, title="Novo")
+            service = InboxService(db)
+            messages, *_ = await service.get_user_inbox(user_id)
+            await service.mark_as_read(user_id, UUID(messages[0]["id"]))
+            return await service.get_user_inbox(user_id)
+
+        messages, total, unread, _ = pg.run(scenario)
+
+        assert [(m["title"], m["read"]) for m in messages] == [("Antigo", False), ("Novo", True)]
+        assert (total, unread) == (2, 1)
+
+    def test_broadcasts_merged_into_page(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE, title="Segmentado")
+            broadcast_id = await pg.send(db, title="Para todos")
+            return broadcast_id, await InboxService(db).get_user_inbox(user_id)
+
+        broadcast_id, (messages, total, unread, _) = pg.run(scenario)
+
+        assert [m["title"] for m in messages] == ["Para todos", "Segmentado"]
+        # Broadcast sem linha de estado: id da própria mensagem
+        assert messages[0]["id"] == messages[0]["message_id"] == str(broadcast_id)
+        assert (total, unread) == (2, 2)
+
+    def test_broadcast_not_shown_to_users_created_after_it(self, pg):
+        async def scenario(db):
+            await pg.send(db, title="Para todos")
+            return await InboxService(db).get_user_inbox(await pg.user(db))
+
+        assert pg.run(scenario) == ([], 0, 0, None)
+
+    def test_list_carries_preview_not_body(self, pg):
+        body = "x" * (INBOX_PREVIEW_LENGTH + 50)
+
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE, message=body)
+            return await InboxService(db).get_user_inbox(user_id)
+
+        messages, *_ = pg.run(scenario)
+
+        assert messages[0]["preview"] == body[:INBOX_PREVIEW_LENGTH]
+        assert "message" not in messages[0] and "attachments" not in messages[0]
+
+    def test_empty_page_still_returns_counts(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE)
+            service = InboxService(db)
+            await service.mark_all_as_read(user_id)
+            return await service.get_user_inbox(user_id, include_read=False)
+
+        assert pg.run(scenario) == ([], 1, 0, None)
+
+    def test_cursor_pages_without_overlap(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, title="Aviso 1")
+            for n in (2, 3):
+                await pg.send(db, CE, title=f"Aviso {n}")
+            service = InboxService(db)
+            first, _, _, cursor = await service.get_user_inbox(user_id, limit=2)
+            second, _, _, last_cursor = await service.get_user_inbox(user_id, limit=2, cursor=cursor)
+            return first, second, last_cursor
+
+        first, second, last_cursor = pg.run(scenario)
+
+        assert [m["title"] for m in first + second] == ["Aviso 3", "Aviso 2", "Aviso 1"]
+        assert last_cursor is None
+
+    def test_legacy_offset_still_served(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            for n in (1, 2, 3):
+                await pg.send(db, CE, title=f"Aviso {n}")
+            return await InboxService(db).get_user_inbox(user_id, limit=1, offset=1)
+
+        messages, total, _, next_cursor = pg.run(scenario)
+
+        assert [m["title"] for m in messages] == ["Aviso 2"]
+        assert total == 3
+        assert next_cursor is not None
+
+
+class TestMessageBody:
+    def test_returns_body_and_attachments(self, pg):
+        attachments = [{"type": "link", "url": "https://lumen.app"}]
+
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            message_id = await pg.send(db, CE, message="Conteúdo completo", attachments=attachments)
+            return message_id, await InboxService(db).get_message_body(user_id, message_id)
+
+        message_id, body = pg.run(scenario)
+
+        assert body == {"id": message_id, "message": "Conteúdo completo", "attachments": attachments, "personalized": False}
+
+    def test_broadcast_body(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db)
+            message_id = await pg.send(db, message="Para todos")
+            return await InboxService(db).get_message_body(user_id, message_id)
+
+        assert pg.run(scenario)["message"] == "Para todos"
+
+    def test_outside_inbox_is_none(self, pg):
+        async def scenario(db):
+            outsider = await pg.user(db, state="SP")
+            message_id = await pg.send(db, CE)
+            service = InboxService(db)
+            return (
+                await service.get_message_body(outsider, message_id),
+                await service.get_message_body(outsider, uuid4()),
+            )
+
+        assert pg.run(scenario) == (None, None)
+
+    def test_dismissed_is_none(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            message_id = await pg.send(db, CE)
+            service = InboxService(db)
+            messages, *_ = await service.get_user_inbox(user_id)
+            await service.dismiss(user_id, UUID(messages[0]["id"]))
+            return await service.get_message_body(user_id, message_id)
+
+        assert pg.run(scenario) is None
+
+
+class TestInboxCursor:
+    def test_roundtrip(self):
+        recipient_id = uuid4()
+        created_at = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+
+        cursor = _encode_inbox_cursor(True, created_at, recipient_id)
+
+        assert _decode_inbox_cursor(cursor) == (True, created_at, recipient_id)
+
+    def test_invalid_cursor(self):
+        with pytest.raises(ValueError, match="Cursor inválido"):
+            _decode_inbox_cursor("not-a-cursor")
@@ -0,0 +1,199 @@
+"""
+Inbox Purge Tests
+=================
+Expurgo de mensagens expiradas: lotes curtos sem particionamento e remoção
+de partições mensais no Postgres.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, text
+
+from app.db.models import InboxMessage, InboxMessageStats, InboxRecipient
+from app.schemas.inbox import InboxFilters
+from app.services import inbox_service
+from app.services.inbox_service import (
+    INBOX_PARTITIONED_TABLES,
+    InboxService,
+    _month_start,
+    _partition_name,
+    get_purge_progress,
+)
+
+CE = InboxFilters(states=["CE"])
+
+
+def _frozen(now: datetime):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    return FrozenDatetime
+
+
+async def _send_at(pg, db, monkeypatch, when: datetime, filters: InboxFilters | None = CE):
+    """Envia como se fosse `when` (created_at e expires_at partem dele)."""
+    monkeypatch.setattr(inbox_service, "datetime", _frozen(when))
+    try:
+        return await pg.send(db, filters)
+    finally:
+        monkeypatch.setattr(inbox_service, "datetime", datetime)
+
+
+async def _count(db, model, *where) -> int:
+    return (await db.execute(select(func.count()).select_from(model).where(*where))).scalar()
+
+
+async def _counters(pg, db, user_ids) -> list[int]:
+    return [
+        await pg.scalar(db, "SELECT unread_count FROM inbox_unread_counters WHERE user_id = :u", u=user_id)
+        for user_id in user_ids
+    ]
+
+
+async def _partition_names(db) -> set[str]:
+    return set((await db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+    ))).scalars())
+
+
+class TestCleanupExpiredMessages:
+    def test_deletes_in_batches_with_commit_between(self, pg, monkeypatch):
+        async def scenario(db):
+            recipients = [await pg.user(db, state="CE") for _ in range(2)]
+            expired = [await _send_at(pg, db, monkeypatch, datetime.utcnow() - timedelta(days=40)) for _ in range(2)]
+            live = await pg.send(db, CE)
+
+            deleted = await InboxService(db).cleanup_expired_messages(batch_size=3)
+
+            return (
+                deleted,
+                set((await db.execute(select(InboxMessage.id))).scalars()),
+                await _count(db, InboxRecipient, InboxRecipient.message_id.in_(expired)),
+                await pg.recipients(db, live) == set(recipients),
+                await _count(db, InboxMessageStats, InboxMessageStats.message_id.in_(expired)),
+                live,
+                await _counters(pg, db, recipients),
+            )
+
+        deleted, remaining, expired_recipients, live_kept, expired_stats, live, counters = pg.run(scenario)
+
+        assert deleted == 2
+        assert remaining == {live}
+        assert expired_recipients == 0 and expired_stats == 0
+        assert live_kept
+        # Só a mensagem viva continua no contador
+        assert counters == [1, 1]
+        progress = get_purge_progress()
+        # Destinatários: lote cheio (3) e o resto (1); mensagens: um lote incompleto
+        assert (progress["recipients_deleted"], progress["messages_deleted"], progress["batches"]) == (4, 2, 3)
+        assert not progress["running"]
+
+    def test_batches_skip_locked_rows(self, pg, monkeypatch):
+        """Linha presa por outro worker fica para a próxima rodada, com a mensagem."""
+        async def scenario(db):
+            await pg.user(db, state="CE")
+            locked, _ = [
+                await _send_at(pg, db, monkeypatch, datetime.utcnow() - timedelta(days=40)) for _ in range(2)
+            ]
+            async with pg.sessions() as other:
+                await other.execute(
+                    select(InboxRecipient.id).where(InboxRecipient.message_id == locked).with_for_update()
+                )
+                deleted = await InboxService(db).cleanup_expired_messages(batch_size=10)
+                await other.rollback()
+            return deleted, set((await db.execute(select(InboxMessage.id))).scalars()), locked
+
+        deleted, remaining, locked = pg.run(scenario)
+
+        assert deleted == 1
+        assert remaining == {locked}
+
+    def test_badge_drops_on_expiry_without_reconcile(self, pg, monkeypatch):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await _send_at(pg, db, monkeypatch, datetime.utcnow() - timedelta(days=40))
+            await pg.send(db, CE)
+            service = InboxService(db)
+            before = await service.get_unread_count(user_id), await _counters(pg, db, [user_id])
+            await service.cleanup_expired_messages()
+            return before, (await service.get_unread_count(user_id), await _counters(pg, db, [user_id]))
+
+        # Expirada sai do badge antes do expurgo; o expurgo acerta o contador
+        assert pg.run(scenario) == ((1, [2]), (1, [1]))
+
+
+class TestPartitions:
+    def test_month_start(self):
+        assert _month_start(datetime(2025, 11, 17, 8)) == datetime(2025, 11, 1)
+        assert _month_start(datetime(2025, 11, 17), 3) == datetime(2026, 2, 1)
+        assert _month_start(datetime(2025, 1, 5), -1) == datetime(2024, 12, 1)
+
+    def test_creates_only_missing_months(self, pg, monkeypatch):
+        # O fixture cria até 3 meses à frente; daqui a 2 meses faltam os 2 últimos
+        now = _month_start(datetime.utcnow(), 2) + timedelta(days=16)
+        monkeypatch.setattr(inbox_service, "datetime", _frozen(now))
+
+        async def scenario(db):
+            service = InboxService(db)
+            created = await service.ensure_inbox_partitions(months_ahead=3)
+            return created, await service.ensure_inbox_partitions(months_ahead=3), await _partition_names(db)
+
+        created, again, partitions = pg.run(scenario)
+
+        assert (created, again) == (2, 0)
+        for offset in (2, 3):
+            for table in INBOX_PARTITIONED_TABLES:
+                assert _partition_name(table, _month_start(now, offset)) in partitions
+
+    def test_drops_only_fully_expired_months(self, pg, monkeypatch):
+        real_now = datetime.utcnow()
+
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            old = await _send_at(pg, db, monkeypatch, _month_start(real_now, -3) + timedelta(days=1))
+            recent = await _send_at(pg, db, monkeypatch, _month_start(real_now, -1) + timedelta(days=1))
+            # Meio do mês: o anterior ainda tem linhas criadas há menos de 31 dias
+            monkeypatch.setattr(inbox_service, "datetime", _frozen(_month_start(real_now) + timedelta(days=16)))
+
+            dropped = await InboxService(db).drop_expired_partitions()
+
+            return (
+                dropped,
+                await _counters(pg, db, [user_id]),
+                await _partition_names(db),
+                set((await db.execute(select(InboxMessage.id))).scalars()) == {recent},
+                await _count(db, InboxMessageStats, InboxMessageStats.message_id == old),
+            )
+
+        dropped, counters, partitions, only_recent, old_stats = pg.run(scenario)
+
+        assert dropped == 2
+        # A não lida do mês removido sai do contador na mesma transação
+        assert counters == [1]
+        for offset, kept in ((-3, False), (-2, False), (-1, True), (0, True)):
+            for table in INBOX_PARTITIONED_TABLES:
+                assert (_partition_name(table, _month_start(real_now, offset)) in partitions) is kept
+        assert only_recent
+        assert old_stats == 0
+        assert get_purge_progress()["partitions_dropped"] == 2
+
+    def test_maintenance_runs_before_first_sleep(self, monkeypatch):
+        events = []
+
+        async def run_inbox_maintenance():
+            events.append("run")
+
+        async def sleep(seconds):
+            events.append("sleep")
+            raise asyncio.CancelledError
+        monkeypatch.setattr(inbox_service, "run_inbox_maintenance", run_inbox_maintenance)
+        monkeypatch.setattr(inbox_service.asyncio, "sleep", sleep)
+
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(inbox_service.inbox_maintenance_loop(3600))
+
+        assert events == ["run", "sleep"]
@@ -0,0 +1,205 @@
+"""
+Inbox Read Tests
+================
+Marcação de leitura set-based e buffer de leituras individuais.
+"""
+
+from uuid import UUID, uuid4
+
+from sqlalchemy import func, select, update
+
+from app.db.models import InboxReadBitmap, InboxRecipient, InboxUnreadCounter
+from app.schemas.inbox import InboxFilters
+from app.services.inbox_service import InboxService, ReadReceiptBuffer
+
+CE = InboxFilters(states=["CE"])
+
+
+async def _items(db, user_id: UUID) -> dict[str, dict]:
+    """Itens do inbox do usuário por título."""
+    messages, *_ = await InboxService(db).get_user_inbox(user_id)
+    return {m["title"]: m for m in messages}
+
+
+async def _state_rows(db, message_id: UUID) -> int:
+    return (await db.execute(
+        select(func.count()).where(InboxRecipient.message_id == message_id)
+    )).scalar()
+
+
+class TestMarkRead:
+    def test_mark_all_reads_received_and_broadcasts(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            for title in ("A", "B"):
+                await pg.send(db, CE, title=title)
+            await pg.send(db, title="Para todos")
+            service = InboxService(db)
+
+            count = await service.mark_all_as_read(user_id)
+
+            items = await _items(db, user_id)
+            return count, await service.get_unread_count(user_id), {m["read"] for m in items.values()}
+
+        assert pg.run(scenario) == (3, 0, {True})
+
+    def test_reads_aggregated_per_message(self, pg):
+        async def scenario(db):
+            readers = [await pg.user(db, state="CE") for _ in range(2)]
+            await pg.user(db, state="CE")
+            sender = await pg.user(db)
+            message_id = await pg.send(db, CE, sender=sender)
+            service = InboxService(db)
+            for user_id in readers:
+                await service.mark_all_as_read(user_id)
+            return await service.get_message_stats(message_id, sender)
+
+        stats = pg.run(scenario)
+
+        assert (stats["recipient_count"], stats["read_count"], stats["read_rate"]) == (3, 2, 0.6667)
+        assert stats["first_read_at"] is not None
+        assert sum(bucket["read_count"] for bucket in stats["read_curve"]) == 2
+
+    def test_nothing_marked_leaves_counter_alone(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE)
+            service = InboxService(db)
+            return await service.mark_many_as_read(user_id, [uuid4()]), await service.get_unread_count(user_id)
+
+        assert pg.run(scenario) == (0, 1)
+
+    def test_read_twice_counts_once(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE, title="A")
+            await pg.send(db, CE, title="B")
+            service = InboxService(db)
+            item_id = UUID((await _items(db, user_id))["A"]["id"])
+            results = [await service.mark_as_read(user_id, item_id) for _ in range(2)]
+            return results, await service.get_unread_count(user_id)
+
+        assert pg.run(scenario) == ([True, False], 1)
+
+
+class TestUnreadCounter:
+    def test_reconcile_repairs_drift(self, pg):
+        async def scenario(db):
+            user_id, orphan = await pg.user(db, state="CE"), await pg.user(db)
+            for title in ("A", "B"):
+                await pg.send(db, CE, title=title)
+            await db.execute(update(InboxUnreadCounter).where(InboxUnreadCounter.user_id == user_id).values(unread_count=5))
+            db.add(InboxUnreadCounter(user_id=orphan, unread_count=3))
+            await db.commit()
+            service = InboxService(db)
+            return (
+                await service.reconcile_unread_counters(),
+                await service.reconcile_unread_counters(),
+                (await service.get_unread_count(user_id), await service.get_unread_count(orphan)),
+            )
+
+        assert pg.run(scenario) == (2, 0, (2, 0))
+
+
+class TestBroadcastState:
+    def test_reading_broadcast_sets_bitmap_bit(self, pg):
+        async def scenario(db):
+            reader, other = await pg.user(db), await pg.user(db)
+            sender = await pg.user(db)
+            message_id = await pg.send(db, sender=sender)
+            service = InboxService(db)
+
+            read = await service.mark_as_read(reader, message_id)
+
+            bitmaps = (await db.execute(
+                select(func.count()).where(InboxReadBitmap.message_id == message_id)
+            )).scalar()
+            return (
+                read,
+                (await service.get_unread_count(reader), await service.get_unread_count(other)),
+                (await _items(db, reader))["Aviso"]["read"],
+                (bitmaps, await _state_rows(db, message_id)),
+                (await service.get_message_stats(message_id, sender))["read_count"],
+            )
+
+        read, unread, listed_read, rows, read_count = pg.run(scenario)
+
+        assert read
+        assert unread == (0, 1)
+        assert listed_read
+        # Um chunk de bitmap, nenhuma linha por leitor
+        assert rows == (1, 0)
+        assert read_count == 1
+
+    def test_dismiss_unread_recipient_decrements_counter(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE)
+            service = InboxService(db)
+            dismissed = await service.dismiss(user_id, UUID((await _items(db, user_id))["Aviso"]["id"]))
+            return dismissed, await service.get_unread_count(user_id), await _items(db, user_id)
+
+        assert pg.run(scenario) == (True, 0, {})
+
+    def test_dismiss_pending_broadcast(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db)
+            message_id = await pg.send(db)
+            service = InboxService(db)
+            dismissed = await service.dismiss(user_id, message_id)
+            return dismissed, await service.get_unread_count(user_id), await _items(db, user_id)
+
+        assert pg.run(scenario) == (True, 0, {})
+
+    def test_dismiss_read_broadcast(self, pg):
+        """O bit do bitmap vira o read da linha de estado."""
+        async def scenario(db):
+            user_id = await pg.user(db)
+            message_id = await pg.send(db)
+            service = InboxService(db)
+            await service.mark_as_read(user_id, message_id)
+            dismissed = await service.dismiss(user_id, message_id)
+            row = (await db.execute(
+                select(InboxRecipient.read).where(InboxRecipient.message_id == message_id)
+            )).scalar_one()
+            return dismissed, row, await _items(db, user_id)
+
+        assert pg.run(scenario) == (True, True, {})
+
+    def test_dismiss_unknown_item(self, pg):
+        async def scenario(db):
+            return await InboxService(db).dismiss(await pg.user(db), uuid4())
+
+        assert not pg.run(scenario)
+
+
+class TestReadReceiptBuffer:
+    def test_flush_coalesces_per_user(self, pg):
+        buffer = ReadReceiptBuffer(flush_interval=60)
+
+        async def scenario(db):
+            user_a, user_b = await pg.user(db, state="CE"), await pg.user(db, state="CE")
+            for title in ("A", "B"):
+                await pg.send(db, CE, title=title)
+            items_a, items_b = await _items(db, user_a), await _items(db, user_b)
+            buffer.add(user_a, UUID(items_a["A"]["id"]))
+            buffer.add(user_a, UUID(items_a["A"]["id"]))
+            buffer.add(user_a, UUID(items_a["B"]["id"]))
+            buffer.add(user_b, UUID(items_b["A"]["id"]))
+
+            flushed = await buffer.flush()
+
+            service = InboxService(db)
+            return (
+                flushed,
+                await buffer.flush(),
+                (await service.get_unread_count(user_a), await service.get_unread_count(user_b)),
+            )
+
+        assert pg.run(scenario) == (3, 0, (0, 1))
+
+    def test_full_buffer_rejects(self):
+        buffer = ReadReceiptBuffer(flush_interval=60, max_pending=1)
+
+        assert buffer.add(uuid4(), uuid4())
+        assert not buffer.add(uuid4(), uuid4())
@@ -0,0 +1,222 @@
+"""
+Inbox Schedule Tests
+====================
+Envio agendado (send_at), fan-out com limite de vazão, reserva da
+mensagem pelo despachante e cancelamento antes da distribuição.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.db.models import InboxDeliveryStatus
+from app.schemas.inbox import InboxFilters
+from app.services import inbox_service
+from app.services.inbox_service import INBOX_DELIVERY_LEASE_SECONDS, InboxService
+
+CE = InboxFilters(states=["CE"])
+
+
+def _frozen(now: datetime):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+
+    return FrozenDatetime
+
+
+async def _dispatch() -> int:
+    """Despacha e espera os fan-outs iniciados."""
+    due = await inbox_service.dispatch_due_messages()
+    await asyncio.gather(*inbox_service._deliveries.values())
+    return due
+
+
+class TestScheduledSend:
+    def test_send_at_becomes_created_at(self, pg):
+        send_at = datetime.now(timezone(timedelta(hours=-3))) + timedelta(days=2)
+
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            message_id = await pg.send(db, CE, send_at=send_at, delivery_rate=50)
+            return await pg.message(db, message_id), await InboxService(db).get_user_inbox(user_id)
+
+        message, inbox = pg.run(scenario)
+
+        assert message.delivery_status == InboxDeliveryStatus.PENDING
+        assert message.created_at == send_at
+        assert message.expires_at == message.created_at + timedelta(days=inbox_service.INBOX_EXPIRATION_DAYS)
+        assert message.delivery_rate == 50
+        # Nem o fan-out (reserva só vencida) entrega antes da hora
+        assert inbox == ([], 0, 0, None)
+
+    def test_scheduled_broadcast_waits_for_dispatch(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db)
+            message_id = await pg.send(db, send_at=datetime.utcnow() + timedelta(hours=1))
+            return await pg.message(db, message_id), await InboxService(db).get_user_inbox(user_id)
+
+        message, inbox = pg.run(scenario)
+
+        assert (message.delivery_status, message.delivered_count) == (InboxDeliveryStatus.PENDING, 0)
+        assert inbox == ([], 0, 0, None)
+
+    def test_past_send_at_is_immediate(self, pg):
+        async def scenario(db):
+            message_id = await pg.send(db, send_at=datetime.utcnow() - timedelta(hours=1))
+            return await pg.message(db, message_id)
+
+        message = pg.run(scenario)
+
+        assert message.delivery_status == InboxDeliveryStatus.SENT
+        assert message.created_at > datetime.now(timezone.utc) - timedelta(minutes=1)
+
+    def test_horizon_limited(self, pg):
+        async def scenario(db):
+            await pg.send(db, CE, send_at=datetime.utcnow() + timedelta(days=inbox_service.INBOX_SCHEDULE_MAX_DAYS + 1))
+
+        with pytest.raises(ValueError):
+            pg.run(scenario)
+
+
+class TestPacedDelivery:
+    def test_claim_lost_delivers_nothing(self, pg):
+        """Outra tarefa já pegou a mensagem (lease em dia)."""
+        async def scenario(db):
+            await pg.user(db, state="CE")
+            message_id = await pg.send(db, CE, deliver=False)
+            service = InboxService(db)
+            await service._set_delivery(
+                message_id, delivery_status=InboxDeliveryStatus.SENDING, delivery_heartbeat_at=datetime.utcnow(),
+            )
+            return await service.deliver_message(message_id, send_to_all=False, filters=CE), await pg.recipients(db, message_id)
+
+        assert pg.run(scenario) == (0, set())
+
+    def test_rate_shrinks_and_spaces_chunks(self, pg, monkeypatch):
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+
+        async def scenario(db):
+            audience = {await pg.user(db, state="CE") for _ in range(5)}
+            message_id = await pg.send(db, CE, deliver=False)
+            monkeypatch.setattr(inbox_service.asyncio, "sleep", fake_sleep)
+            delivered = await InboxService(db).deliver_message(message_id, send_to_all=False, filters=CE, rate=2)
+            return audience, delivered, await pg.recipients(db, message_id)
+
+        audience, delivered, recipients = pg.run(scenario)
+
+        assert delivered == 5 and recipients == audience
+        # Faixas de 2, 2 e 1; sem pausa depois da última
+        assert len(sleeps) == 2 and all(0.5 < s <= 1.0 for s in sleeps)
+
+
+class TestDispatch:
+    def test_due_messages_are_released_and_delivered(self, pg, monkeypatch):
+        published = []
+
+        async def update_timeline(operation, *args):
+            published.append((operation.__name__, *args))
+        monkeypatch.setattr(inbox_service, "_update_timeline", update_timeline)
+
+        async def scenario(db):
+            audience = {await pg.user(db, state="CE"), await pg.user(db, state="CE")}
+            send_at = datetime.utcnow() + timedelta(hours=1)
+            broadcast_id = await pg.send(db, send_at=send_at)
+            targeted_id = await pg.send(db, CE, send_at=send_at)
+            monkeypatch.setattr(inbox_service, "datetime", _frozen(send_at + timedelta(minutes=1)))
+
+            due = await _dispatch()
+
+            return (
+                due,
+                await pg.message(db, broadcast_id),
+                await pg.message(db, targeted_id),
+                await pg.recipients(db, targeted_id) == audience,
+            )
+
+        due, broadcast, targeted, delivered = pg.run(scenario)
+
+        assert due == 2
+        assert broadcast.delivery_status == targeted.delivery_status == InboxDeliveryStatus.SENT
+        assert broadcast.delivered_count == broadcast.recipient_count
+        assert published == [("add_broadcast", broadcast.id, broadcast.created_at)]
+        assert delivered
+
+    def test_stale_lease_is_resumed(self, pg):
+        """Processo morto no meio do fan-out: SENDING com heartbeat vencido volta à fila."""
+        async def scenario(db):
+            audience = {await pg.user(db, state="CE") for _ in range(3)}
+            stale_id = await pg.send(db, CE, deliver=False)
+            fresh_id = await pg.send(db, CE, deliver=False)
+            service = InboxService(db)
+            now = datetime.utcnow()
+            await service._set_delivery(
+                stale_id, delivery_status=InboxDeliveryStatus.SENDING,
+                delivery_heartbeat_at=now - timedelta(seconds=INBOX_DELIVERY_LEASE_SECONDS + 1),
+            )
+            await service._set_delivery(
+                fresh_id, delivery_status=InboxDeliveryStatus.SENDING, delivery_heartbeat_at=now,
+            )
+
+            due = {row.id for row in await service.due_messages()}
+            await _dispatch()
+
+            return (
+                due == {stale_id},
+                await pg.recipients(db, stale_id) == audience,
+                (await pg.message(db, stale_id)).delivery_status,
+                await pg.recipients(db, fresh_id),
+            )
+
+        assert pg.run(scenario) == (True, True, InboxDeliveryStatus.SENT, set())
+
+    def test_shutdown_returns_delivery_to_pending(self, pg, monkeypatch):
+        async def scenario(db):
+            # Vazão 1/s: pausa depois da primeira faixa
+            for _ in range(2):
+                await pg.user(db, state="CE")
+            message_id = await pg.send(db, CE, deliver=False)
+            started = asyncio.Event()
+
+            async def sleep(seconds):
+                started.set()
+                await asyncio.Event().wait()
+            monkeypatch.setattr(inbox_service.asyncio, "sleep", sleep)
+
+            inbox_service.start_inbox_delivery(message_id, False, CE, rate=1)
+            await started.wait()
+            await inbox_service.stop_inbox_deliveries()
+            return (await pg.message(db, message_id)).delivery_status, inbox_service._deliveries
+
+        assert pg.run(scenario) == (InboxDeliveryStatus.PENDING, {})
+
+
+class TestCancel:
+    def test_cancel_pending_deletes_message(self, pg):
+        async def scenario(db):
+            sender = await pg.user(db)
+            message_id = await pg.send(db, CE, sender=sender, send_at=datetime.utcnow() + timedelta(hours=1))
+            service = InboxService(db)
+            return await service.cancel_scheduled_message(message_id, sender), await service.get_delivery_status(message_id, sender)
+
+        assert pg.run(scenario) == (True, None)
+
+    def test_already_dispatched_is_false(self, pg):
+        async def scenario(db):
+            sender = await pg.user(db)
+            message_id = await pg.send(db, sender=sender)
+            return await InboxService(db).cancel_scheduled_message(message_id, sender)
+
+        assert pg.run(scenario) is False
+
+    def test_other_senders_message_is_none(self, pg):
+        async def scenario(db):
+            message_id = await pg.send(db, CE, send_at=datetime.utcnow() + timedelta(hours=1))
+            return await InboxService(db).cancel_scheduled_message(message_id, await pg.user(db))
+
+        assert pg.run(scenario) is None
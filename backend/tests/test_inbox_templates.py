@@ -0,0 +1,99 @@
+"""
+Inbox Templates Tests
+=====================
+Marcadores {{campo}} preenchidos na leitura com o perfil do usuário:
+compilação em cache, prévia cortada e personalização da página.
+"""
+
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from app.schemas.inbox import InboxFilters
+from app.services import inbox_service
+from app.services.inbox_service import InboxService
+from app.services.inbox_templates import compile_template, render, template_context, unknown_fields
+
+MARIA = SimpleNamespace(full_name="  Maria  das Dores", city="Fortaleza", state="CE")
+CE = InboxFilters(states=["CE"])
+
+
+class TestRender:
+    def test_fills_fields_from_profile(self):
+        context = template_context(MARIA)
+
+        assert render("Olá {{first_name}}, de {{ city }}/{{state}}!", context) == "Olá Maria, de Fortaleza/CE!"
+
+    def test_missing_profile_renders_empty(self):
+        assert render("Olá {{first_name}}!", template_context(None)) == "Olá !"
+
+    def test_unknown_placeholder_kept_as_text(self):
+        assert render("{{apelido}} {{full_name}}", template_context(MARIA)) == "{{apelido}}   Maria  das Dores"
+        assert unknown_fields("{{apelido}} {{ city }}") == ["apelido"]
+
+    def test_compiled_once_per_text(self):
+        text = f"Oi {{{{first_name}}}} {uuid4()}"
+        context = template_context(MARIA)
+        render(text, context)
+        hits = compile_template.cache_info().hits
+
+        render(text, template_context(None))
+
+        assert compile_template.cache_info().hits == hits + 1
+
+    def test_preview_drops_cut_placeholder(self):
+        context = template_context(MARIA)
+
+        assert render("Oi {{first_name}}, até {{ci", context, preview=True) == "Oi Maria, até "
+        assert render("Oi {{first_name}}", context, preview=True) == "Oi Maria"
+
+
+class TestPersonalizedInbox:
+    def test_page_rendered_with_user_profile(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, full_name="  Maria  das Dores", state="CE", city="Fortaleza")
+            await pg.send(db, CE, title="Aviso", message="Sem marcador")
+            await pg.send(db, CE, title="Olá {{first_name}}", message="Bem-vinda a {{city}}")
+            return await InboxService(db).get_user_inbox(user_id)
+
+        messages, *_ = pg.run(scenario)
+
+        assert [(m["title"], m["preview"]) for m in messages] == [
+            ("Olá Maria", "Bem-vinda a Fortaleza"), ("Aviso", "Sem marcador"),
+        ]
+
+    def test_plain_page_skips_profile(self, pg, monkeypatch):
+        loaded = []
+
+        async def load_template_context(db, user_id):
+            loaded.append(user_id)
+        monkeypatch.setattr(inbox_service, "load_template_context", load_template_context)
+
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE)
+            return await InboxService(db).get_user_inbox(user_id)
+
+        messages, *_ = pg.run(scenario)
+
+        assert len(messages) == 1
+        assert loaded == []
+
+    def test_body_personalized(self, pg):
+        async def scenario(db):
+            user_id = await pg.user(db, full_name="Maria das Dores", state="CE")
+            message_id = await pg.send(db, CE, message="Paz, {{first_name}}!")
+            return await InboxService(db).get_message_body(user_id, message_id)
+
+        body = pg.run(scenario)
+
+        assert body["message"] == "Paz, Maria!"
+        assert body["personalized"] is True
+
+    def test_send_rejects_unknown_fields(self, pg):
+        async def scenario(db):
+            await pg.send(db, title="Olá {{apelido}}")
+
+        with pytest.raises(ValueError, match="apelido"):
+            pg.run(scenario)
@@ -0,0 +1,337 @@
+"""
+Inbox Timeline Tests
+====================
+Cache das timelines no Redis (com um Redis em memória): ordem e cursor,
+broadcasts publicados depois da montagem, escritas depois do commit e fallback para o SQL.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete
+
+from app.db.models import InboxRecipient
+from app.schemas.inbox import InboxFilters
+from app.services import inbox_service
+from app.services import inbox_timeline as inbox_timeline_module
+from app.services.inbox_service import InboxService
+from app.services.inbox_timeline import InboxTimeline
+
+
+class FakeRedis:
+    """Subconjunto dos comandos usados pela timeline (decode_responses=True)."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def incr(self, key):
+        value = int(self.data.get(key, 0)) + 1
+        self.data[key] = str(value)
+        return value
+
+    async def mget(self, keys):
+        return [self.data.get(k) for k in keys]
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, *members):
+        for member in members:
+            self.data.get(key, {}).pop(member, None)
+
+    async def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    async def zcount(self, key, low, high):
+        return sum(1 for s in self.data.get(key, {}).values() if low <= s <= high)
+
+    async def zmscore(self, key, members):
+        return [self.data.get(key, {}).get(m) for m in members]
+
+    async def zrange(self, key, start, end, withscores=False):
+        return sorted(self.data.get(key, {}).items(), key=lambda i: (i[1], i[0]))
+
+    async def zrevrangebyscore(self, key, high, low, start=0, num=None, withscores=False):
+        high = float(high)
+        rows = sorted(
+            ((m, float(s)) for m, s in self.data.get(key, {}).items() if s <= high),
+            key=lambda i: (i[1], i[0]),
+            reverse=True,
+        )
+        return rows[start:start + num]
+
+    async def zrangebyscore(self, key, low, high, withscores=False):
+        low = float(low.lstrip("("))
+        return sorted(((m, float(s)) for m, s in self.data.get(key, {}).items() if s > low), key=lambda i: i[1])
+
+    async def zremrangebyrank(self, key, start, end):
+        members = self.data.get(key, {})
+        for member, _ in sorted(members.items(), key=lambda i: i[1])[:max(len(members) + end + 1, 0)]:
+            del members[member]
+
+    async def zremrangebyscore(self, key, low, high):
+        limit = float(high.lstrip("("))
+        members = self.data.get(key, {})
+        for member in [m for m, s in members.items() if s < limit]:
+            del members[member]
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        values = self.data.setdefault(key, {})
+        values.update(mapping or {field: value})
+
+    async def hsetnx(self, key, field, value):
+        values = self.data.setdefault(key, {})
+        if field in values:
+            return 0
+        values[field] = value
+        return 1
+
+    async def hmget(self, key, fields):
+        return [self.data.get(key, {}).get(f) for f in fields]
+
+    async def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append(getattr(self.redis, name)(*args, **kwargs))
+        return queue
+
+    async def execute(self):
+        return [await call for call in self.calls]
+
+
+NOW = datetime.now(timezone.utc)
+CE = InboxFilters(states=["CE"])
+
+
+def _item(minutes_ago, read=False, item_id=None, message_id=None):
+    message_id = message_id or str(uuid4())
+    return {
+        "id": item_id or str(uuid4()), "message_id": message_id, "read": read,
+        "read_at": NOW if read else None, "created_at": NOW - timedelta(minutes=minutes_ago),
+    }
+
+
+def _built(items) -> InboxTimeline:
+    timeline = InboxTimeline(None, 3600, client=FakeRedis())
+    asyncio.run(timeline.rebuild(USER, "0", items))
+    return timeline
+
+
+def _page(timeline, limit=10, after=None, include_read=True):
+    return asyncio.run(timeline.page(USER, include_read, limit, after, NOW - timedelta(days=30)))
+
+
+USER = uuid4()
+
+
+class TestTimelinePages:
+    def test_unread_first_then_newest(self):
+        old_unread, new_unread, read = _item(30), _item(5), _item(1, read=True)
+        timeline = _built([old_unread, new_unread, read])
+
+        items, total, unread_count, has_more = _page(timeline)
+
+        assert [i["id"] for i in items] == [new_unread["id"], old_unread["id"], read["id"]]
+        assert (total, unread_count, has_more) == (3, 2, False)
+        assert items[2]["read_at"] == NOW
+        assert items[0]["created_at"] == new_unread["created_at"]
+
+    def test_cursor_crosses_from_unread_to_read_with_ties(self):
+        tied = [_item(10, item_id=f"{n:08x}-0000-0000-0000-000000000000") for n in range(3)]
+        read = _item(1, read=True)
+        timeline = _built(tied + [read])
+
+        first, *_, has_more = _page(timeline, limit=2)
+        last = first[-1]
+        second, *_ = _page(timeline, limit=2, after=(False, last["created_at"], last["id"]))
+
+        assert has_more
+        assert [i["id"] for i in first + second] == [t["id"] for t in reversed(tied)] + [read["id"]]
+
+    def test_expired_items_pruned(self):
+        timeline = _built([_item(5), _item(60 * 24 * 31)])
+
+        items, total, unread_count, _ = _page(timeline)
+
+        assert (len(items), total, unread_count) == (1, 1, 1)
+
+    def test_new_broadcast_merged_without_rebuild(self):
+        item = _item(5)
+        timeline = _built([item])
+        broadcast_id = uuid4()
+
+        asyncio.run(timeline.add_broadcast(broadcast_id, NOW - timedelta(minutes=1)))
+
+        items, total, unread_count, _ = _page(timeline)
+        assert [i["id"] for i in items] == [str(broadcast_id), item["id"]]
+        assert items[0]["message_id"] == str(broadcast_id)
+        assert (total, unread_count) == (2, 2)
+        # Já incorporado: a próxima leitura não duplica
+        assert _page(timeline)[1:3] == (2, 2)
+
+    def test_broadcast_already_in_rebuild_keeps_read_state(self):
+        broadcast_id = str(uuid4())
+        timeline = InboxTimeline(None, 3600, client=FakeRedis())
+        watermark = asyncio.run(timeline.broadcast_watermark())
+        asyncio.run(timeline.add_broadcast(broadcast_id, NOW - timedelta(minutes=1)))
+        # O rebuild leu o Postgres depois da publicação e o usuário já o leu
+        asyncio.run(timeline.rebuild(USER, watermark, [_item(1, read=True, item_id=broadcast_id)]))
+
+        items, total, unread_count, _ = _page(timeline)
+
+        assert [(i["id"], i["read"]) for i in items] == [(broadcast_id, True)]
+        assert (total, unread_count) == (1, 0)
+
+    def test_trimmed_broadcasts_force_rebuild(self, monkeypatch):
+        monkeypatch.setattr(inbox_timeline_module, "_BROADCASTS_KEPT", 2)
+        timeline = _built([_item(5)])
+
+        for _ in range(3):
+            asyncio.run(timeline.add_broadcast(uuid4(), NOW))
+
+        assert _page(timeline) is None
+
+
+class TestTimelineWrites:
+    def test_mark_read_moves_items(self):
+        first, second = _item(5), _item(6)
+        timeline = _built([first, second])
+
+        asyncio.run(timeline.mark_read(USER, [uuid4(), first["id"]], NOW))
+
+        items, _, unread_count, _ = _page(timeline)
+        assert unread_count == 1
+        assert [(i["id"], i["read"]) for i in items] == [(second["id"], False), (first["id"], True)]
+
+    def test_read_broadcast_not_yet_merged(self):
+        timeline = _built([])
+        broadcast_id = uuid4()
+        asyncio.run(timeline.add_broadcast(broadcast_id, NOW))
+
+        asyncio.run(timeline.mark_read(USER, [broadcast_id], NOW))
+
+        items, _, unread_count, _ = _page(timeline)
+        assert [(i["id"], i["read"]) for i in items] == [(str(broadcast_id), True)]
+        assert unread_count == 0
+
+    def test_fan_out_only_touches_built_timelines(self):
+        timeline = _built([])
+        other = uuid4()
+        recipient, other_recipient = uuid4(), uuid4()
+
+        asyncio.run(timeline.add_items(uuid4(), NOW, [(recipient, USER), (other_recipient, other)]))
+
+        items, *_ = _page(timeline)
+        assert [i["id"] for i in items] == [str(recipient)]
+        assert not any(str(other) in key for key in timeline.redis.data)
+
+    def test_dismiss_removes_item(self):
+        item = _item(5)
+        timeline = _built([item])
+
+        asyncio.run(timeline.remove(USER, item["id"]))
+
+        assert _page(timeline)[1] == 0
+
+
+@pytest.fixture
+def timeline(monkeypatch) -> InboxTimeline:
+    timeline = InboxTimeline(None, 3600, client=FakeRedis())
+    monkeypatch.setattr(inbox_service, "inbox_timeline", timeline)
+    return timeline
+
+
+class TestServiceWithTimeline:
+    def test_miss_rebuilds_then_serves_from_cache(self, pg, timeline):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE)
+            service = InboxService(db)
+            first = await service.get_user_inbox(user_id)
+            # Fora do serviço: só o cache ainda tem o item
+            await db.execute(delete(InboxRecipient))
+            await db.commit()
+            return first, await service.get_user_inbox(user_id), await service.get_unread_count(user_id)
+
+        first, second, unread_count = pg.run(scenario)
+
+        assert first == second
+        messages, total, unread, next_cursor = second
+        assert (total, unread, next_cursor) == (1, 1, None)
+        assert messages[0]["title"] == "Aviso"
+        assert unread_count == 1
+
+    def test_writes_reach_built_timeline(self, pg, timeline):
+        """Fan-out, broadcast e leitura atualizam a timeline já montada."""
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            service = InboxService(db)
+            await service.get_user_inbox(user_id)
+            await pg.send(db, CE, title="Segmentado")
+            broadcast_id = await pg.send(db, title="Para todos")
+            await service.mark_as_read(user_id, broadcast_id)
+            # Sem o Postgres: a página vem só do cache
+            await db.execute(delete(InboxRecipient))
+            await db.commit()
+            messages, total, unread, _ = await service.get_user_inbox(user_id)
+            return [(m["title"], m["read"]) for m in messages], total, unread
+
+        assert pg.run(scenario) == ([("Segmentado", False), ("Para todos", True)], 2, 1)
+
+    def test_cursor_compatible_with_sql_pages(self, pg, timeline, monkeypatch):
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            for n in (1, 2, 3):
+                await pg.send(db, CE, title=f"Aviso {n}")
+            service = InboxService(db)
+            first, _, _, cursor = await service.get_user_inbox(user_id, limit=1)
+            monkeypatch.setattr(inbox_service, "inbox_timeline", InboxTimeline(None, 3600))
+            second, *_ = await service.get_user_inbox(user_id, limit=2, cursor=cursor)
+            return [m["title"] for m in first + second]
+
+        assert pg.run(scenario) == ["Aviso 3", "Aviso 2", "Aviso 1"]
+
+    def test_redis_failure_falls_back_to_sql(self, pg, monkeypatch):
+        class BrokenRedis(FakeRedis):
+            def pipeline(self, transaction=True):
+                raise ConnectionError("redis fora")
+
+        monkeypatch.setattr(inbox_service, "inbox_timeline", InboxTimeline(None, 3600, client=BrokenRedis()))
+
+        async def scenario(db):
+            user_id = await pg.user(db, state="CE")
+            await pg.send(db, CE)
+            return await InboxService(db).get_user_inbox(user_id)
+
+        messages, total, *_ = pg.run(scenario)
+
+        assert len(messages) == total == 1
@@ -0,0 +1,175 @@
+"""
+Org Closure Tests
+=================
+Closure table da hierarquia: criação, movimentação e desativação de
+subárvores, contagens e o backfill da migração 004.
+"""
+
+import importlib.util
+from pathlib import Path
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import select, text
+
+from app.db.models import GlobalRole, GroupType, OrgUnit, OrgUnitClosure, OrgUnitType, UserGlobalRole
+from app.services import organization as org_service
+from app.services.organization import OrgServiceError
+
+MIGRATION_004 = Path(__file__).parents[1] / "alembic" / "versions" / "004_org_unit_closure.py"
+
+
+async def _closure(db) -> set[tuple]:
+    rows = (await db.execute(
+        select(OrgUnitClosure.ancestor_id, OrgUnitClosure.descendant_id, OrgUnitClosure.depth)
+    )).all()
+    return {tuple(row) for row in rows}
+
+
+async def _tree(pg, db) -> SimpleNamespace:
+    """CG -> CE -> (setor A -> ministério -> grupo, setor B), criada por um DEV."""
+    dev = await pg.user(db)
+    role = GlobalRole(id=uuid4(), code="DEV", name="Desenvolvedor")
+    db.add(role)
+    await db.flush()
+    db.add(UserGlobalRole(user_id=dev, global_role_id=role.id))
+    await db.commit()
+
+    async def create(parent_id, org_type, name, group_type=None):
+        unit = await org_service.create_org_unit(db, dev, parent_id, org_type, name, group_type=group_type)
+        return unit.id
+
+    cg = await create(None, OrgUnitType.CONSELHO_GERAL, "Conselho Geral")
+    ce = await create(cg, OrgUnitType.CONSELHO_EXECUTIVO, "Executivo")
+    setor_a = await create(ce, OrgUnitType.SETOR, "Setor A")
+    setor_b = await create(ce, OrgUnitType.SETOR, "Setor B")
+    ministerio = await create(setor_a, OrgUnitType.MINISTERIO, "Música")
+    grupo = await create(ministerio, OrgUnitType.GRUPO, "Coral", GroupType.ACOLHIDA)
+    return SimpleNamespace(
+        dev=dev, cg=cg, ce=ce, setor_a=setor_a, setor_b=setor_b, ministerio=ministerio, grupo=grupo,
+    )
+
+
+class TestCreate:
+    def test_closure_rows_for_new_unit(self, pg):
+        async def scenario(db):
+            tree = await _tree(pg, db)
+            return tree, await _closure(db)
+
+        tree, closure = pg.run(scenario)
+
+        chain = [tree.grupo, tree.ministerio, tree.setor_a, tree.ce, tree.cg]
+        assert {(a, d, depth) for a, d, depth in closure if d == tree.grupo} == {
+            (ancestor, tree.grupo, depth) for depth, ancestor in enumerate(chain)
+        }
+        # Uma linha por par ancestral/descendente: 1 + 2 + 3 + 3 + 4 + 5
+        assert len(closure) == 18
+
+
+class TestMove:
+    def test_subtree_follows_new_parent(self, pg):
+        async def scenario(db):
+            tree = await _tree(pg, db)
+            moved = await org_service.move_org_unit(db, tree.ministerio, tree.setor_b, tree.dev)
+            return tree, moved.parent_id, (
+                await org_service.get_ancestor_ids(db, tree.grupo),
+                await org_service.get_descendant_ids(db, tree.setor_a),
+                await org_service.get_descendant_ids(db, tree.setor_b),
+                await _closure(db),
+            )
+
+        tree, parent_id, (ancestors, under_a, under_b, closure) = pg.run(scenario)
+
+        assert parent_id == tree.setor_b
+        assert ancestors == [tree.ministerio, tree.setor_b, tree.ce, tree.cg]
+        assert under_a == []
+        assert under_b == [tree.ministerio, tree.grupo]
+        assert (tree.setor_b, tree.grupo, 2) in closure
+        assert not any(a == tree.setor_a and d != tree.setor_a for a, d, _ in closure)
+        assert len(closure) == 18
+
+    def test_cannot_move_under_own_descendant(self, pg):
+        async def scenario(db):
+            tree = await _tree(pg, db)
+            before = await _closure(db)
+            with pytest.raises(OrgServiceError) as error:
+                await org_service.move_org_unit(db, tree.setor_a, tree.ministerio, tree.dev)
+            await db.rollback()
+            return error.value.code, before == await _closure(db)
+
+        assert pg.run(scenario) == ("invalid_move", True)
+
+
+class TestDeactivate:
+    def test_whole_subtree_inactive(self, pg):
+        async def scenario(db):
+            tree = await _tree(pg, db)
+            count = await org_service.deactivate_org_unit(db, tree.setor_a, tree.dev)
+            active = dict((await db.execute(select(OrgUnit.id, OrgUnit.is_active))).all())
+            return tree, count, active
+
+        tree, count, active = pg.run(scenario)
+
+        assert count == 3
+        assert not any(active[unit] for unit in (tree.setor_a, tree.ministerio, tree.grupo))
+        assert all(active[unit] for unit in (tree.cg, tree.ce, tree.setor_b))
+
+
+class TestSubtreeCounts:
+    def test_active_units_and_distinct_members(self, pg):
+        async def scenario(db):
+            tree = await _tree(pg, db)
+            singer, leader = await pg.user(db), await pg.user(db)
+            await pg.member(db, singer, tree.grupo)
+            await pg.member(db, singer, tree.ministerio)
+            await pg.member(db, leader, tree.setor_b)
+            before = (
+                await org_service.get_subtree_counts(db, tree.setor_a),
+                await org_service.get_subtree_counts(db, tree.cg),
+            )
+            await org_service.deactivate_org_unit(db, tree.ministerio, tree.dev)
+            return before, await org_service.get_subtree_counts(db, tree.setor_a)
+
+        (setor_a, cg), after = pg.run(scenario)
+
+        # O DEV coordena todas as unidades que criou
+        assert setor_a == {"unit_count": 3, "member_count": 2}
+        assert cg == {"unit_count": 6, "member_count": 3}
+        assert after == {"unit_count": 1, "member_count": 1}
+
+
+class TestBackfillMigration:
+    def test_backfill_from_parent_ids(self, pg, monkeypatch):
+        """A migração 004 reconstrói a closure de uma árvore só com parent_id."""
+        spec = importlib.util.spec_from_file_location("migration_004", MIGRATION_004)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+
+        async def scenario(db):
+            root = await pg.org_unit(db)
+            a, b = await pg.org_unit(db, root), await pg.org_unit(db, root)
+            a1 = await pg.org_unit(db, a)
+            a1x = await pg.org_unit(db, a1)
+            expected = await _closure(db)
+
+            def upgrade(connection):
+                monkeypatch.setattr(migration, "op", Operations(MigrationContext.configure(connection)))
+                connection.execute(text("DROP TABLE org_unit_closure"))
+                migration.upgrade()
+
+            await (await db.connection()).run_sync(upgrade)
+            backfilled = await _closure(db)
+            await db.rollback()
+            return (root, a, b, a1, a1x), expected, backfilled
+
+        (root, a, b, a1, a1x), expected, backfilled = pg.run(scenario)
+
+        assert backfilled == expected
+        assert {(ancestor, depth) for ancestor, d, depth in backfilled if d == a1x} == {
+            (a1x, 0), (a1, 1), (a, 2), (root, 3),
+        }
+        # 1 + 2 + 2 + 3 + 4
+        assert len(backfilled) == 12
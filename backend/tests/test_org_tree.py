@@ -0,0 +1,132 @@
+"""
+Org Tree Tests
+==============
+Montagem da árvore organizacional a partir de linhas planas.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from app.api.routes.organization import etag_matches
+from app.db.models import OrgUnitType, Visibility
+from app.services import organization as org_service
+from app.services.organization import (
+    OrgServiceError, _decode_cursor, _encode_cursor,
+    build_org_tree, bump_org_tree_version, get_org_tree_snapshot,
+)
+from app.services.principal import Principal
+
+
+def _row(name, depth, parent_id=None, org_type=OrgUnitType.SETOR, member_count=0):
+    return SimpleNamespace(
+        id=uuid4(),
+        parent_id=parent_id,
+        type=org_type,
+        group_type=None,
+        name=name,
+        slug=name.lower(),
+        description=None,
+        visibility=Visibility.PUBLIC,
+        is_active=True,
+        created_at=datetime.now(timezone.utc),
+        depth=depth,
+        member_count=member_count,
+    )
+
+
+class TestBuildOrgTree:
+    def test_empty(self):
+        assert build_org_tree([]) is None
+
+    def test_nests_rows_by_parent(self):
+        root = _row("Conselho", 0, org_type=OrgUnitType.CONSELHO_GERAL, member_count=3)
+        exec_ = _row("Executivo", 1, root.id, OrgUnitType.CONSELHO_EXECUTIVO)
+        setor_a = _row("A", 2, exec_.id, member_count=7)
+        setor_b = _row("B", 2, exec_.id)
+
+        tree = build_org_tree([root, exec_, setor_a, setor_b])
+
+        assert tree.name == "Conselho"
+        assert tree.member_count == 3
+        assert [c.name for c in tree.children] == ["Executivo"]
+        assert [c.name for c in tree.children[0].children] == ["A", "B"]
+        assert tree.children[0].children[0].member_count == 7
+        assert tree.children[0].child_count == 2
+        assert tree.children[0].has_children
+        assert not tree.children[0].children[0].has_children
+
+    def test_orphan_rows_are_dropped(self):
+        root = _row("Conselho", 0, org_type=OrgUnitType.CONSELHO_GERAL)
+        orphan = _row("Perdido", 1, uuid4())
+
+        tree = build_org_tree([root, orphan])
+
+        assert tree.children == []
+
+
+class TestOrgTreeSnapshot:
+    def _patch(self, monkeypatch, restricted=frozenset()):
+        builds = []
+
+        async def fake_principal(db, user_id):
+            return Principal(user_id=user_id)
+
+        async def fake_tree(db, user_id):
+            builds.append(user_id)
+            return build_org_tree([_row(f"Conselho {len(builds)}", 0, org_type=OrgUnitType.CONSELHO_GERAL)])
+
+        async def fake_restricted(db, version):
+            return restricted
+
+        monkeypatch.setattr(org_service, "load_principal", fake_principal)
+        monkeypatch.setattr(org_service, "get_org_tree", fake_tree)
+        monkeypatch.setattr(org_service, "_restricted_unit_ids", fake_restricted)
+        org_service._org_tree_cache.clear()
+        return builds
+
+    def test_users_with_same_visibility_share_entry(self, monkeypatch):
+        builds = self._patch(monkeypatch)
+
+        etag_a, body_a = asyncio.run(get_org_tree_snapshot(None, uuid4()))
+        etag_b, body_b = asyncio.run(get_org_tree_snapshot(None, uuid4()))
+
+        assert (etag_a, body_a) == (etag_b, body_b)
+        assert len(builds) == 1
+
+    def test_version_bump_rebuilds(self, monkeypatch):
+        builds = self._patch(monkeypatch)
+        user_id = uuid4()
+
+        etag_before, _ = asyncio.run(get_org_tree_snapshot(None, user_id))
+        bump_org_tree_version()
+        etag_after, body = asyncio.run(get_org_tree_snapshot(None, user_id))
+
+        assert etag_before != etag_after
+        assert b"Conselho 2" in body
+        assert len(builds) == 2
+
+
+class TestEtagMatches:
+    def test_matches(self):
+        assert etag_matches('"abc"', '"abc"')
+        assert etag_matches('"x", W/"abc"', '"abc"')
+        assert etag_matches("*", '"abc"')
+
+    def test_no_match(self):
+        assert not etag_matches(None, '"abc"')
+        assert not etag_matches('"abd"', '"abc"')
+
+
+class TestChildrenCursor:
+    def test_roundtrip(self):
+        unit_id = uuid4()
+        assert _decode_cursor(_encode_cursor("Ministério São José", unit_id)) == ("Ministério São José", unit_id)
+
+    def test_invalid_cursor(self):
+        with pytest.raises(OrgServiceError) as exc:
+            _decode_cursor("not-a-cursor")
+        assert exc.value.code == "invalid_cursor"
@@ -0,0 +1,99 @@
+"""
+Principal Tests
+===============
+Permissões derivadas do Principal e invalidação do cache.
+"""
+
+import asyncio
+from uuid import uuid4
+
+from app.db.models import GlobalRole, OrgRoleCode, UserGlobalRole
+from app.services import organization as org_service
+from app.services import principal as principal_module
+from app.services.principal import Principal, invalidate_principal, load_principal
+
+
+class TestPrincipal:
+    def test_membership_checks(self):
+        coord_unit, member_unit = uuid4(), uuid4()
+        principal = Principal(
+            user_id=uuid4(),
+            memberships={coord_unit: OrgRoleCode.COORDINATOR, member_unit: OrgRoleCode.MEMBER},
+        )
+
+        assert principal.is_coordinator_of(coord_unit)
+        assert principal.is_member_of(member_unit)
+        assert not principal.is_coordinator_of(member_unit)
+        assert not principal.is_member_of(uuid4())
+        assert principal.member_unit_ids == {coord_unit, member_unit}
+
+    def test_global_roles(self):
+        assert Principal(user_id=uuid4(), global_roles=frozenset({"DEV"})).is_admin
+        assert Principal(user_id=uuid4(), global_roles=frozenset({"ADMIN"})).is_admin
+        assert not Principal(user_id=uuid4(), global_roles=frozenset({"SECRETARY"})).is_admin
+
+
+class TestPrincipalCache:
+    def test_cached_between_calls_until_invalidated(self, monkeypatch):
+        user_id = uuid4()
+        fetches = []
+
+        async def fake_fetch(db, uid):
+            fetches.append(uid)
+            return Principal(user_id=uid, permissions=frozenset({f"P{len(fetches)}"}))
+
+        monkeypatch.setattr(principal_module, "_fetch_principal", fake_fetch)
+
+        first = asyncio.run(load_principal(None, user_id))
+        second = asyncio.run(load_principal(None, user_id))
+        assert first is second
+        assert len(fetches) == 1
+
+        invalidate_principal(user_id)
+        third = asyncio.run(load_principal(None, user_id))
+        assert third.permissions == {"P2"}
+
+    def test_load_racing_with_mutation_is_not_cached(self, monkeypatch):
+        """Um load que começou antes da mutação não pode gravar dado velho no cache."""
+        user_id = uuid4()
+
+        async def fetch_during_mutation(db, uid):
+            invalidate_principal(uid)
+            return Principal(user_id=uid)
+
+        monkeypatch.setattr(principal_module, "_fetch_principal", fetch_during_mutation)
+        asyncio.run(load_principal(None, user_id))
+
+        assert user_id not in principal_module._principal_cache
+
+
+class TestDeactivatedUnit:
+    def test_coordinator_loses_rights_immediately(self, pg):
+        async def scenario(db):
+            root = await pg.org_unit(db)
+            unit_id = await pg.org_unit(db, parent_id=root)
+            admin_id, coordinator_id = await pg.user(db), await pg.user(db)
+            role = GlobalRole(id=uuid4(), code="ADMIN", name="Administrador")
+            db.add(role)
+            await db.flush()
+            db.add(UserGlobalRole(user_id=admin_id, global_role_id=role.id))
+            await pg.member(db, coordinator_id, unit_id, role=OrgRoleCode.COORDINATOR)
+
+            before = await org_service.can_manage_subtree(db, coordinator_id, unit_id)
+            await org_service.deactivate_org_unit(db, unit_id, admin_id)
+            return before, await org_service.can_manage_subtree(db, coordinator_id, unit_id)
+
+        assert pg.run(scenario) == (True, False)
+
+    def test_memberships_only_from_active_units(self, pg):
+        async def scenario(db):
+            active = await pg.org_unit(db)
+            inactive = await pg.org_unit(db, is_active=False)
+            user_id = await pg.user(db)
+            await pg.member(db, user_id, active)
+            await pg.member(db, user_id, inactive, role=OrgRoleCode.COORDINATOR)
+            return active, await principal_module._fetch_principal(db, user_id)
+
+        active, principal = pg.run(scenario)
+
+        assert principal.memberships == {active: OrgRoleCode.MEMBER}
@@ -0,0 +1,111 @@
+"""
+Segment Index Tests
+===================
+Índice em memória da prévia de envio: bitmaps por segmento, AND entre
+campos, OR dentro do campo e atualização incremental.
+"""
+
+from types import SimpleNamespace
+from uuid import uuid4
+
+from app.schemas.inbox import InboxFilters
+from app.services.segment_index import Bitmap, SegmentIndex
+
+
+def _built(pg, scenario) -> tuple[SegmentIndex, object]:
+    """Cria os usuários de scenario(db) e monta um índice novo do banco."""
+    index = SegmentIndex()
+
+    async def build(db):
+        result = await scenario(db)
+        await index.rebuild(db)
+        return result
+
+    return index, pg.run(build)
+
+
+class TestBitmap:
+    def test_offset_keeps_only_the_span(self):
+        bitmap = Bitmap()
+        bitmap.add(100_000)
+        bitmap.add(100_003)
+        bitmap.add(99_999)
+
+        assert bitmap.offset == 99_999
+        assert int(bitmap) == (1 << 99_999) | (1 << 100_000) | (1 << 100_003)
+
+        bitmap.discard(100_000)
+        assert int(bitmap).bit_count() == 2
+
+
+class TestSegmentIndex:
+    def test_and_between_fields_or_within(self, pg):
+        async def users(db):
+            await pg.user(db, state="CE", city="Fortaleza", marital_status="MARRIED")
+            await pg.user(db, state="CE", city="Sobral", marital_status="SINGLE")
+            await pg.user(db, state="SP", city="Campinas", marital_status="MARRIED")
+            await pg.user(db, is_active=False, state="CE", city="Fortaleza", marital_status="MARRIED")
+            await pg.user(db)
+
+        index, _ = _built(pg, users)
+
+        assert index.count(True, None) == 4
+        assert index.count(False, None) == 0
+        assert index.count(False, InboxFilters()) == 4
+        assert index.count(False, InboxFilters(states=["CE"])) == 2
+        assert index.count(False, InboxFilters(states=["CE", "SP"], marital_status_codes=["MARRIED"])) == 2
+        assert index.count(False, InboxFilters(cities=["Fortaleza"], marital_status_codes=["SINGLE"])) == 0
+        assert index.count(False, InboxFilters(states=["RJ"])) == 0
+
+    def test_profile_update_moves_user_between_segments(self, pg):
+        async def users(db):
+            user_id = await pg.user(db, state="CE", city="Fortaleza", marital_status="SINGLE")
+            await pg.user(db, state="CE")
+            return user_id, await pg.catalog_item(db, "LIFE_STATE", "CELIBATE")
+
+        index, (user_id, celibate) = _built(pg, users)
+
+        index.update_profile(SimpleNamespace(
+            user_id=user_id, state="SP", city="Campinas",
+            vocational_reality_item_id=None, life_state_item_id=celibate, marital_status_item_id=None,
+        ))
+
+        assert index.count(False, InboxFilters(states=["CE"])) == 1
+        assert index.count(False, InboxFilters(states=["SP"], life_state_codes=["CELIBATE"])) == 1
+        assert index.count(False, InboxFilters(marital_status_codes=["SINGLE"])) == 0
+
+    def test_new_user_counts_only_without_filters(self, pg):
+        async def users(db):
+            await pg.user(db, state="CE")
+
+        index, _ = _built(pg, users)
+
+        index.add_user(uuid4())
+
+        assert index.count(True, None) == 2
+        assert index.count(False, InboxFilters(states=["CE"])) == 1
+
+    def test_changes_during_rebuild_are_replayed(self, pg):
+        index = SegmentIndex()
+        late_user = uuid4()
+
+        async def scenario(db):
+            await pg.user(db, state="CE")
+            execute = db.execute
+
+            async def execute_then_signup(*args, **kwargs):
+                # Cadastro concorrente entre a leitura do catálogo e a dos usuários
+                index.add_user(late_user)
+                return await execute(*args, **kwargs)
+            db.execute = execute_then_signup
+            return await index.rebuild(db)
+
+        assert pg.run(scenario) == 1
+        assert index.count(True, None) == 2
+
+    def test_not_ready_until_built(self):
+        index = SegmentIndex()
+        index.add_user(uuid4())
+
+        assert not index.is_ready
+        assert index.count(True, None) == 0
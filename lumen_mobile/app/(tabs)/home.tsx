@@ -23,8 +23,9 @@ const colors = {
 
 interface Aviso {
   id: string;
+  message_id: string;
   title: string;
-  message: string;
+  preview: string;
   type: 'info' | 'warning' | 'success' | 'urgent';
   read: boolean;
   created_at: string;
@@ -171,7 +172,7 @@ export default function HomeScreen() {
                 </View>
                 <View style={styles.avisoContent}>
                   <Text style={styles.avisoTitle} numberOfLines={1}>{aviso.title}</Text>
-                  <Text style={styles.avisoMessage} numberOfLines={2}>{aviso.message}</Text>
+                  <Text style={styles.avisoMessage} numberOfLines={2}>{aviso.preview}</Text>
                   <Text style={styles.avisoDate}>{formatDate(aviso.created_at)}</Text>
                 </View>
                 <Ionicons name="chevron-forward" size={20} color={colors.gray} />
@@ -33,8 +33,9 @@ const colors = {
 
 interface Aviso {
   id: string;
+  message_id: string;
   title: string;
-  message: string;
+  preview: string;
   type: 'info' | 'warning' | 'success' | 'urgent';
   read: boolean;
   created_at: string;
@@ -47,6 +48,10 @@ export default function InboxScreen() {
   const [refreshing, setRefreshing] = useState(false);
   const [selectedAviso, setSelectedAviso] = useState<Aviso | null>(null);
   const [modalVisible, setModalVisible] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Conteúdo completo por message_id: não muda depois do envio
+  const [bodies, setBodies] = useState<Record<string, string>>({});
 
   useEffect(() => {
     loadAvisos();
@@ -55,25 +60,52 @@ export default function InboxScreen() {
   const loadAvisos = async () => {
     try {
       const response = await api.get('/inbox');
-      setAvisos(response.data || []);
+      setAvisos(response.data?.messages || []);
+      setNextCursor(response.data?.next_cursor || null);
     } catch (error) {
       console.log('Erro ao carregar avisos:', error);
-      // Mock data para demonstração enquanto API não existe
       setAvisos([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
   };
 
+  // Próxima página pelo cursor devolvido na anterior
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await api.get('/inbox', { params: { cursor: nextCursor } });
+      setAvisos(prev => [...prev, ...(response.data?.messages || [])]);
+      setNextCursor(response.data?.next_cursor || null);
+    } catch (error) {
+      console.log('Erro ao carregar mais avisos:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const onRefresh = useCallback(async () => {
     setRefreshing(true);
     await loadAvisos();
     setRefreshing(false);
   }, []);
 
+  const loadBody = async (messageId: string) => {
+    if (bodies[messageId] !== undefined) return;
+    try {
+      const response = await api.get(`/inbox/messages/${messageId}`);
+      setBodies(prev => ({ ...prev, [messageId]: response.data?.message || '' }));
+    } catch (error) {
+      console.log('Erro ao carregar aviso:', error);
+    }
+  };
+
   const handleOpenAviso = async (aviso: Aviso) => {
     setSelectedAviso(aviso);
     setModalVisible(true);
+    loadBody(aviso.message_id);
 
     // Marcar como lido
     if (!aviso.read) {
@@ -157,7 +189,7 @@ export default function InboxScreen() {
             </Text>
             {!item.read && <View style={styles.unreadDot} />}
           </View>
-          <Text style={styles.avisoMessage} numberOfLines={2}>{item.message}</Text>
+          <Text style={styles.avisoMessage} numberOfLines={2}>{item.preview}</Text>
           <Text style={styles.avisoDate}>{formatRelativeDate(item.created_at)}</Text>
         </View>
         
@@ -212,6 +244,9 @@ export default function InboxScreen() {
         }
         ListEmptyComponent={renderEmpty}
         ItemSeparatorComponent={() => <View style={styles.separator} />}
+        onEndReached={loadMore}
+        onEndReachedThreshold={0.5}
+        ListFooterComponent={loadingMore ? <ActivityIndicator color={colors.primary} /> : null}
       />
 
       {/* Modal de Detalhes */}
@@ -254,7 +289,14 @@ export default function InboxScreen() {
                 <ScrollView style={styles.modalBody}>
                   <Text style={styles.modalTitle}>{selectedAviso.title}</Text>
                   <Text style={styles.modalDate}>{formatDate(selectedAviso.created_at)}</Text>
-                  <Text style={styles.modalMessage}>{selectedAviso.message}</Text>
+                  {bodies[selectedAviso.message_id] !== undefined ? (
+                    <Text style={styles.modalMessage}>{bodies[selectedAviso.message_id]}</Text>
+                  ) : (
+                    <>
+                      <Text style={styles.modalMessage}>{selectedAviso.preview}</Text>
+                      <ActivityIndicator color={colors.primary} style={styles.modalBodyLoading} />
+                    </>
+                  )}
                 </ScrollView>
 
                 <TouchableOpacity 
@@ -442,6 +484,9 @@ const styles = StyleSheet.create({
     color: '#374151',
     lineHeight: 24,
   },
+  modalBodyLoading: {
+    marginTop: 12,
+  },
   modalButton: {
     margin: 16,
     padding: 16,